@@ -1,9 +1,10 @@
 """Gymbuddies Flask web application."""
 import os
 from flask import Flask
-from . import home, master, auth, matching, error
+from . import home, master, auth, matching, error, health, events
+from . import sendsms
 from . import database
-from .database import db
+from .database import db, initialize
 from . import extension
 import flask_wtf.csrf
 
@@ -21,9 +22,23 @@ def create_app():
     app.register_blueprint(auth.bp)
     app.register_blueprint(matching.bp)
     app.register_blueprint(error.bp)
+    app.register_blueprint(health.bp)
+    app.register_blueprint(events.bp)
 
     app.jinja_env.globals.update(database=database, db=db)
 
+    app.cli.add_command(initialize.init_db_cmd)
+    app.cli.add_command(initialize.migrate_schedules_cmd)
+    app.cli.add_command(initialize.rebuild_intervals_cmd)
+    app.cli.add_command(initialize.migrate_timestamps_cmd)
+    app.cli.add_command(initialize.migrate_blocks_cmd)
+    app.cli.add_command(initialize.migrate_interests_cmd)
+    app.cli.add_command(initialize.refresh_recommendations_cmd)
+    app.cli.add_command(sendsms.dispatch_sms_cmd)
+
+    if sendsms.SEND_SMS and sendsms.DISPATCH_IN_APP:
+        sendsms.start_dispatcher()
+
     if PROTECT_WITH_CSRF:
         flask_wtf.csrf.CSRFProtect(app)
 
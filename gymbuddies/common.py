@@ -1,11 +1,16 @@
 """Common methods for routing modules."""
+import functools
+import hashlib
 import json
-from typing import Dict, Any, List
+from typing import Callable, Dict, Any, List, ParamSpec
 
-from flask import request
+from flask import request, session
+from flask import Response, make_response
 from . import database
 from .database import db
 
+P = ParamSpec('P')
+
 
 class VerificationError(Exception):
     """Exception raised in API call if attempting to create a user with a netid already in the
@@ -207,10 +212,40 @@ def form_to_schedule() -> List[db.ScheduleStatus]:
     return schedule
 
 
-def needs_refresh(lastrefreshed: int, netid: str) -> bool:
-    """Returns True if information regarding a user with netid 'netid' has changed since the
-    timestamp 'lastrefreshed'. The timestamp 'lastrefreshed' should be provided in terms of the
-    number of milliseconds since January 1st, 1970 00:00:00 UTC, as is done by javascript's
-    Date.now() function. Otherwise, returns False."""
+def fragment_etag(netid: str) -> str:
+    """Returns a strong ETag for the GET request of the current fragment route by user 'netid'. The
+    tag changes whenever the user's lastupdated timestamp, the route, or its query arguments
+    change."""
+    args = sorted(request.args.items(multi=True))
+    key = json.dumps([netid, request.endpoint, database.user.get_version(netid).isoformat(), args])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def etag_decorator() -> Callable[[Callable[P, Any]], Callable[P, Response]]:
+    """Decorator factory for fragment routes whose output only depends on the logged in user's
+    data. GET responses are tagged with 'fragment_etag', and a request whose If-None-Match header
+    holds the current tag is answered with 304 without calling the route. Empty responses are not
+    tagged."""
+
+    def decorator(route: Callable[P, Any]) -> Callable[P, Response]:
+
+        @functools.wraps(route)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> Response:
+            netid: str = session.get("netid", "")
+            if request.method != "GET" or not netid:
+                return make_response(route(*args, **kwargs))
+
+            etag = fragment_etag(netid)
+            if etag in request.if_none_match:
+                response = make_response("", 304)
+            else:
+                response = make_response(route(*args, **kwargs))
+                if response.status_code != 200 or not response.get_data():
+                    return response
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+
+        return wrapper
 
-    return database.user.get_lastupdated(netid).timestamp() * 1000 <= lastrefreshed
+    return decorator
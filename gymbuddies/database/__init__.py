@@ -1,2 +1,3 @@
 """Database module"""
-from . import user, schedule, request, debug, matchmaker
+from . import user, schedule, request, debug, matchmaker, availability, pool, cache, broker, outbox
+from . import block, conflicts, inbox
@@ -0,0 +1,173 @@
+"""In-memory inverted index of user availability. Maps each hour of the week to a bitmap of the
+users (by ordinal) who are free for that entire hour, so that "who is free when I am" queries become
+bitmap ORs instead of table scans. Each process keeps its own index, which is kept current by
+user schedule updates and deletions, and reloaded from the users table in a background thread once
+it is older than INDEX_TTL."""
+
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from . import db
+
+INDEX_TTL: float = 300  # seconds before the index is reloaded from the database
+NUM_WEEK_HOURS: int = db.NUM_WEEK_BLOCKS // db.NUM_HOUR_BLOCKS
+
+
+def free_hours(schedule: List[int] | db.ScheduleBitmap) -> int:
+    """Returns a bitmap of the hours of the week for which every block of 'schedule' is exactly
+    ScheduleStatus.AVAILABLE."""
+    hours = 0
+    for timeblock in _set_bits(db.full_hours(db.as_bitmap(schedule).free())):
+        hours |= 1 << (timeblock // db.NUM_HOUR_BLOCKS)
+    return hours
+
+
+class AvailabilityIndex:
+    """Inverted index from each hour of the week to a bitmap of user ordinals. Ordinals are assigned
+    on first sight of a netid and are never reused within a load. Changes made while a reload is
+    in progress are replayed onto the reloaded contents, so that they are not lost if the reload
+    read the users table before they were committed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ordinals: Dict[str, int] = {}
+        self._netids: List[str] = []
+        self._users: List[int] = [0] * NUM_WEEK_HOURS  # hour -> bitmap of user ordinals
+        self._hours: Dict[str, int] = {}  # netid -> bitmap of free hours
+        self._loaded: Optional[float] = None
+        self._changes: Optional[Dict[str, int]] = None  # netid -> free hours, while reloading
+
+    def is_loaded(self) -> bool:
+        """Returns whether the index has been loaded."""
+        return self._loaded is not None
+
+    def is_stale(self) -> bool:
+        """Returns whether the index has never been loaded or is older than INDEX_TTL."""
+        return self._loaded is None or time.monotonic() - self._loaded > INDEX_TTL
+
+    def start_reload(self) -> bool:
+        """Marks a reload as in progress, so that changes are recorded until it is loaded. Returns
+        False if a reload is already in progress."""
+        with self._lock:
+            if self._changes is not None:
+                return False
+            self._changes = {}
+            return True
+
+    def cancel_reload(self) -> None:
+        """Marks the reload in progress as failed, so that another one may be started."""
+        with self._lock:
+            self._changes = None
+
+    def load(self, schedules: Iterable[Tuple[str, List[int] | db.ScheduleBitmap]]) -> None:
+        """Replaces the contents of the index with the (netid, schedule) pairs of 'schedules'. The
+        new contents are built before the lock is taken, so queries are only blocked by the swap."""
+        ordinals: Dict[str, int] = {}
+        users = [0] * NUM_WEEK_HOURS
+        hours: Dict[str, int] = {}
+        for netid, schedule in schedules:
+            ordinals[netid] = len(ordinals)
+            hours[netid] = free_hours(schedule)
+            for hour in _set_bits(hours[netid]):
+                users[hour] |= 1 << ordinals[netid]
+
+        with self._lock:
+            self._ordinals, self._netids = ordinals, list(ordinals)
+            self._users, self._hours = users, hours
+            for netid, new in (self._changes or {}).items():
+                self._set_hours(netid, new)
+            self._changes = None
+            self._loaded = time.monotonic()
+
+    def update(self, netid: str, schedule: List[int] | db.ScheduleBitmap) -> None:
+        """Updates the free hours of user 'netid' to those of 'schedule'. Does nothing if the index
+        has not been loaded, since the next load reads the schedule from the database."""
+        new = free_hours(schedule)
+        with self._lock:
+            self._record(netid, new)
+
+    def remove(self, netid: str) -> None:
+        """Removes user 'netid' from the index."""
+        with self._lock:
+            self._record(netid, 0)
+
+    def _record(self, netid: str, new: int) -> None:
+        """Sets the free hours of user 'netid' to 'new', and records the change if a reload is in
+        progress. Must be called with the lock held."""
+        if self._changes is not None:
+            self._changes[netid] = new
+        if self._loaded is not None:
+            self._set_hours(netid, new)
+
+    def _set_hours(self, netid: str, new: int) -> None:
+        """Sets the free hours of user 'netid' to 'new'. Must be called with the lock held."""
+        if netid not in self._ordinals:
+            if not new:
+                return
+            self._ordinals[netid] = len(self._netids)
+            self._netids.append(netid)
+        bit = 1 << self._ordinals[netid]
+
+        old = self._hours.get(netid, 0)
+        for hour in _set_bits(old & ~new):
+            self._users[hour] &= ~bit
+        for hour in _set_bits(new & ~old):
+            self._users[hour] |= bit
+        self._hours[netid] = new
+
+    def overlapping(self, hours: int) -> Set[str]:
+        """Returns the netids of users who are free for at least one of the hours in the bitmap
+        'hours'."""
+        with self._lock:
+            users = 0
+            for hour in _set_bits(hours):
+                users |= self._users[hour]
+            return {self._netids[ordinal] for ordinal in _set_bits(users)}
+
+
+def _set_bits(bits: int) -> Iterable[int]:
+    """Yields the indices of the set bits of 'bits', in increasing order."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+index = AvailabilityIndex()
+
+
+@db.session_decorator(commit=False)
+def get_overlapping_users(schedule: List[int] | db.ScheduleBitmap,
+                          *,
+                          session: Optional[Session] = None) -> Set[str]:
+    """Returns the netids of users who are free for at least one full hour in which 'schedule' is
+    free. Loads the index from the users table first if it has never been loaded. If it is stale,
+    starts a reload in the background and answers from the current contents."""
+    assert session is not None
+
+    if not index.is_loaded():
+        _load_index(session=session)
+    elif index.is_stale() and index.start_reload():
+        threading.Thread(target=_reload_index, name="availability-reload", daemon=True).start()
+
+    return index.overlapping(free_hours(schedule))
+
+
+@db.session_decorator(commit=False)
+def _load_index(*, session: Optional[Session] = None) -> None:
+    """Loads the index from the schedules in the users table."""
+    assert session is not None
+    index.load(session.query(db.User.netid, db.User.schedule).filter(db.User.schedule.is_not(None)))
+
+
+def _reload_index() -> None:
+    """Reloads the index in a session of its own. If the reload fails, the current contents are
+    kept, and the next query after INDEX_TTL starts another reload."""
+    try:
+        _load_index()
+    except Exception as ex:
+        index.cancel_reload()
+        traceback.print_exception(ex, file=sys.stderr)
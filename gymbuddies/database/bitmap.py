@@ -0,0 +1,253 @@
+"""Compact bitmap representation of weekly schedules. A week is divided into NUM_WEEK_BLOCKS time
+blocks of BLOCK_LENGTH minutes, each of which has a ScheduleStatus, and a ScheduleBitmap stores one
+bitmap per status flag, so that overlaps between schedules are computed with integer operations."""
+
+from enum import IntFlag
+from typing import Any, Iterable, List
+
+BLOCK_LENGTH = 5  # minutes
+NUM_HOUR_BLOCKS = 60 // BLOCK_LENGTH
+NUM_DAY_BLOCKS = 24 * NUM_HOUR_BLOCKS
+NUM_WEEK_BLOCKS = 7 * NUM_DAY_BLOCKS
+
+
+class ScheduleStatus(IntFlag):
+    """Time block status enumeration. Indicates user status in a particular time block.
+    ScheduleStatus has 4 flags:
+        0 - UNAVAILABLE: user indicated that they are not available at this time
+        1 - AVAILABLE:   user indicated available at this time
+        2 - PENDING:     user is awaiting a request at this time
+        4 - MATCHED:     user is already matched with someone at this time
+    """
+
+    UNAVAILABLE = 0
+    MATCHED = 1
+    PENDING = 2
+    AVAILABLE = 4
+
+    @classmethod
+    def from_str(cls, status: str) -> "ScheduleStatus":
+        """Returns a ScheduleStatus given a status string."""
+        return cls(_SCHEDULE_STATUS_FROM_STR_MAP[status])
+
+    def __repr__(self):  # Print self as an integer
+        return str(int(self))
+
+    def flags(self):
+        """Returns string version of self as an IntFlag"""
+        return super().__repr__()
+
+
+_SCHEDULE_STATUS_FROM_STR_MAP = {
+    "unavailable": ScheduleStatus.UNAVAILABLE,
+    "matched": ScheduleStatus.MATCHED,
+    "pending": ScheduleStatus.PENDING,
+    "available": ScheduleStatus.AVAILABLE,
+}
+
+
+SCHEDULE_FLAGS = (ScheduleStatus.MATCHED, ScheduleStatus.PENDING, ScheduleStatus.AVAILABLE)
+ALL_SCHEDULE_FLAGS = ScheduleStatus.MATCHED | ScheduleStatus.PENDING | ScheduleStatus.AVAILABLE
+WEEK_MASK = (1 << NUM_WEEK_BLOCKS) - 1  # bitmap with every TimeBlock of the week set
+PLANE_BYTES = (NUM_WEEK_BLOCKS + 7) // 8  # size of a single serialized bitmap plane
+SCHEDULE_BYTES = len(SCHEDULE_FLAGS) * PLANE_BYTES  # size of a serialized ScheduleBitmap
+HOUR_BLOCKS_MASK = (1 << NUM_HOUR_BLOCKS) - 1  # bitmap with every TimeBlock of the first hour set
+HOUR_START_MASK = sum(1 << t for t in range(0, NUM_WEEK_BLOCKS, NUM_HOUR_BLOCKS))  # first blocks
+
+
+def marked_to_bits(marked: List[int] | List[bool]) -> int:
+    """Converts a list of NUM_WEEK_BLOCKS truthy or falsy elements into a bitmap, where bit t of the
+    bitmap is set if marked[t] is truthy."""
+    assert len(marked) == NUM_WEEK_BLOCKS
+    return int("".join("1" if m else "0" for m in reversed(marked)), 2)
+
+
+def bits_to_timeblocks(bits: int) -> List[int]:
+    """Inverse of 'marked_to_bits'. Returns the indices of the set bits in 'bits', in increasing
+    order."""
+    timeblocks: List[int] = []
+    while bits:
+        low = bits & -bits
+        timeblocks.append(low.bit_length() - 1)
+        bits ^= low
+    return timeblocks
+
+
+class ScheduleBitmap:
+    """Compact representation of a schedule. Holds one NUM_WEEK_BLOCKS-bit integer bitmap (a
+    'plane') per ScheduleStatus flag, where bit t of a plane is set if the flag is set for TimeBlock
+    t. Set operations on planes are performed a machine word at a time, so that overlap checks and
+    counts do not need to walk every block of the week.
+
+    A ScheduleBitmap also behaves like the legacy List[int] schedule (indexing, iteration, len, and
+    equality with lists), so that it can be used wherever a schedule list is expected."""
+
+    __slots__ = ("_planes",)
+
+    def __init__(self, matched: int = 0, pending: int = 0, available: int = 0):
+        self._planes: List[int] = [matched & WEEK_MASK, pending & WEEK_MASK, available & WEEK_MASK]
+
+    @classmethod
+    def from_list(cls, schedule: List[int] | List[ScheduleStatus]) -> "ScheduleBitmap":
+        """Converts a legacy list of NUM_WEEK_BLOCKS statuses to a ScheduleBitmap."""
+        if isinstance(schedule, ScheduleBitmap):
+            return cls(*schedule._planes)
+        assert len(schedule) == NUM_WEEK_BLOCKS
+        return cls(*(marked_to_bits([s & flag for s in schedule]) for flag in SCHEDULE_FLAGS))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ScheduleBitmap":
+        """Inverse of 'to_bytes'."""
+        assert len(data) == SCHEDULE_BYTES
+        return cls(*(int.from_bytes(data[i:i + PLANE_BYTES], "little")
+                     for i in range(0, SCHEDULE_BYTES, PLANE_BYTES)))
+
+    def to_bytes(self) -> bytes:
+        """Serializes this schedule into SCHEDULE_BYTES bytes, as a concatenation of the MATCHED,
+        PENDING, and AVAILABLE planes in little endian order."""
+        return b"".join(p.to_bytes(PLANE_BYTES, "little") for p in self._planes)
+
+    def to_list(self) -> List[int]:
+        """Converts this schedule to a legacy list of NUM_WEEK_BLOCKS statuses."""
+        schedule = [int(ScheduleStatus.UNAVAILABLE)] * NUM_WEEK_BLOCKS
+        for flag, plane in zip(SCHEDULE_FLAGS, self._planes):
+            bits = bin(plane)[:1:-1]
+            for t in (t for t, b in enumerate(bits) if b == "1"):
+                schedule[t] |= flag
+        return schedule
+
+    def copy(self) -> "ScheduleBitmap":
+        """Returns a shallow copy of this schedule."""
+        return ScheduleBitmap(*self._planes)
+
+    def plane(self, status: ScheduleStatus | int = ALL_SCHEDULE_FLAGS) -> int:
+        """Returns a bitmap of the TimeBlocks for which any of the flags in 'status' is set. By
+        default, returns the TimeBlocks with a non-UNAVAILABLE status."""
+        bits = 0
+        for flag, plane in zip(SCHEDULE_FLAGS, self._planes):
+            if status & flag:
+                bits |= plane
+        return bits
+
+    def free(self) -> int:
+        """Returns a bitmap of the TimeBlocks whose status is exactly ScheduleStatus.AVAILABLE, i.e.
+        available and neither pending nor matched."""
+        matched, pending, available = self._planes
+        return available & ~(matched | pending)
+
+    def popcount(self, status: ScheduleStatus | int = ALL_SCHEDULE_FLAGS) -> int:
+        """Returns the number of TimeBlocks for which any of the flags in 'status' is set."""
+        return self.plane(status).bit_count()
+
+    def overlaps(self,
+                 other: "ScheduleBitmap",
+                 status: ScheduleStatus | int = ALL_SCHEDULE_FLAGS) -> bool:
+        """Returns True if there is a TimeBlock for which both this schedule and 'other' have any of
+        the flags in 'status' set."""
+        return bool(self.plane(status) & other.plane(status))
+
+    def add_status(self, bits: int, status: ScheduleStatus | int) -> None:
+        """Sets the flags in 'status' for every TimeBlock in the bitmap 'bits'."""
+        for i, flag in enumerate(SCHEDULE_FLAGS):
+            if status & flag:
+                self._planes[i] |= bits & WEEK_MASK
+
+    def remove_status(self, bits: int, status: ScheduleStatus | int) -> None:
+        """Clears the flags in 'status' for every TimeBlock in the bitmap 'bits'."""
+        for i, flag in enumerate(SCHEDULE_FLAGS):
+            if status & flag:
+                self._planes[i] &= ~bits
+
+    def __and__(self, other: "ScheduleBitmap") -> "ScheduleBitmap":
+        return ScheduleBitmap(*(a & b for a, b in zip(self._planes, other._planes)))
+
+    def __or__(self, other: "ScheduleBitmap") -> "ScheduleBitmap":
+        return ScheduleBitmap(*(a | b for a, b in zip(self._planes, other._planes)))
+
+    def __len__(self) -> int:
+        return NUM_WEEK_BLOCKS
+
+    def __getitem__(self, t: int) -> int:
+        if not -NUM_WEEK_BLOCKS <= t < NUM_WEEK_BLOCKS:
+            raise IndexError("schedule index out of range")
+        t %= NUM_WEEK_BLOCKS
+        return sum(flag for flag, plane in zip(SCHEDULE_FLAGS, self._planes) if plane >> t & 1)
+
+    def __setitem__(self, t: int, status: int) -> None:
+        if not -NUM_WEEK_BLOCKS <= t < NUM_WEEK_BLOCKS:
+            raise IndexError("schedule index out of range")
+        bit = 1 << (t % NUM_WEEK_BLOCKS)
+        for i, flag in enumerate(SCHEDULE_FLAGS):
+            self._planes[i] = self._planes[i] | bit if status & flag else self._planes[i] & ~bit
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, ScheduleBitmap):
+            return self._planes == other._planes
+        if isinstance(other, (list, tuple)) and len(other) == NUM_WEEK_BLOCKS:
+            return self._planes == ScheduleBitmap.from_list(other)._planes
+        return NotImplemented
+
+    def __reduce__(self):
+        return (ScheduleBitmap.from_bytes, (self.to_bytes(),))
+
+    def __repr__(self) -> str:
+        return f"ScheduleBitmap({', '.join(hex(p) for p in self._planes)})"
+
+
+def as_bitmap(schedule: List[int] | List[ScheduleStatus] | ScheduleBitmap) -> ScheduleBitmap:
+    """Returns 'schedule' as a ScheduleBitmap, converting it from a legacy schedule list if
+    necessary."""
+    if isinstance(schedule, ScheduleBitmap):
+        return schedule
+    return ScheduleBitmap.from_list(schedule)
+
+
+def full_hours(bits: int) -> int:
+    """Returns a bitmap with the first TimeBlock of each hour set if every TimeBlock of that hour is
+    set in 'bits'. Each AND-fold extends the runs of set bits that are checked, so that after the
+    last fold, bit t is set if bits t to t + NUM_HOUR_BLOCKS - 1 are all set."""
+    # the folds below assume that NUM_HOUR_BLOCKS is 12
+    bits &= bits >> 1  # runs of 2
+    bits &= bits >> 2  # runs of 4
+    bits &= bits >> 4  # runs of 8
+    bits &= bits >> 4  # runs of 12
+    return bits & HOUR_START_MASK
+
+
+def full_hour_blocks(bits: int) -> int:
+    """Returns a bitmap of the TimeBlocks of the hours whose TimeBlocks are all set in 'bits'."""
+    # hour starts are NUM_HOUR_BLOCKS apart, so the product has no carries
+    return full_hours(bits) * HOUR_BLOCKS_MASK
+
+
+def overlap_hours(schedule1: List[int] | ScheduleBitmap,
+                  schedule2: List[int] | ScheduleBitmap) -> int:
+    """Returns the number of hours for which both schedules are exactly ScheduleStatus.AVAILABLE
+    during every TimeBlock."""
+    return full_hours(as_bitmap(schedule1).free() & as_bitmap(schedule2).free()).bit_count()
+
+
+def overlap_hours_batch(schedule: List[int] | ScheduleBitmap,
+                        others: Iterable[List[int] | ScheduleBitmap]) -> List[int]:
+    """Returns overlap_hours(schedule, other) for each schedule in 'others'."""
+    free = full_hour_blocks(as_bitmap(schedule).free())
+    return [full_hours(free & as_bitmap(other).free()).bit_count() for other in others]
+
+
+def overlap_schedule(schedule1: List[int] | ScheduleBitmap,
+                     schedule2: List[int] | ScheduleBitmap) -> ScheduleBitmap:
+    """Returns a schedule which is AVAILABLE during the hours counted by overlap_hours, and
+    UNAVAILABLE otherwise."""
+    return ScheduleBitmap(
+        available=full_hour_blocks(as_bitmap(schedule1).free() & as_bitmap(schedule2).free()))
+
+
+def shared_schedule(schedule1: List[int] | ScheduleBitmap,
+                    schedule2: List[int] | ScheduleBitmap) -> ScheduleBitmap:
+    """Returns a schedule which is AVAILABLE during every TimeBlock in which both schedules are
+    exactly AVAILABLE, and UNAVAILABLE otherwise. Unlike overlap_schedule, partial hours are kept,
+    so it is suitable for displaying the times that two users have in common."""
+    return ScheduleBitmap(available=as_bitmap(schedule1).free() & as_bitmap(schedule2).free())
@@ -0,0 +1,127 @@
+"""Database API for blocks. A user who has blocked another, or been blocked by them, cannot make
+requests to them, and neither is recommended to the other."""
+
+from datetime import datetime, timezone
+from typing import Optional, Any, List
+from sqlalchemy import exists as sql_exists
+from sqlalchemy.orm import Session
+from . import db
+from . import user as usermod
+from . import request as requestmod
+
+
+class UserAlreadyBlocked(Exception):
+    """Exception raised in API call if attempting to block a user with a netid who is already
+    blocked."""
+
+    delnetid: str
+
+    def __init__(self, delnetid: str):
+        self.delnetid = delnetid
+        super().__init__(f"User with netid '{delnetid}' already blocked.")
+
+
+class UserNotBlocked(Exception):
+    """Exception raised in API call if attempting to create a user with a netid already in the
+    database."""
+
+    delnetid: str
+
+    def __init__(self, delnetid: str):
+        self.delnetid = delnetid
+        super().__init__(f"User with netid '{delnetid}' already blocked.")
+
+
+class UserBlockedIsSelf(Exception):
+    """Exception raise in API call if attempting to block oneself."""
+
+    netid: str
+
+    def __init__(self, netid: str):
+        self.netid = netid
+        super().__init__(f"User with netid '{netid}' cannot block themself.")
+
+
+@db.session_decorator(commit=False)
+def get_blocked(netid: str, *, session: Optional[Session] = None) -> List[str]:
+    """returns list of all users who have been blocked by this user, in the order that they were
+    blocked"""
+    assert session is not None
+    return [
+        blocked for blocked, in session.query(db.Block.blocked).filter(
+            db.Block.blocker == netid).order_by(db.Block.created, db.Block.blocked)
+    ]
+
+
+@db.session_decorator(commit=False)
+def get_blockers(netid: str, *, session: Optional[Session] = None) -> List[str]:
+    """returns list of all users who have blocked this user"""
+    assert session is not None
+    return [
+        blocker for blocker, in session.query(db.Block.blocker).filter(
+            db.Block.blocked == netid).order_by(db.Block.blocker)
+    ]
+
+
+@db.session_decorator(commit=False)
+def is_blocked(netid: str, delnetid: str, *, session: Optional[Session] = None) -> bool:
+    """returns whether this user has blocked the other user"""
+    assert session is not None
+    return session.get(db.Block, (netid, delnetid)) is not None
+
+
+@db.session_decorator(commit=False)
+def get_block(netid1: str,
+              netid2: str,
+              *,
+              session: Optional[Session] = None) -> Optional[db.MappedBlock]:
+    """returns a block between the two users in either direction, or None if neither user has
+    blocked the other"""
+    assert session is not None
+    return session.query(db.Block).filter(
+        ((db.Block.blocker == netid1) & (db.Block.blocked == netid2)) |
+        ((db.Block.blocker == netid2) & (db.Block.blocked == netid1))).first()
+
+
+def not_blocked_with(netid: str) -> Any:
+    """Returns an SQL criterion on db.User which is true for users who have neither blocked nor been
+    blocked by the user with netid 'netid'. Filtering a users query by it is an anti-join with the
+    blocks table."""
+    return ~sql_exists().where(((db.Block.blocker == netid) & (db.Block.blocked == db.User.netid)) |
+                               ((db.Block.blocker == db.User.netid) & (db.Block.blocked == netid)))
+
+
+@db.session_decorator(commit=True)
+def block_user(netid: str, delnetid: str, *, session: Optional[Session] = None) -> None:
+    """blocks this user. They can no longer appear on find a buddy and cannot send requests to you,
+    nor accept request"""
+    assert session is not None
+    usermod.get_user(netid, session=session)
+
+    if delnetid == netid:
+        raise UserBlockedIsSelf(netid)
+    if is_blocked(netid, delnetid, session=session):
+        raise UserAlreadyBlocked(delnetid)
+
+    usermod.get_user(delnetid, session=session)
+    requestmod.deactivate_pair(netid, delnetid, session=session)
+
+    session.add(db.Block(blocker=netid, blocked=delnetid, created=datetime.now(timezone.utc)))
+    usermod.update(netid, session=session)  # trigger update of lastupdated
+    usermod.update(delnetid, session=session)
+
+
+@db.session_decorator(commit=True)
+def unblock_user(netid: str, delnetid: str, *, session: Optional[Session] = None) -> None:
+    """unblocks this user. Now they should be able to appear on find a buddy, rend requests to you,
+    and accept requests"""
+    assert session is not None
+    usermod.get_user(netid, session=session)
+
+    block = session.get(db.Block, (netid, delnetid))
+    if block is None:
+        raise UserNotBlocked(delnetid)
+
+    session.delete(block)
+    usermod.update(netid, session=session)  # trigger update of lastupdated
+    usermod.update(delnetid, session=session)
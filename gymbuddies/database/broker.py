@@ -0,0 +1,86 @@
+"""In-process publish/subscribe broker for user change events. Committed updates to a user publish
+the user's netid, and each subscriber is woken with the netids it is interested in. Subscribers in
+other processes are not notified, so the broker is only sufficient for single-process deployments.
+"""
+
+import queue
+import threading
+from typing import Dict, Iterable, Optional, Set
+
+SUBSCRIBER_BACKLOG: int = 64  # maximum number of undelivered events held per subscriber
+
+
+class Subscription:
+    """A queue of change events for the users in 'netids', published by 'owner'. Events beyond
+    SUBSCRIBER_BACKLOG are dropped, since a subscriber that is that far behind only needs to know
+    that something changed."""
+
+    def __init__(self, owner: "Broker", netids: Set[str]):
+        self.owner = owner
+        self.netids = netids
+        self._events: queue.Queue[str] = queue.Queue(SUBSCRIBER_BACKLOG)
+
+    def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Returns the netid of the next changed user, or None if there is no change within
+        'timeout' seconds."""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def put(self, netid: str) -> None:
+        """Queues a change event for 'netid', dropping it if the backlog is full."""
+        try:
+            self._events.put_nowait(netid)
+        except queue.Full:
+            pass
+
+    def close(self) -> None:
+        """Stops receiving events."""
+        self.owner.unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+class Broker:
+    """Thread-safe registry of subscriptions, keyed by the netids they are interested in."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+
+    def subscribe(self, netids: Iterable[str]) -> Subscription:
+        """Returns a new subscription to the change events of the users in 'netids'."""
+        subscription = Subscription(self, set(netids))
+        with self._lock:
+            for netid in subscription.netids:
+                self._subscriptions.setdefault(netid, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Removes 'subscription' from the broker. Does nothing if it was already removed."""
+        with self._lock:
+            for netid in subscription.netids:
+                subscriptions = self._subscriptions.get(netid, set())
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    self._subscriptions.pop(netid, None)
+
+    def publish(self, netid: str) -> None:
+        """Notifies every subscription interested in 'netid' that the user has changed."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(netid, ()))
+        for subscription in subscriptions:
+            subscription.put(netid)
+
+    def subscribers(self) -> int:
+        """Returns the number of distinct subscriptions."""
+        with self._lock:
+            return len(set().union(*self._subscriptions.values()))
+
+
+broker = Broker()
@@ -0,0 +1,113 @@
+"""In-process caches for database rows. Each process keeps its own caches, so entries are bounded in
+both size and age, and may be validated against the database before use."""
+
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class Snapshot:
+    """An immutable copy of the attributes of a database row. Mutable containers are frozen, and
+    other mutable values (e.g. schedules) are copied on every access, so that a cached snapshot
+    cannot be modified by one caller and then seen by another."""
+
+    def __init__(self, **attributes: Any):
+        for name, value in attributes.items():
+            object.__setattr__(self, name, _freeze(value))
+
+    def __getattribute__(self, name: str) -> Any:
+        value = object.__getattribute__(self, name)
+        if isinstance(value, _CopyOnRead):
+            return value.value.copy()
+        return value
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError(f"cannot set '{name}' on an immutable snapshot")
+
+    def __delattr__(self, name: str):
+        raise AttributeError(f"cannot delete '{name}' from an immutable snapshot")
+
+    def __repr__(self) -> str:
+        return f"Snapshot({self.__dict__})"
+
+
+class _CopyOnRead:
+    """A private copy of a mutable attribute of a Snapshot, of which each access returns a copy."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __repr__(self) -> str:
+        return repr(self.value)
+
+
+def _freeze(value: Any) -> Any:
+    """Returns a read-only copy of 'value' if it is a mutable container, or a private copy to be
+    copied on every access if it is another copyable value."""
+    if isinstance(value, dict):
+        return MappingProxyType(dict(value))
+    if isinstance(value, list):
+        return tuple(value)
+    if hasattr(value, "copy"):  # e.g. schedules
+        return _CopyOnRead(value.copy())
+    return value
+
+
+class LRUCache(Generic[K, V]):
+    """Thread-safe least-recently-used cache holding at most 'maxsize' entries, each of which
+    expires 'ttl' seconds after it is stored. Every invalidation of a key bumps its generation, so
+    that a value loaded before the invalidation is not stored after it."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[K, Tuple[V, float]] = OrderedDict()
+        self._generations: Dict[K, int] = {}
+
+    def get(self, key: K) -> Optional[V]:
+        """Returns the value stored for 'key', or None if there is none or it has expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def generation(self, key: K) -> int:
+        """Returns the number of times 'key' has been invalidated. Should be read before loading a
+        value to store with 'put'."""
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def put(self, key: K, value: V, generation: int) -> None:
+        """Stores 'value' for 'key', unless 'key' has been invalidated since 'generation' was
+        read. Evicts the least recently used entry if the cache is full."""
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        """Removes the entry for 'key' and prevents values loaded before now from being stored."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self) -> None:
+        """Removes every entry."""
+        with self._lock:
+            self._entries.clear()
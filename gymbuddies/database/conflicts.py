@@ -0,0 +1,61 @@
+"""Database API for conflicts between requests. Two active requests conflict if they share a user
+and their schedules overlap, since finalizing one of them would match that user twice at the same
+time."""
+
+from typing import Optional, Dict, List, Tuple
+from sqlalchemy.orm import Session
+from . import db
+from . import user as usermod
+from . import request as requestmod
+
+
+@db.session_decorator(commit=False)
+def get_conflicts(requestid: int, *, session: Optional[Session] = None) -> List[Tuple[str, str]]:
+    """Returns requests with times conflicting with the request with the provided requestid."""
+    assert session is not None
+    conflicts = find_conflicts(session, requestmod.get_request(requestid, session=session))
+    return [(active.srcnetid, active.destnetid) for active in conflicts.requests]
+
+
+class Conflicts:
+    """Result of 'find_conflicts' for a request. 'requests' holds the active requests of either
+    user of the request whose schedules overlap it, and 'schedules' maps each user of the request to
+    the schedule they will have once the request is finalized and 'requests' are deactivated."""
+
+    def __init__(self, requests: List[db.MappedRequest], schedules: Dict[str, db.ScheduleBitmap]):
+        self.requests = requests
+        self.schedules = schedules
+
+    def matched(self, netid: str) -> int:
+        """Returns the MATCHED plane of the new schedule of user 'netid'."""
+        return self.schedules[netid].plane(db.ScheduleStatus.MATCHED)
+
+
+def find_conflicts(session: Session, request: db.MappedRequest) -> Conflicts:
+    """Finds the active requests which conflict with 'request', with a single query for the active
+    requests of both of its users and one AND of bitmap planes per active request. Also computes the
+    new schedule of each user of 'request': the MATCHED blocks of conflicting finalized requests are
+    cleared, and the blocks of 'request' are marked as MATCHED."""
+    netids = (request.srcnetid, request.destnetid)
+    requested = db.as_bitmap(request.schedule).plane()
+
+    actives = session.query(db.Request).filter(
+        db.Request.srcnetid.in_(netids) | db.Request.destnetid.in_(netids),
+        db.Request.requestid != request.requestid, db.REQUEST_IS_ACTIVE).order_by(
+            db.Request.requestid).all()
+    conflicts = [a for a in actives if db.as_bitmap(a.schedule).plane() & requested]
+
+    schedules: Dict[str, db.ScheduleBitmap] = {}
+    for netid in netids:
+        unmatched = 0
+        for active in conflicts:
+            if active.status == db.RequestStatus.FINALIZED and netid in (active.srcnetid,
+                                                                         active.destnetid):
+                unmatched |= db.as_bitmap(active.schedule).plane()
+
+        schedule = db.as_bitmap(usermod.get_schedule(netid, session=session)).copy()
+        schedule.remove_status(unmatched, db.ScheduleStatus.MATCHED)
+        schedule.add_status(requested, db.ScheduleStatus.MATCHED)
+        schedules[netid] = schedule
+
+    return Conflicts(conflicts, schedules)
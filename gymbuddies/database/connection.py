@@ -0,0 +1,173 @@
+"""Database engines and sessions. API calls are decorated with 'session_decorator', which gives
+them a session of their own, or the session of the current route's unit of work (see
+'scoped_session_decorator')."""
+
+import functools
+import os
+import random
+import sys
+import traceback
+import time
+
+from datetime import datetime, timezone
+from typing import Callable, ParamSpec, TypeVar, Dict, Any
+
+from flask import g, has_app_context
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from . import pool as poolmod
+
+P = ParamSpec('P')
+R = TypeVar('R')
+
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+if not DATABASE_URL:
+    raise ValueError("Database URL must be provided with the 'DATABASE_URL' environment variable.")
+
+TIMEOUT = 0.01  # seconds
+RETRY_NUM = 10
+SCOPED_SESSION_KEY = "dbsession"  # attribute of flask.g holding a route's session
+# dialects supporting INSERT ... ON CONFLICT, mapped to their insert constructs
+_UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+engine = create_engine(DATABASE_URL,
+                       execution_options={"isolation_level": "SERIALIZABLE"},
+                       **poolmod.engine_options(DATABASE_URL))
+# engine for API calls that do not commit. Reads only need to see committed data, so they skip the
+# predicate locking and serialization failures of SERIALIZABLE. SQLite has no READ COMMITTED level.
+read_engine = engine if engine.dialect.name == "sqlite" else engine.execution_options(
+    isolation_level="READ COMMITTED")
+
+
+def session_decorator(*, commit: bool) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Decorator factory for initializing a connection with the DATABASE_URL and returning a
+    session. To use this decoration, a function must have a signature of the form
+       func(..., *, session: Session=None, x, y, ..., **kwargs) -> R,
+    where T is any type. The 'session' argument must be keyword only, and should be handled by this
+    session_decorator. At the beginning of a decorated function, it should assert that 'session' is
+    not None. The wrapper will return the result of the function if successful; otherwise, it will
+    return None. The wrapper will call 'session.commit' after the function finishes, unless 'commit'
+    is False or a 'session' is already provided.
+
+    NOTE: if a function might not require 'session.commit', it is permissible to set 'commit' to
+    False, and then call 'session.commit' manually where required. Beware, however, that this may
+    result in multiple 'session.commit' calls, if, for instance, this function is called by another
+    function decorated by '@session_decorator(commit=True)'. This prevents a single API call from
+    behaving like a single transaction, breaking the serializability guarantees of this API. Because
+    of this, it is recommended that any such function use 'commit=True' instead of manually calling
+    'session.commit'.
+
+    NOTE: sessions opened for functions with 'commit' set to False use 'read_engine', whose
+    transactions are READ COMMITTED rather than SERIALIZABLE. Such functions must only read."""
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            if "session" in kwargs:  # A session can be provided manually
+                return func(*args, **kwargs)
+            if has_app_context() and SCOPED_SESSION_KEY in g:  # use the route's session
+                kwargs["session"] = g.get(SCOPED_SESSION_KEY)
+                return func(*args, **kwargs)
+
+            for retry in range(RETRY_NUM + 1):
+                try:
+                    with Session(engine if commit else read_engine,
+                                 expire_on_commit=False) as session:
+                        session.info["postactions"] = []
+                        session.info["postcommits"] = []
+                        kwargs["session"] = session
+                        result = func(*args, **kwargs)
+
+                        if commit:
+                            _commit(session)
+                        return result
+
+                except OperationalError as ex:
+                    if retry == RETRY_NUM:
+                        raise ex
+                    time.sleep(TIMEOUT * (1 + random.random()) * 2**retry)
+                    traceback.print_exception(ex, file=sys.stderr)
+                    print(f"session_decorator: retrying {func.__name__}{args}{kwargs} for the "
+                          f"{retry+1}th time.")
+
+            raise RuntimeError("No result.")
+
+        return wrapper
+
+    return decorator
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Returns the state and checkout metrics of the connection pool shared by 'engine' and
+    'read_engine'."""
+    return poolmod.get_stats(engine.pool)
+
+
+def upsert_insert(session: Session) -> Callable[..., Any] | None:
+    """Returns the insert construct of the dialect of 'session' if it supports
+    INSERT ... ON CONFLICT, or None otherwise."""
+    return _UPSERT_DIALECTS.get(session.get_bind().dialect.name)
+
+
+def is_scoped(session: Session) -> bool:
+    """Returns whether 'session' is the session of the current route's unit of work (see
+    scoped_session_decorator), which may hold changes that are not committed yet."""
+    return has_app_context() and g.get(SCOPED_SESSION_KEY) is session
+
+
+def _commit(session: Session) -> None:
+    """Performs the postactions of 'session', then commits it. Once the commit succeeds, performs
+    the postcommits of 'session', which should only affect state outside of the database (e.g.
+    in-process caches)."""
+    print("performing postactions: ", session.info["postactions"])
+    for post_action in session.info["postactions"]:
+        post_action()
+    session.commit()
+    print("commit completed at", datetime.now(timezone.utc))
+    for post_commit in session.info["postcommits"]:
+        post_commit()
+
+
+def scoped_session_decorator() -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Decorator factory for running a Flask route as a single unit of work. The route is given a
+    session bound to 'flask.g', which every function decorated by 'session_decorator' uses instead
+    of opening its own. The session is committed once after the route returns, and the whole route
+    is retried if the database raises an OperationalError. Since the route may run more than once,
+    it should not have side effects outside of the database before its last database call."""
+
+    def decorator(route: Callable[P, R]) -> Callable[P, R]:
+
+        @functools.wraps(route)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            if SCOPED_SESSION_KEY in g:  # already inside a unit of work
+                return route(*args, **kwargs)
+
+            for retry in range(RETRY_NUM + 1):
+                try:
+                    with Session(engine, expire_on_commit=False) as session:
+                        session.info["postactions"] = []
+                        session.info["postcommits"] = []
+                        setattr(g, SCOPED_SESSION_KEY, session)
+                        try:
+                            result = route(*args, **kwargs)
+                            _commit(session)
+                        finally:
+                            g.pop(SCOPED_SESSION_KEY, None)
+                        return result
+
+                except OperationalError as ex:
+                    if retry == RETRY_NUM:
+                        raise ex
+                    time.sleep(TIMEOUT * (1 + random.random()) * 2**retry)
+                    traceback.print_exception(ex, file=sys.stderr)
+                    print(f"scoped_session_decorator: retrying {route.__name__} for the "
+                          f"{retry+1}th time.")
+
+            raise RuntimeError("No result.")
+
+        return wrapper
+
+    return decorator
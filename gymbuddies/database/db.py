@@ -1,97 +1,33 @@
 """Database schema and data class enumerations."""
 
-import functools
-import os
-import random
-import sys
-import traceback
-import time
-
-from datetime import datetime, timezone
-from enum import Enum, IntFlag
-from typing import Tuple, Callable, ParamSpec, TypeVar, Dict, List, Any
-
-from sqlalchemy import Column, String, Integer, Boolean, PickleType
-from sqlalchemy import create_engine
-from sqlalchemy.exc import OperationalError
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.ext.mutable import MutableList, MutableDict
-from sqlalchemy.orm import Session
-
-P = ParamSpec('P')
-R = TypeVar('R')
+from datetime import datetime
+from enum import Enum
+from typing import Dict, List, Any
 
-DATABASE_URL = os.getenv("DATABASE_URL", "")
-if not DATABASE_URL:
-    raise ValueError("Database URL must be provided with the 'DATABASE_URL' environment variable.")
+from sqlalchemy import Column, String, Integer, Float, Boolean, PickleType, Index
+from sqlalchemy import BigInteger, JSON, false, literal_column
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.mutable import MutableDict
+# the engines and sessions, schedule bitmaps and time blocks, column types and interests registry
+# are re-exported, so that every part of the database layer can be referred to through this module
+# pylint: disable=unused-import
+from .connection import DATABASE_URL, SCOPED_SESSION_KEY, engine, read_engine, session_decorator
+from .connection import scoped_session_decorator, get_pool_stats, upsert_insert, is_scoped
+from .bitmap import BLOCK_LENGTH, NUM_HOUR_BLOCKS, NUM_DAY_BLOCKS, NUM_WEEK_BLOCKS, ScheduleStatus
+from .bitmap import SCHEDULE_FLAGS, ALL_SCHEDULE_FLAGS, WEEK_MASK, PLANE_BYTES, SCHEDULE_BYTES
+from .bitmap import HOUR_BLOCKS_MASK, HOUR_START_MASK, ScheduleBitmap, as_bitmap
+from .bitmap import marked_to_bits, bits_to_timeblocks, full_hours, full_hour_blocks
+from .bitmap import overlap_hours, overlap_hours_batch, overlap_schedule, shared_schedule
+from .types import MutableScheduleBitmap, ScheduleType, TimestampType
+from .interests import INTERESTS, INTEREST_BITS, ALL_INTERESTS_MASK, get_interests_dict
+from .interests import interests_to_bits, bits_to_interests, interest_similarity
+from .interests import interests_to_readable
+from .timeblock import DAY_NAMES, TimeBlock, schedule_to_events, schedule_to_matchevents
+from .timeblock import schedule_to_modifyevents, schedule_to_readable
+# pylint: enable=unused-import
 
 BASE = declarative_base()
 
-TIMEOUT = 0.01  # seconds
-RETRY_NUM = 10
-
-BLOCK_LENGTH = 5  # minutes
-NUM_HOUR_BLOCKS = 60 // BLOCK_LENGTH
-NUM_DAY_BLOCKS = 24 * NUM_HOUR_BLOCKS
-NUM_WEEK_BLOCKS = 7 * NUM_DAY_BLOCKS
-DAY_NAMES = ("Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday")
-
-engine = create_engine(DATABASE_URL, execution_options={"isolation_level": "SERIALIZABLE"})
-
-
-def session_decorator(*, commit: bool) -> Callable[[Callable[P, R]], Callable[P, R]]:
-    """Decorator factory for initializing a connection with the DATABASE_URL and returning a
-    session. To use this decoration, a function must have a signature of the form
-       func(..., *, session: Session=None, x, y, ..., **kwargs) -> R,
-    where T is any type. The 'session' argument must be keyword only, and should be handled by this
-    session_decorator. At the beginning of a decorated function, it should assert that 'session' is
-    not None. The wrapper will return the result of the function if successful; otherwise, it will
-    return None. The wrapper will call 'session.commit' after the function finishes, unless 'commit'
-    is False or a 'session' is already provided.
-
-    NOTE: if a function might not require 'session.commit', it is permissible to set 'commit' to
-    False, and then call 'session.commit' manually where required. Beware, however, that this may
-    result in multiple 'session.commit' calls, if, for instance, this function is called by another
-    function decorated by '@session_decorator(commit=True)'. This prevents a single API call from
-    behaving like a single transaction, breaking the serializability guarantees of this API. Because
-    of this, it is recommended that any such function use 'commit=True' instead of manually calling
-    'session.commit'."""
-
-    def decorator(func: Callable[P, R]) -> Callable[P, R]:
-
-        @functools.wraps(func)
-        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
-            if "session" in kwargs:  # A session can be provided manually
-                return func(*args, **kwargs)
-
-            for retry in range(RETRY_NUM + 1):
-                try:
-                    with Session(engine, expire_on_commit=False) as session:
-                        session.info["postactions"] = []
-                        kwargs["session"] = session
-                        result = func(*args, **kwargs)
-
-                        if commit:
-                            print("performing postactions: ", session.info["postactions"])
-                            for post_action in session.info["postactions"]:
-                                post_action()
-                            session.commit()
-                            print("commit completed at", datetime.now(timezone.utc))
-                        return result
-
-                except OperationalError as ex:
-                    if retry == RETRY_NUM:
-                        raise ex
-                    time.sleep(TIMEOUT * (1 + random.random()) * 2**retry)
-                    traceback.print_exception(ex, file=sys.stderr)
-                    print(f"session_decorator: retrying {func.__name__}{args}{kwargs} for the {retry+1}th time.")
-
-            raise RuntimeError("No result.")
-
-        return wrapper
-
-    return decorator
-
 
 class RequestStatus(int, Enum):
     """Request status enumeration. Includes pending, rejected, and finalized requests. Requests that
@@ -125,39 +61,18 @@ _REQUESTSTATUS_TO_READABLE_MAP = {
 }
 
 
-class ScheduleStatus(IntFlag):
-    """Time block status enumeration. Indicates user status in a particular time block.
-    ScheduleStatus has 4 flags:
-        0 - UNAVAILABLE: user indicated that they are not available at this time
-        1 - AVAILABLE:   user indicated available at this time
-        2 - PENDING:     user is awaiting a request at this time
-        4 - MATCHED:     user is already matched with someone at this time
+class OutboxStatus(int, Enum):
+    """SMS outbox message status enumeration. OutboxStatus can have 4 states:
+        0 - PENDING: message is waiting to be sent, possibly after a failed attempt
+        1 - SENDING: message has been claimed by a dispatcher
+        2 - SENT:    message was accepted by the SMS provider
+        3 - FAILED:  message could not be sent after the maximum number of attempts
     """
 
-    UNAVAILABLE = 0
-    MATCHED = 1
-    PENDING = 2
-    AVAILABLE = 4
-
-    @classmethod
-    def from_str(cls, status: str) -> "ScheduleStatus":
-        """Returns a ScheduleStatus given a status string."""
-        return cls(_SCHEDULE_STATUS_FROM_STR_MAP[status])
-
-    def __repr__(self):  # Print self as an integer
-        return str(int(self))
-
-    def flags(self):
-        """Returns string version of self as an IntFlag"""
-        return super().__repr__()
-
-
-_SCHEDULE_STATUS_FROM_STR_MAP = {
-    "unavailable": ScheduleStatus.UNAVAILABLE,
-    "matched": ScheduleStatus.MATCHED,
-    "pending": ScheduleStatus.PENDING,
-    "available": ScheduleStatus.AVAILABLE,
-}
+    PENDING = 0
+    SENDING = 1
+    SENT = 2
+    FAILED = 3
 
 
 class Gender(int, Enum):
@@ -209,44 +124,6 @@ _LEVEL_PREFERENCE_TO_READABLE_MAP = {
 }
 
 
-class TimeBlock(int):
-    """Integer derivative representing a particular time block in a schedule. Provides conversion
-    functions to human readable times and vice versa."""
-
-    def __new__(cls, index: int):
-        return super().__new__(cls, index)
-
-    @classmethod
-    def from_daytime(cls, day: int, time: int) -> "TimeBlock":
-        """Converts a (day, time) tuple to a TimeBlock. 'day' is an integer from 0-6, corresponding
-        to Sunday, ..., Saturday. 'time' is an integer from 0-NUM_DAY_BLOCKS, corresponding to
-        00:00-00:05, ..., 23:55-24:00."""
-        return cls(day * NUM_DAY_BLOCKS + time)
-
-    def to_readable(self, time_only: bool = False) -> str:
-        """Converts a TimeBlock to the human readable format 'Day, HH:MM XM'. If 'end' is True,
-        then returns the end time; otherwise, returns the start time of this block."""
-
-        day, time = self.day_time()
-        d = datetime.strptime(
-            f"{time // NUM_HOUR_BLOCKS}:{BLOCK_LENGTH * (time % NUM_HOUR_BLOCKS)}", "%H:%M")
-
-        return ("" if time_only else f"{DAY_NAMES[day]} ") + d.strftime('%-I:%M%p')
-
-    def time_str(self) -> str:
-        """Converts the time of day for a TimeBlock to a datetime."""
-        _, time = self.day_time()
-        return datetime.strptime(
-            f"{time // NUM_HOUR_BLOCKS}:{BLOCK_LENGTH * (time % NUM_HOUR_BLOCKS)}",
-            "%H:%M").strftime("%H:%M")
-
-    def day_time(self) -> Tuple[int, int]:
-        """Converts a TimeBlock to a (day, time) tuple. 'day' is an integer from 0-6, corresponding
-        to Sunday, ..., Saturday. 'time' is an integer from 0-NUM_DAY_BLOCKS, corresponding to
-        00:00-00:05, ..., 23:55-24:00."""
-        return divmod(self, NUM_DAY_BLOCKS)
-
-
 class Level(int, Enum):
     """Integer derivative representing a level. Provides conversion function to human readable
     forms. Integers map to the following levels.
@@ -270,113 +147,12 @@ _LEVEL_TO_READABLE_MAP = {
     Level.ADVANCED: "Advanced",
 }
 
-
-# note: use this function to get interests dict when adding user to db for first time
-def get_interests_dict(cardio=False,
-                       upper=False,
-                       lower=False,
-                       losing=False,
-                       gaining=False) -> Dict[str, bool]:
-    """Returns an interests hash table. Set interested parameters as True"""
-    interests = {}
-    interests["Cardiovascular Fitness"] = cardio
-    interests["Upper Body"] = upper
-    interests["Lower Body"] = lower
-    interests["Losing Weight"] = losing
-    interests["Gaining Mass"] = gaining
-    return interests
-
-
 # TODO: implement this function the same as above
 def get_settings_dict():
     """Returns a settings hash table."""
     return None
 
 
-def interests_to_readable(interests: Dict[str, bool]):
-    """Converts an interests dictionary to a readable format."""
-    return ", ".join(k for k, v in interests.items() if v)
-
-
-def schedule_to_events(schedule: List[int] | List[ScheduleStatus]) -> List[List[TimeBlock]]:
-    """Converts a schedule into a string representation as a comma separated list of events. Events
-    are in the format (start, end), where start and end are timeblocks, and start is inclusive while
-    end is exclusive."""
-    assert len(schedule) == NUM_WEEK_BLOCKS
-
-    blocks: List[List[TimeBlock]] = [[]]
-    for t, status in enumerate(schedule):
-        if (not (status & ScheduleStatus.AVAILABLE) or t % NUM_DAY_BLOCKS == 0) and blocks[-1]:
-            blocks[-1].append(TimeBlock(t))
-            blocks.append([])
-        if status & ScheduleStatus.AVAILABLE and not blocks[-1]:
-            blocks[-1].append(TimeBlock(t))
-
-    if blocks[-1]:
-        blocks[-1].append(TimeBlock(len(schedule)))
-    else:
-        blocks.pop()
-
-    return blocks
-
-
-def schedule_to_matchevents(schedule: List[int],
-                            match_names: List[str]) -> List[List[Tuple[TimeBlock, str]]]:
-    """Converts a schedule into a string representation as a comma separated list of events. Events
-    are in the format (start, end), where start and end are timeblocks, and start is inclusive while
-    end is exclusive."""
-    assert len(schedule) == NUM_WEEK_BLOCKS
-
-    blocks: List[List[Tuple[TimeBlock, str]]] = [[]]
-    for t, status in enumerate(schedule):
-        # print(matchNames[t])
-        if blocks[-1] and (status != ScheduleStatus.AVAILABLE or t % NUM_DAY_BLOCKS == 0 or
-                           match_names[t]):
-            blocks[-1].append((TimeBlock(t), blocks[-1][0][1]))
-            blocks.append([])
-        if status == ScheduleStatus.AVAILABLE and not blocks[-1]:
-            blocks[-1].append((TimeBlock(t), match_names[t]))
-
-    if blocks[-1]:
-        blocks[-1].append((TimeBlock(len(schedule)), match_names[-1]))
-    else:
-        blocks.pop()
-
-    return blocks
-
-
-def schedule_to_modifyevents(schedule: List[int],
-                             requests: List[int]) -> List[List[Tuple[TimeBlock, int]]]:
-    """Converts a schedule into a string representation as a comma separated list of events. Events
-    are in the format (start, end), where start and end are timeblocks, and start is inclusive while
-    end is exclusive."""
-    assert len(schedule) == NUM_WEEK_BLOCKS
-
-    blocks: List[List[Tuple[TimeBlock, int]]] = [[]]
-    for t, status in enumerate(schedule):
-        if blocks[-1] and (status != ScheduleStatus.AVAILABLE or t % NUM_DAY_BLOCKS == 0 or
-                           blocks[-1][0][1] != requests[t]):
-            blocks[-1].append((TimeBlock(t), blocks[-1][0][1]))
-            blocks.append([])
-        if status == ScheduleStatus.AVAILABLE and not blocks[-1]:
-            blocks[-1].append((TimeBlock(t), requests[t]))
-
-    if blocks[-1]:
-        blocks[-1].append((TimeBlock(len(schedule)), requests[-1]))
-    else:
-        blocks.pop()
-
-    return blocks
-
-
-def schedule_to_readable(schedule: List[ScheduleStatus] | List[int]) -> List[str]:
-    """Converts schedule into a list of readable strings."""
-    return [
-        f"{s.to_readable()}-{e.to_readable(time_only=True)}"
-        for s, e in schedule_to_events(schedule)
-    ]
-
-
 # TODO limit the size of columns in the database
 class User(BASE):
     """Users database. Maps each netid to their Gymbuddies profile information."""
@@ -390,7 +166,9 @@ class User(BASE):
     bio = Column(String)  # short bio for user
     addinfo = Column(String)  # additional info in user profile
     interests = Column(PickleType)  # Dictionary indicating interests
-    schedule = Column(MutableList.as_mutable(PickleType))  # int[2016] with status for each block
+    # bitmask of 'interests' (see INTERESTS)
+    interestbits = Column(BigInteger, nullable=False, default=0)
+    schedule = Column(MutableScheduleBitmap.as_mutable(ScheduleType))  # status for each block
     open = Column(Boolean)  # open for matching
 
     gender = Column(Integer)  # gender of user
@@ -399,10 +177,7 @@ class User(BASE):
     okbinary = Column(Boolean)  # is user ok being matched with nonbinary users
 
     settings = Column(MutableDict.as_mutable(PickleType))  # Notification and account settings
-    lastupdated = Column(PickleType)  # timestamp for last related database update
-
-    blocked = Column(
-        MutableList.as_mutable(PickleType))  # list of users who are blocked for this user
+    lastupdated = Column(TimestampType)  # timestamp for last related database update
 
 
 class MappedUser(User):
@@ -416,8 +191,9 @@ class MappedUser(User):
     bio: str
     addinfo: str
     interests: Dict[str, Any]
+    interestbits: int
 
-    schedule: List[int]
+    schedule: ScheduleBitmap
     open: bool
 
     gender: int
@@ -428,26 +204,59 @@ class MappedUser(User):
     settings: Dict[str, Any]
     lastupdated: datetime
 
-    blocked: List[str]
-
 
 class Request(BASE):
     """Requests table. Includes requests that are pending, rejected, or finalized (i.e. completed
     matches)."""
     __tablename__ = "requests"
+    __table_args__ = (
+        Index("ix_requests_src_status_make", "srcnetid", "status", "maketimestamp"),
+        Index("ix_requests_dest_status_make", "destnetid", "status", "maketimestamp"),
+        Index("ix_requests_src_status_delete", "srcnetid", "status", "deletetimestamp"),
+        Index("ix_requests_dest_status_delete", "destnetid", "status", "deletetimestamp"),
+    )
 
     requestid = Column(Integer, primary_key=True)  # unique auto-incrementing request transaction id
     srcnetid = Column(String)  # user who makes the request
     destnetid = Column(String)  # user who receives the request
-    maketimestamp = Column(PickleType)  # timestamp when the request was made
-    finalizedtimestamp = Column(PickleType)  # timestamp when the request was finalized
-    deletetimestamp = Column(PickleType)  # timestamp when the request was deleted
+    maketimestamp = Column(TimestampType)  # timestamp when the request was made
+    finalizedtimestamp = Column(TimestampType)  # timestamp when the request was finalized
+    deletetimestamp = Column(TimestampType)  # timestamp when the request was deleted
     status = Column(Integer)  # status of the request
-    schedule = Column(PickleType)  # 2016-character schedule sequence (same format as user.schedule)
+    schedule = Column(ScheduleType)  # 2016-block schedule (same format as user.schedule)
     prevrequestid = Column(Integer)  # Id of previous request; 0 if no such request
     read = Column(Boolean)  # False if not read by the user yet; True otherwise
 
 
+# filters for active (pending or finalized) and unread requests. The statuses are rendered as
+# literals rather than parameters, so that the planner can match them to the partial indexes below.
+REQUEST_IS_ACTIVE = Request.status.in_(
+    [literal_column(str(int(s))) for s in (RequestStatus.PENDING, RequestStatus.FINALIZED)])
+REQUEST_IS_UNREAD = (Request.read == false()) | Request.read.is_(None)
+
+# partial indexes on the active and unread requests of each user, which stay small no matter how
+# many historical requests the table holds
+Index("ix_requests_active_src",
+      Request.srcnetid,
+      Request.destnetid,
+      postgresql_where=REQUEST_IS_ACTIVE,
+      sqlite_where=REQUEST_IS_ACTIVE)
+Index("ix_requests_active_dest",
+      Request.destnetid,
+      Request.srcnetid,
+      postgresql_where=REQUEST_IS_ACTIVE,
+      sqlite_where=REQUEST_IS_ACTIVE)
+Index("ix_requests_unread_src",
+      Request.srcnetid,
+      Request.status,
+      postgresql_where=REQUEST_IS_UNREAD,
+      sqlite_where=REQUEST_IS_UNREAD)
+Index("ix_requests_unread_dest",
+      Request.destnetid,
+      Request.status,
+      postgresql_where=REQUEST_IS_UNREAD,
+      sqlite_where=REQUEST_IS_UNREAD)
+
 
 class MappedRequest(BASE):
     """An extension of the Request class which casts each column to its respective Python type.
@@ -461,33 +270,97 @@ class MappedRequest(BASE):
     finalizedtimestamp: datetime
     deletetimestamp: datetime
     status: int
-    schedule: List[int]
+    schedule: ScheduleBitmap
     read: bool
 
 
-class Schedule(BASE):
-    """Schedule table. Maps each 5-minute time block throughout the week to users and statuses."""
-    __tablename__ = "schedule"
+class ScheduleInterval(BASE):
+    """Schedule intervals table. Stores each user's schedule as runs of consecutive time blocks with
+    a particular status flag set, as given by schedule_to_events. A user with a handful of weekly
+    windows has a handful of rows per flag."""
+    __tablename__ = "scheduleintervals"
+    __table_args__ = (Index("ix_scheduleintervals_status_range", "status", "startblock",
+                            "endblock"),)
+
+    netid = Column(String, primary_key=True)  # netid for this interval
+    status = Column(Integer, primary_key=True)  # the ScheduleStatus flag set during this interval
+    startblock = Column(Integer, primary_key=True)  # first time block of the interval (inclusive)
+    endblock = Column(Integer)  # last time block of the interval (exclusive)
+
 
-    timeblock = Column(Integer, primary_key=True)  # a particular time block during the week
-    netid = Column(String, primary_key=True)  # netid for a particular time block
-    matched = Column(Boolean)  # user has been matched at this time
-    pending = Column(Boolean)  # user is awaiting a pending request for this time
-    available = Column(Boolean)  # user is available at this time
+class Recommendation(BASE):
+    """Recommendations table. Stores the top matches found by the matchmaker for each user, along
+    with the user's lastupdated timestamp at the time that they were computed, and the time at which
+    they were computed."""
+    __tablename__ = "recommendations"
 
-    def get_status(self) -> ScheduleStatus:
-        """Returns this entry as a ScheduleStatus."""
-        return ScheduleStatus(self.matched | self.pending | self.available)
+    netid = Column(String, primary_key=True)  # user for whom the matches were computed
+    matches = Column(JSON)  # list of netids, best match first
+    computed = Column(TimestampType)  # user's lastupdated timestamp when the matches were computed
+    refreshed = Column(TimestampType)  # time at which the matches were computed
 
 
-class MappedSchedule(BASE):
-    """An extension of the Schedule class which casts each column to its respective Python type.
+class MappedRecommendation(Recommendation):
+    """An extension of the Recommendation class which casts each column to its respective Python
+    type. Enables LSP and static type checkers to infer the correct type of a row."""
+    netid: str
+    matches: List[str]
+    computed: datetime
+    refreshed: datetime
+
+
+class SmsOutbox(BASE):
+    """SMS outbox table. Messages are added in the same transaction as the change that they notify
+    about, and are sent later by a dispatcher (see sendsms.py)."""
+    __tablename__ = "sms_outbox"
+    __table_args__ = (Index("ix_sms_outbox_status_nextattempt", "status", "nextattempt"),)
+
+    messageid = Column(Integer, primary_key=True)  # unique auto-incrementing message id
+    dedupekey = Column(String, unique=True)  # identifies the event, so it is notified at most once
+    netid = Column(String)  # user to whom the message is sent
+    number = Column(String)  # phone number in E.164 format, e.g. '+16095551234'
+    body = Column(String)  # text of the message
+    status = Column(Integer)  # status of the message; see OutboxStatus
+    attempts = Column(Integer)  # number of failed attempts to send the message
+    nextattempt = Column(Float)  # seconds since the epoch after which the message may be claimed
+    error = Column(String)  # error of the last failed attempt, if any
+    created = Column(TimestampType)  # timestamp when the message was added
+
+
+class MappedSmsOutbox(BASE):
+    """An extension of the SmsOutbox class which casts each column to its respective Python type.
     Enables LSP and static type checkers to infer the correct type of a row."""
-    __tablename__ = "schedule"
+    __tablename__ = "sms_outbox"
 
-    timeblock: int
+    messageid: int
+    dedupekey: str
     netid: str
+    number: str
+    body: str
     status: int
-    matched: bool
-    pending: bool
-    available: bool
+    attempts: int
+    nextattempt: float
+    error: str
+    created: datetime
+
+
+class Block(BASE):
+    """Blocks table. Each row records that one user has blocked another. Indexed in both directions,
+    so that both the users blocked by a user and the users who have blocked a user can be found
+    without a scan."""
+    __tablename__ = "blocks"
+    __table_args__ = (Index("ix_blocks_blocked", "blocked", "blocker"),)
+
+    blocker = Column(String, primary_key=True)  # user who blocked 'blocked'
+    blocked = Column(String, primary_key=True)  # user who was blocked by 'blocker'
+    created = Column(TimestampType)  # timestamp when the block was made
+
+
+class MappedBlock(BASE):
+    """An extension of the Block class which casts each column to its respective Python type.
+    Enables LSP and static type checkers to infer the correct type of a row."""
+    __tablename__ = "blocks"
+
+    blocker: str
+    blocked: str
+    created: datetime
@@ -0,0 +1,147 @@
+"""Database API for the requests and matches of a user, as listed on their pages. Listing the
+incoming requests or the matches of a user marks them as read."""
+
+from typing import List, Optional, Dict, Tuple, Any
+from sqlalchemy.orm import Session
+from . import db
+from . import user as usermod
+
+LIMIT = 5
+
+
+@db.session_decorator(commit=False)
+def get_inactive_outgoing(srcnetid: str, *, session: Optional[Session] = None) -> List[Any]:
+    """Returns a list of the active outgoing requests for a user with netid 'destnetid',
+    sorted in order with respect to the request's make timestamp, newest first. If 'destnetid' does
+    not exist in the database, returns an empty list."""
+    assert session is not None
+    return session.query(db.Request).filter(db.Request.srcnetid == srcnetid,
+                                            db.Request.status != db.RequestStatus.PENDING).order_by(
+                                                db.Request.maketimestamp.desc()).all()
+
+
+@db.session_decorator(commit=False)
+def get_active_outgoing(srcnetid: str, *, session: Optional[Session] = None) -> List[Any]:
+    """Returns a list of the active outgoing requests for a user with netid 'destnetid',
+    sorted in order with respect to the request's make timestamp, newest first. If 'destnetid' does
+    not exist in the database, returns an empty list."""
+    assert session is not None
+    return session.query(db.Request).filter(db.Request.srcnetid == srcnetid,
+                                            db.Request.status == db.RequestStatus.PENDING).order_by(
+                                                db.Request.maketimestamp.desc()).all()
+
+
+@db.session_decorator(commit=False)
+def get_inactive_incoming(destnetid: str, *, session: Optional[Session] = None) -> List[Any]:
+    """Returns a list of the active incoming requests for a user with netid 'srcnetid',
+    sorted in order with respect to the request's make timestamp, newest first. If 'srcnetid' does
+    not exist in the database, returns an empty list."""
+    assert session is not None
+    return session.query(db.Request).filter(db.Request.destnetid == destnetid,
+                                            db.Request.status != db.RequestStatus.PENDING).order_by(
+                                                db.Request.maketimestamp.desc()).all()
+
+
+@db.session_decorator(commit=True)
+def get_active_incoming(destnetid: str, *, session: Optional[Session] = None) -> List[Any]:
+    """Returns a list of the active incoming requests for a user with netid 'srcnetid',
+    sorted in order with respect to the request's make timestamp, newest first. If 'srcnetid' does
+    not exist in the database, returns an empty list."""
+    assert session is not None
+
+    requests = session.query(db.Request).filter(
+        db.Request.destnetid == destnetid, db.Request.status == db.RequestStatus.PENDING).order_by(
+            db.Request.maketimestamp.desc()).all()
+
+    unread = [r for r in requests if not r.read]
+    print(f"these requests are still unread: {unread = }")
+    for request in unread:
+        request.read = True
+        session.add(request)
+    if unread:
+        usermod.update(destnetid, session=session)
+
+    return requests
+
+
+@db.session_decorator(commit=True)
+def get_unread(netid: str, *, session: Optional[Session] = None) -> List[Tuple[str, int]]:
+    """Returns a list of tuples of the form (netid, status) corresponding to the unread incoming
+    requests and new matches of a user."""
+    assert session is not None
+
+    requests = session.query(db.Request.srcnetid, db.Request.destnetid, db.Request.status).filter(
+        db.REQUEST_IS_UNREAD,
+        ((db.Request.destnetid == netid) & (db.Request.status == db.RequestStatus.PENDING)) |
+        ((db.Request.srcnetid == netid) & (db.Request.status == db.RequestStatus.FINALIZED)))
+
+    return [(src if src != netid else dest, status) for src, dest, status in requests]
+
+
+@db.session_decorator(commit=True)
+def get_matches(netid: str, *, session: Optional[Session] = None) -> List[db.MappedRequest]:
+    """ get a list of matches associated with a user"""
+    assert session is not None
+
+    requests = session.query(db.Request).filter(
+        (db.Request.srcnetid == netid) | (db.Request.destnetid == netid),
+        db.Request.status == db.RequestStatus.FINALIZED).all()
+
+    unread = [r for r in requests if not r.read and r.srcnetid == netid]
+    print("get_matches unread:", unread)
+    for request in unread:
+        request.read = True
+        session.add(request)
+    if unread:
+        usermod.update(netid, session=session)
+
+    return requests
+
+
+@db.session_decorator(commit=False)
+def get_terminated(netid: str, *, session: Optional[Session] = None) -> List[db.MappedRequest]:
+    """ get a list of the LIMIT most recently terminated matches associated with a user, newest
+    first. Queries the user's outgoing and incoming matches separately, so that each query is a
+    range scan of a (netid, status, deletetimestamp) index."""
+    assert session is not None
+
+    terminated: List[db.MappedRequest] = []
+    for column in (db.Request.srcnetid, db.Request.destnetid):
+        terminated += session.query(db.Request).filter(
+            column == netid, db.Request.status == db.RequestStatus.TERMINATED).order_by(
+                db.Request.deletetimestamp.desc()).limit(LIMIT).all()
+
+    terminated.sort(key=lambda request: request.deletetimestamp, reverse=True)
+    return terminated[:LIMIT]
+
+
+# probably not necessary
+@db.session_decorator(commit=False)
+def incoming_requests(destnetid: str,
+                      *,
+                      session: Optional[Session] = None) -> Dict[int, db.RequestStatus]:
+    """get a list of incoming matches associatec with a user"""
+    assert session is not None
+
+    rows = session.query(db.Request).filter(db.Request.destnetid == destnetid).order_by(
+        db.Request.srcnetid).all()
+    incoming_request_statuses: Dict[int, db.RequestStatus] = {}
+    for row in rows:
+        incoming_request_statuses[row.requestid] = db.RequestStatus(row.status)
+
+    return incoming_request_statuses
+
+
+# probably not necessary
+@db.session_decorator(commit=False)
+def outgoing_requests(srcnetid: str,
+                      *,
+                      session: Optional[Session] = None) -> Dict[int, db.RequestStatus]:
+    """get a list of outgoing matches associated with a user"""
+    assert session is not None
+    rows: List[db.MappedRequest] = session.query(
+        db.Request).filter(db.Request.srcnetid == srcnetid).order_by(db.Request.destnetid).all()
+    outgoing_request_statuses: Dict[int, db.RequestStatus] = {}
+    for row in rows:
+        outgoing_request_statuses[row.requestid] = db.RequestStatus(row.status)
+    return outgoing_request_statuses
@@ -4,9 +4,29 @@ recreates the database using metadata from db.py. Should be run with the parent
 that the table structure is modified or the database is corrupted. All existing data will be erased;
 any important information must be backed up. """
 
+import pickle
 import sys
+import time
+from datetime import datetime, timezone
 import click
+from sqlalchemy import LargeBinary, bindparam, column, func, inspect, select, table, text
+from sqlalchemy import type_coerce
+from sqlalchemy.orm import Session
 from . import db
+from . import schedule as schedulemod
+from . import matchmaker
+
+MIGRATION_BATCH_SIZE = 100  # rows converted per transaction by migration commands
+LEGACY_SUFFIX = "_pickle"  # suffix of the columns holding pickled timestamps during migration
+LEGACY_SCHEDULE_TABLE = "schedule"  # per-block schedule table, replaced by db.ScheduleInterval
+
+# (table, primary key, timestamp columns) of every column stored with db.TimestampType
+TIMESTAMP_COLUMNS = (
+    (db.User.__table__, "netid", ("lastupdated",)),
+    (db.Request.__table__, "requestid", ("maketimestamp", "finalizedtimestamp", "deletetimestamp")),
+    (db.SmsOutbox.__table__, "messageid", ("created",)),
+)
+
 
 def reset_db():
     """Drops and creates database given by db DATABASE url, according to the metadata provided by
@@ -25,6 +45,254 @@ def init_db_cmd():
     click.echo("Database re-initialized.")
 
 
+def migrate_schedules(batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """Converts the pickled schedule lists in the users and requests tables to the fixed-length
+    bitmap format of db.ScheduleType. Rows are converted in batches of 'batch_size', with one
+    transaction per batch, so that the migration can be interrupted and resumed. Returns the number
+    of converted rows."""
+
+    converted = 0
+    for source, key in ((db.User.__table__, "netid"), (db.Request.__table__, "requestid")):
+        raw = type_coerce(source.c.schedule, LargeBinary)
+        legacy = select(source.c[key], raw).where(
+            source.c.schedule.is_not(None),
+            func.length(raw) != db.SCHEDULE_BYTES).limit(batch_size)
+        update = source.update().where(source.c[key] == bindparam("key")).values(
+            schedule=bindparam("schedule", type_=LargeBinary))
+
+        while True:
+            with db.engine.begin() as conn:
+                rows = conn.execute(legacy).all()
+                if not rows:
+                    break
+                conn.execute(update, [{
+                    "key": k,
+                    "schedule": db.ScheduleBitmap.from_list(pickle.loads(s)).to_bytes()
+                } for k, s in rows])
+            converted += len(rows)
+
+    return converted
+
+
+@click.command("migrate-schedules")
+@click.option("--batch-size", default=MIGRATION_BATCH_SIZE, help="Rows converted per transaction.")
+def migrate_schedules_cmd(batch_size: int):
+    """Converts pickled schedule lists in the database to the bitmap schedule format."""
+
+    click.echo(f"Converted {migrate_schedules(batch_size)} schedules.")
+
+
+def rebuild_intervals(batch_size: int = MIGRATION_BATCH_SIZE, drop_legacy: bool = False) -> int:
+    """Rebuilds the ScheduleInterval table from the schedules in the users table, in batches of
+    'batch_size' users with one transaction per batch. If 'drop_legacy' is set, also drops the
+    per-block schedule table, which is no longer written. Returns the number of users processed."""
+
+    if drop_legacy:
+        with db.engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {LEGACY_SCHEDULE_TABLE}"))
+
+    processed = 0
+    last = ""
+    while True:
+        with Session(db.engine) as session, session.begin():
+            users = session.query(db.User.netid, db.User.schedule).filter(
+                db.User.netid > last).order_by(db.User.netid).limit(batch_size).all()
+            if not users:
+                break
+            for netid, schedule in users:
+                schedulemod.rebuild_intervals(netid, db.as_bitmap(schedule), session=session)
+        last = users[-1][0]
+        processed += len(users)
+
+    return processed
+
+
+@click.command("rebuild-intervals")
+@click.option("--batch-size", default=MIGRATION_BATCH_SIZE, help="Users processed per transaction.")
+@click.option("--drop-legacy", is_flag=True, help="Drop the legacy per-block schedule table.")
+def rebuild_intervals_cmd(batch_size: int, drop_legacy: bool):
+    """Rebuilds the schedule intervals table from the users table."""
+
+    processed = rebuild_intervals(batch_size, drop_legacy)
+    click.echo(f"Rebuilt schedule intervals for {processed} users.")
+
+
+@click.command("refresh-recommendations")
+@click.option("--interval",
+              default=0.0,
+              help="Seconds to wait between passes. Runs a single pass if 0.")
+@click.option("--reset",
+              is_flag=True,
+              help="Drop and recreate the recommendations table before the first pass.")
+def refresh_recommendations_cmd(interval: float, reset: bool):
+    """Recomputes the stored recommendations of users who have been updated since they were last
+    computed, or whose recommendations are empty or expired. With --interval, runs continuously as a
+    background worker."""
+
+    if reset:  # the table only caches matches, so nothing is lost by recreating it
+        db.Recommendation.__table__.drop(db.engine, checkfirst=True)
+        db.Recommendation.__table__.create(db.engine)
+
+    while True:
+        click.echo(f"Refreshed recommendations for {matchmaker.refresh_stale_recommendations()} "
+                   "users.")
+        if interval <= 0:
+            break
+        time.sleep(interval)
+
+
+def migrate_timestamps(batch_size: int = MIGRATION_BATCH_SIZE, drop_legacy: bool = False) -> int:
+    """Converts the pickled timestamp columns of TIMESTAMP_COLUMNS to db.TimestampType. Each pickled
+    column is renamed with LEGACY_SUFFIX and replaced by a new timestamp column, which is then
+    filled in batches of 'batch_size' rows with one transaction per batch, so that the migration
+    can be interrupted and resumed. Afterwards, creates any missing indexes of the tables. If
+    'drop_legacy' is True, drops legacy columns which have been fully converted. Returns the number
+    of converted values."""
+
+    converted = 0
+    for tbl, key, names in TIMESTAMP_COLUMNS:
+        for name in names:
+            legacy = name + LEGACY_SUFFIX
+            existing = {c["name"]: c["type"] for c in inspect(db.engine).get_columns(tbl.name)}
+            if legacy not in existing and isinstance(existing.get(name), LargeBinary):
+                timestamp = tbl.c[name].type.compile(dialect=db.engine.dialect)
+                with db.engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {tbl.name} RENAME COLUMN {name} TO {legacy}"))
+                    conn.execute(text(f"ALTER TABLE {tbl.name} ADD COLUMN {name} {timestamp}"))
+            elif legacy not in existing:
+                continue
+
+            raw = table(tbl.name, column(key), column(name, db.TimestampType()),
+                        column(legacy, LargeBinary))
+            pickled = select(raw.c[key], raw.c[legacy]).where(
+                raw.c[legacy].is_not(None)).limit(batch_size)
+            update = raw.update().where(raw.c[key] == bindparam("b_key")).values({
+                name: bindparam("b_value", type_=db.TimestampType()),
+                legacy: None
+            })
+
+            while True:
+                with db.engine.begin() as conn:
+                    rows = conn.execute(pickled).all()
+                    if not rows:
+                        break
+                    conn.execute(update, [{
+                        "b_key": k,
+                        "b_value": pickle.loads(v)
+                    } for k, v in rows])
+                converted += len(rows)
+
+            if drop_legacy:
+                with db.engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {tbl.name} DROP COLUMN {legacy}"))
+
+        for index in tbl.indexes:
+            index.create(db.engine, checkfirst=True)
+
+    return converted
+
+
+@click.command("migrate-timestamps")
+@click.option("--batch-size", default=MIGRATION_BATCH_SIZE, help="Rows converted per transaction.")
+@click.option("--drop-legacy",
+              is_flag=True,
+              help="Drop the pickled timestamp columns once they are converted.")
+def migrate_timestamps_cmd(batch_size: int, drop_legacy: bool):
+    """Converts pickled timestamp columns in the database to indexed timestamp columns."""
+
+    click.echo(f"Converted {migrate_timestamps(batch_size, drop_legacy)} timestamps.")
+
+
+def migrate_blocks(batch_size: int = MIGRATION_BATCH_SIZE, drop_legacy: bool = False) -> int:
+    """Copies the pickled block lists of the legacy users.blocked column into the blocks table, in
+    batches of 'batch_size' users with one transaction per batch. Blocks which already exist are
+    skipped, so the migration can be interrupted and resumed. If 'drop_legacy' is True, drops the
+    users.blocked column afterwards. Returns the number of blocks added."""
+
+    users = db.User.__table__
+    if "blocked" not in {c["name"] for c in inspect(db.engine).get_columns(users.name)}:
+        return 0
+    db.Block.__table__.create(db.engine, checkfirst=True)
+
+    raw = table(users.name, column("netid"), column("blocked", LargeBinary))
+    created = datetime.now(timezone.utc)
+    added = 0
+    last = ""
+    while True:
+        with Session(db.engine) as session, session.begin():
+            rows = session.execute(
+                select(raw.c.netid, raw.c.blocked).where(raw.c.netid > last).order_by(
+                    raw.c.netid).limit(batch_size)).all()
+            if not rows:
+                break
+            for netid, blocked in rows:
+                for delnetid in pickle.loads(blocked) if blocked is not None else []:
+                    if session.get(db.Block, (netid, delnetid)) is None:
+                        session.add(db.Block(blocker=netid, blocked=delnetid, created=created))
+                        added += 1
+        last = rows[-1][0]
+
+    if drop_legacy:
+        with db.engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {users.name} DROP COLUMN blocked"))
+
+    return added
+
+
+@click.command("migrate-blocks")
+@click.option("--batch-size", default=MIGRATION_BATCH_SIZE, help="Users processed per transaction.")
+@click.option("--drop-legacy",
+              is_flag=True,
+              help="Drop the pickled users.blocked column once it is copied.")
+def migrate_blocks_cmd(batch_size: int, drop_legacy: bool):
+    """Copies the pickled block lists of the users table into the blocks table."""
+
+    click.echo(f"Added {migrate_blocks(batch_size, drop_legacy)} blocks.")
+
+
+def migrate_interests(batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """Adds the users.interestbits column if it is missing, and fills it from the pickled interests
+    dictionaries of the users table, in batches of 'batch_size' users with one transaction per
+    batch. Safe to run repeatedly. Returns the number of users processed."""
+
+    users = db.User.__table__
+    if "interestbits" not in {c["name"] for c in inspect(db.engine).get_columns(users.name)}:
+        bits = users.c.interestbits.type.compile(dialect=db.engine.dialect)
+        with db.engine.begin() as conn:
+            conn.execute(
+                text(f"ALTER TABLE {users.name} ADD COLUMN interestbits {bits} NOT NULL DEFAULT 0"))
+
+    raw = table(users.name, column("netid"), column("interests", LargeBinary),
+                column("interestbits"))
+    update = raw.update().where(raw.c.netid == bindparam("b_netid")).values(
+        interestbits=bindparam("b_bits"))
+    processed = 0
+    last = ""
+    while True:
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                select(raw.c.netid, raw.c.interests).where(raw.c.netid > last).order_by(
+                    raw.c.netid).limit(batch_size)).all()
+            if not rows:
+                break
+            conn.execute(update, [{
+                "b_netid": netid,
+                "b_bits": db.interests_to_bits(pickle.loads(i)) if i is not None else 0
+            } for netid, i in rows])
+        last = rows[-1][0]
+        processed += len(rows)
+
+    return processed
+
+
+@click.command("migrate-interests")
+@click.option("--batch-size", default=MIGRATION_BATCH_SIZE, help="Users processed per transaction.")
+def migrate_interests_cmd(batch_size: int):
+    """Fills the interests bitmask column of the users table from the interests dictionaries."""
+
+    click.echo(f"Encoded interests for {migrate_interests(batch_size)} users.")
+
+
 def main():
     """Runs reset_db to recreate the database at DATABASE_URL, as specified by db.py."""
 
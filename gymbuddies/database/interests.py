@@ -0,0 +1,47 @@
+"""Registry of the interests that users can select. Interests are stored as a bitmask, so that the
+interests of many users can be compared with integer operations."""
+
+from typing import Any, Dict
+
+# Registry of interests. Interest i is stored as bit (1 << i) of User.interestbits, so new interests
+# must only ever be appended to this tuple.
+INTERESTS = ("Cardiovascular Fitness", "Upper Body", "Lower Body", "Losing Weight", "Gaining Mass")
+INTEREST_BITS = {name: 1 << i for i, name in enumerate(INTERESTS)}  # bit of each interest
+ALL_INTERESTS_MASK = (1 << len(INTERESTS)) - 1  # bitmask with every interest set
+
+
+# note: use this function to get interests dict when adding user to db for first time
+def get_interests_dict(cardio=False,
+                       upper=False,
+                       lower=False,
+                       losing=False,
+                       gaining=False) -> Dict[str, bool]:
+    """Returns an interests hash table. Set interested parameters as True"""
+    return dict(zip(INTERESTS, (cardio, upper, lower, losing, gaining)))
+
+
+def interests_to_bits(interests: Dict[str, Any]) -> int:
+    """Converts an interests dictionary to a bitmask of the interests set to True. Names which are
+    not in INTERESTS are ignored."""
+    return sum(INTEREST_BITS.get(k, 0) for k, v in interests.items() if v)
+
+
+def bits_to_interests(bits: int) -> Dict[str, bool]:
+    """Converts an interests bitmask to an interests dictionary with every registered interest."""
+    return {name: bool(bits & bit) for name, bit in INTEREST_BITS.items()}
+
+
+def interest_similarity(bits1: int, bits2: int) -> float:
+    """Returns the similarity of two interests bitmasks, in [0, 1]: the number of interests that
+    both users have, popcount(a & b), divided by that number plus the number of interests that only
+    one user has, popcount(a ^ b). Users without any interests have a similarity of 0."""
+    shared = (bits1 & bits2).bit_count()
+    total = shared + (bits1 ^ bits2).bit_count()
+    return shared / total if total else 0.0
+
+
+def interests_to_readable(interests: Dict[str, bool] | int):
+    """Converts an interests dictionary or bitmask to a readable format."""
+    if isinstance(interests, int):
+        return ", ".join(name for name, bit in INTEREST_BITS.items() if interests & bit)
+    return ", ".join(k for k, v in interests.items() if v)
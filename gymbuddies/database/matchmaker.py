@@ -2,200 +2,272 @@
 Core matchmaking algorithm. Provided a userid, the algorithm will find the top candidates
 who have the greatest similarities for weighted user interests and schedule availability.
 """
-from typing import List, Dict
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Optional, Set
+import numpy as np
+from sqlalchemy.orm import Session
 from . import user as usermod
-from . import schedule as schedulemod
 from . import db
 from . import request
+from . import block as blockmod
+from . import availability
 
-# IMPORTANT! NUMBER_INTERESTS SHOULD NOT BE HARDCODED. CHANGE THIS ASAP!!!
-NUMBER_INTERESTS: int = 10 # find a way for this value not to be hardcoded
 RANDOM_NUMBER: int = 25 # number of users queried in random selection
 RETURN_NUMBER: int = 10 # number of users returned by find_matches
 LEVEL_WEIGHT: float = 0.5 # weight of level to compatability score
-INTERESTS_WEIGHT: float = 1 / NUMBER_INTERESTS # weight of interests to compatability score
+INTERESTS_WEIGHT: float = 0.5 # weight of interest similarity (in [0, 1]) to compatability score
 SCHEDULE_WEIGHT: float = 1 # weight of schedule intersection to compatability score
 BLOCKS_IN_AN_HOUR: int = 12 # number of blocks in an hour. Used for total intersection checking
+RECOMMENDATION_TTL: float = 600 # seconds before stored recommendations are recomputed
+REFRESH_WORKERS: int = 1 # threads recomputing stale recommendations in the background
+
+_refresher = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="recommendations")
+_pending: Set[str] = set()  # users whose recommendations are queued for a background refresh
+_pending_lock = threading.Lock()
+
+
+class CandidateArrays:
+    """Columnar view of a batch of candidate users. Each attribute used for scoring is loaded into
+    a NumPy array with one entry (or row) per candidate, in the order of 'netids'."""
+
+    def __init__(self, users: List[db.MappedUser]):
+        self.netids: List[str] = [user.netid for user in users]
+        self.levels = np.array([user.level for user in users], dtype=np.int8)
+        self.levelpreferences = np.array([user.levelpreference for user in users], dtype=np.int8)
+        self.genders = np.array([user.gender for user in users], dtype=np.int8)
+        self.open = np.array([bool(user.open) for user in users], dtype=bool)
+        self.okgenders = np.array([[user.okmale, user.okfemale, user.okbinary] for user in users],
+                                  dtype=bool).reshape(len(users), len(db.Gender))
+        self.interestbits = np.array([user.interestbits for user in users], dtype=np.uint64)
+        self.schedules: List[db.ScheduleBitmap] = [db.as_bitmap(user.schedule) for user in users]
+
+
+def _popcount(bits: np.ndarray) -> np.ndarray:
+    """Returns the number of set bits of each element of a uint64 array."""
+    as_bytes = bits.astype(">u8").view(np.uint8).reshape(len(bits), 8)
+    return np.unpackbits(as_bytes, axis=1).sum(axis=1, dtype=np.int64)
+
+
+def interest_similarity_batch(bits: int, candidates: np.ndarray) -> np.ndarray:
+    """Vectorized db.interest_similarity of interests bitmask 'bits' with each bitmask of the uint64
+    array 'candidates'."""
+    main = np.uint64(bits)
+    shared = _popcount(candidates & main)
+    total = shared + _popcount(candidates ^ main)
+    return np.divide(shared, total, out=np.zeros(len(candidates)), where=total > 0)
+
+
+def _level_compatible(preference: np.ndarray | int, level: np.ndarray | int,
+                      other: np.ndarray | int) -> np.ndarray:
+    """Returns whether a user with 'level' and level 'preference' accepts a user with level
+    'other', elementwise."""
+    return ((preference == db.LevelPreference.ALL) |
+            ((preference == db.LevelPreference.EQUAL) & (level == other)) |
+            ((preference == db.LevelPreference.LESSEQUAL) & (level >= other)) |
+            ((preference == db.LevelPreference.GREATEREQUAL) & (level <= other)))
+
+
+def score_candidates(main_user: db.MappedUser,
+                     candidates: CandidateArrays,
+                     *,
+                     level_weight: float = LEVEL_WEIGHT,
+                     interests_weight: float = INTERESTS_WEIGHT,
+                     schedule_weight: float = SCHEDULE_WEIGHT) -> np.ndarray:
+    """Computes the compatability score of 'main_user' with every candidate in one vectorized pass.
+    Candidates removed by a hard filter (closed, gender preferences in either direction, or no full
+    free hour in common) are given a score of -inf."""
+    main = CandidateArrays([main_user])
+
+    # hard filter if user is not open, or not compatible with mainuser's gender preferences (and
+    # vice versa). Genders outside of db.Gender are not filtered.
+    known = (candidates.genders >= 0) & (candidates.genders < len(db.Gender))
+    genders = np.where(known, candidates.genders, 0)
+    keep = candidates.open & (~known | main.okgenders[0][genders])
+    if 0 <= main_user.gender < len(db.Gender):
+        keep &= candidates.okgenders[:, main_user.gender]
+
+    # record whether users are compatable with each other's level preferences
+    level_score = (_level_compatible(main_user.levelpreference, main_user.level,
+                                     candidates.levels).astype(np.float64) +
+                   _level_compatible(candidates.levelpreferences, candidates.levels,
+                                     main_user.level))
+
+    # compare the interests that both users share with the interests that only one of them has
+    interests_score = interest_similarity_batch(main_user.interestbits, candidates.interestbits)
+
+    # count the blocks in full hours for which both users are available
+    schedule_score = np.array(db.overlap_hours_batch(main_user.schedule, candidates.schedules),
+                              dtype=np.int64) * BLOCKS_IN_AN_HOUR
+    keep &= schedule_score > 0
+
+    scores = (level_weight * level_score + interests_weight * interests_score +
+              schedule_weight * (schedule_score / db.NUM_WEEK_BLOCKS))
+    return np.where(keep, scores, -np.inf)
+
+
+def _candidate_filters(main_user: db.MappedUser) -> List[Any]:
+    """Returns the SQL criterions for the cheap hard filters of 'score_candidates': the candidate
+    must be open, and each user must accept the other's gender. Genders outside of db.Gender are not
+    filtered. Also excludes users who have blocked or been blocked by the main user."""
+    genders = [gender.value for gender in db.Gender]
+    accepted = [
+        gender.value for gender, ok in zip(
+            db.Gender, (main_user.okmale, main_user.okfemale, main_user.okbinary)) if ok
+    ]
+    criterions = [
+        db.User.open == True,
+        db.User.gender.in_(accepted) | db.User.gender.notin_(genders),
+        blockmod.not_blocked_with(main_user.netid),
+    ]
+    if main_user.gender in genders:
+        okgender = (db.User.okmale, db.User.okfemale, db.User.okbinary)[main_user.gender]
+        criterions.append(okgender == True)
+    return criterions
+
+
+@db.session_decorator(commit=False)
+def find_matches(netid: str, *, session: Optional[Session] = None) -> List[str]:
+    """run algorithm to find top matches for user <netid>. Runs in a single session, with one query
+    for the main user, one for the users to exclude, and up to three for the candidate sample (see
+    usermod.get_rand_users), plus a load of the availability index on its first use in the process.
+    Candidates are generated from the availability index, so only users with a full free hour in
+    common with the main user are sampled."""
+    assert session is not None
 
-def find_matches(netid: str) -> List[str]:
-    """run algorithm to find top matches for user <netid>"""
     # get the main user using their netid
-    main_user = usermod.get_user(netid)
-    assert main_user is not None
-
-    # get a random sample of users to select from
-    randusers = usermod.get_rand_users(RANDOM_NUMBER, netid)
-    assert randusers is not None
-
-    # do a hard filter on users that you are already matched with
-    completed_matches = request.get_matches(netid)
-    rand_netids = [user.netid for user in randusers]
-    banned_netids = []
-    assert completed_matches is not None
-    for completed_match in completed_matches:
-        src_user = completed_match.srcnetid
-        dest_user = completed_match.destnetid
-        if src_user in rand_netids:
-            banned_netids.append(src_user)
-        if dest_user in rand_netids:
-            banned_netids.append(dest_user)
-
-    # do a hard filter on users that you already sent a request to
-    outgoing_requests = request.get_active_outgoing(netid)
-    assert outgoing_requests is not None
-    for outgoing_request in outgoing_requests:
-        dest_user = outgoing_request.destnetid
-        if dest_user in rand_netids:
-            banned_netids.append(dest_user)
-
-    # do a hard filter on users that you have incoming requests for
-    incoming_requests = request.get_active_incoming(netid)
-    assert incoming_requests is not None
-    for incoming_request in incoming_requests:
-        src_user = incoming_request.srcnetid
-        if src_user in rand_netids:
-            banned_netids.append(src_user)
-
-    # do a hard filter on users that you have blocked
-    blocked_users = usermod.get_blocked(netid)
-    assert blocked_users is not None
-    for blocked_user in blocked_users:
-        if blocked_user in rand_netids:
-            banned_netids.append(blocked_user)
-
-    temprandusers = randusers.copy()
-    for user in temprandusers:
-        # do a hard filter on users that are not open
-        if user.netid in banned_netids:
-            randusers.remove(user)
-            continue
-
-        if not user.open:
-            randusers.remove(user)
-            continue
-        # hard filter if user is not compatible with mainuser's preferences
-        if user.gender == db.Gender.MALE:
-            if not main_user.okmale:
-                randusers.remove(user)
-                continue
-        elif user.gender == db.Gender.FEMALE:
-            if not main_user.okfemale:
-                randusers.remove(user)
-                continue
-        elif user.gender == db.Gender.NONBINARY:
-            if not main_user.okbinary:
-                randusers.remove(user)
-                continue
-        # hard filter if mainuser is not compatible with user's preferences
-        if main_user.gender == db.Gender.MALE:
-            if not user.okmale:
-                randusers.remove(user)
-                continue
-        elif main_user.gender == db.Gender.FEMALE:
-            if not user.okfemale:
-                randusers.remove(user)
-                continue
-        elif main_user.gender == db.Gender.NONBINARY:
-            if not user.okbinary:
-                randusers.remove(user)
-                continue
-
-    # if there are not enough users left after the hard filters, return whoever is available
-    # if len(randusers) <= RETURN_NUMBER:
-    #    matches: List[str] = []
-    #    for user in randusers:
-    #         matches.append(user.netid)
-    #   return matches
-
-    # record user compatability scores based on user levels and level preferences
-    user_compatabilities: Dict[str, float] = {}
-    main_user_level = main_user.level
-    assert main_user_level is not None
-    main_user_level_preference = main_user.levelpreference
-    assert main_user_level_preference is not None
-    main_user_interests = main_user.interests
-    assert main_user_interests is not None
-    interests_score: float = 0
-
-    for user in randusers:
-        user_level = user.level
-        assert user_level is not None
-
-        user_compatabilities[user.netid] = 0
-        # record whether user is compatable with the level preference of the main user
-        if main_user_level_preference == db.LevelPreference.ALL:
-            user_compatabilities[user.netid] += 1
-        elif main_user_level_preference == db.LevelPreference.EQUAL:
-            if main_user_level == user_level:
-                user_compatabilities[user.netid] += 1
-        elif main_user_level_preference == db.LevelPreference.LESSEQUAL:
-            if main_user_level >= user_level:
-                user_compatabilities[user.netid] += 1
-        elif main_user_level_preference == db.LevelPreference.GREATEREQUAL:
-            if main_user_level <= user_level:
-                user_compatabilities[user.netid] += 1
-
-        # record whether the main user is compatable with the level preference of user
-        user_level_preference = user.levelpreference
-        if user_level_preference == db.LevelPreference.ALL:
-            user_compatabilities[user.netid] += 1
-        if user_level_preference == db.LevelPreference.EQUAL:
-            if user_level == main_user_level:
-                user_compatabilities[user.netid] += 1
-        elif user_level_preference == db.LevelPreference.LESSEQUAL:
-            if user_level >= main_user_level:
-                user_compatabilities[user.netid] += 1
-        elif user_level_preference == db.LevelPreference.GREATEREQUAL:
-            if user_level <= main_user_level:
-                user_compatabilities[user.netid] += 1
-
-        # adjust user compatability score with weight
-        user_compatabilities[user.netid] *= LEVEL_WEIGHT
-
-        # update user compatability scores based on user interests
-        user_interests = user.interests
-        assert user_interests is not None
-        for interest in user_interests:
-            if interest in main_user_interests:
-                if user_interests[interest] == main_user_interests[interest]:
-                    interests_score += 1
-        user_compatabilities[user.netid] += interests_score * INTERESTS_WEIGHT
-
-
-    # update user compatability scores based on schedule intersection
-    main_user_schedule: List[int] | None = schedulemod.get_schedule(netid)
-    assert main_user_schedule is not None
-    for user in randusers:
-        schedule_score: int = 0
-        user_schedule: List[int] | None = schedulemod.get_schedule(user.netid)
-        assert user_schedule is not None
-        i = 0
-        while i + (BLOCKS_IN_AN_HOUR - 1) < len(user_schedule):
-            flag = True
-            for j in range(i, i + BLOCKS_IN_AN_HOUR):
-                if not ((main_user_schedule[j] == db.ScheduleStatus.AVAILABLE) and (user_schedule[j] == db.ScheduleStatus.AVAILABLE)):
-                    flag = False
-            if flag:
-                schedule_score += BLOCKS_IN_AN_HOUR
-            i += BLOCKS_IN_AN_HOUR
-        # do a hard filter where there are no schedule interactions
-        # do a hard filter on users that have blocked you
-        if schedule_score == 0 or (netid in user.blocked):
-            del user_compatabilities[user.netid]
-        else:
-            # continue with matchmaking ranking algorithm
-            user_compatabilities[user.netid] += (schedule_score / db.NUM_WEEK_BLOCKS) * SCHEDULE_WEIGHT
+    main_user = usermod.get_user(netid, session=session)
 
+    # do a hard filter on users that you are already matched with, that you already sent a request
+    # to, or that you have incoming requests for
+    banned_netids = request.get_active_partners(netid, session=session)
+
+    # generate candidates who share at least one full free hour with you, and get a random sample
+    # of them to select from, applying the cheap hard filters and excluding users that you have
+    # blocked or that have blocked you
+    overlapping = availability.get_overlapping_users(main_user.schedule, session=session)
+    overlapping -= banned_netids
+    if not overlapping:
+        return []
+    randusers = usermod.get_rand_users(RANDOM_NUMBER,
+                                       netid,
+                                       db.User.netid.in_(overlapping),
+                                       *_candidate_filters(main_user),
+                                       session=session)
+    if not randusers:
+        return []
+
+    candidates = CandidateArrays(randusers)
+    scores = score_candidates(main_user, candidates)
 
     # return users with the highest compatabilties to the main user
-    compatabilities = sorted(user_compatabilities.items(), key = lambda x: x[1], reverse = True)
-    matches: List[str] = []
-    # if there are not enough users remaining, return everyone you can
-    if len(compatabilities) <= RETURN_NUMBER:
-        for i in range(len(compatabilities)):
-            matches.append(compatabilities[i][0])
-        return matches
-
-    for i in range(RETURN_NUMBER):
-        matches.append(compatabilities[i][0])
+    order = np.argsort(-scores, kind="stable")[:RETURN_NUMBER]
+    return [candidates.netids[i] for i in order if np.isfinite(scores[i])]
+
+
+@db.session_decorator(commit=True)
+def refresh_recommendations(netid: str, *, session: Optional[Session] = None) -> List[str]:
+    """Recomputes the top matches for user <netid>, stores them in the recommendations table, and
+    returns them."""
+    assert session is not None
+
+    lastupdated = usermod.get_lastupdated(netid, session=session)
+    matches = find_matches(netid, session=session)
+
+    recommendation = session.get(db.Recommendation, netid)
+    if recommendation is None:
+        recommendation = db.Recommendation(netid=netid)
+        session.add(recommendation)
+    recommendation.matches = matches
+    recommendation.computed = lastupdated
+    recommendation.refreshed = datetime.now(timezone.utc)
+
+    return matches
+
+
+def _expiry() -> datetime:
+    """Returns the time before which stored recommendations are stale."""
+    return datetime.now(timezone.utc) - timedelta(seconds=RECOMMENDATION_TTL)
+
+
+def _is_fresh(recommendation: Optional[db.MappedRecommendation], lastupdated: datetime) -> bool:
+    """Returns whether 'recommendation' is non-empty, was computed after the last update of its
+    user, and is younger than RECOMMENDATION_TTL."""
+    return (recommendation is not None and bool(recommendation.matches) and
+            recommendation.computed == lastupdated and recommendation.refreshed is not None and
+            recommendation.refreshed > _expiry())
+
+
+@db.session_decorator(commit=False)
+def get_recommendations(netid: str, *, session: Optional[Session] = None) -> List[str]:
+    """Returns the stored top matches for user <netid>, without the matches which no longer pass the
+    hard filters of '_candidate_filters' (e.g. who have closed matching or been blocked). If they
+    are stale (see '_is_fresh'), or none of them pass the filters, they are recomputed in the
+    background (see 'schedule_refresh'), and the stale or empty list is returned in the meantime."""
+    assert session is not None
+
+    main_user = usermod.get_user(netid, session=session)
+    recommendation = session.get(db.Recommendation, netid)
+    matches: List[str] = [] if recommendation is None else recommendation.matches
+    if matches:
+        passing = {
+            match for match, in session.query(db.User.netid).filter(
+                db.User.netid.in_(matches), *_candidate_filters(main_user))
+        }
+        matches = [match for match in matches if match in passing]
+
+    if not matches or not _is_fresh(recommendation, main_user.lastupdated):
+        schedule_refresh(netid)
     return matches
+
+
+def schedule_refresh(netid: str) -> None:
+    """Recomputes the recommendations of user <netid> in a background thread of this process,
+    unless a refresh for the user is already queued."""
+    with _pending_lock:
+        if netid in _pending:
+            return
+        _pending.add(netid)
+    _refresher.submit(_refresh_pending, netid)
+
+
+def _refresh_pending(netid: str) -> None:
+    """Recomputes the recommendations of user <netid>, queued by 'schedule_refresh'."""
+    try:
+        refresh_recommendations(netid)
+    except usermod.UserNotFound:
+        pass  # user was deleted in the meantime
+    except Exception as ex:
+        traceback.print_exception(ex, file=sys.stderr)
+    finally:
+        with _pending_lock:
+            _pending.discard(netid)
+
+
+@db.session_decorator(commit=False)
+def get_stale_recommendations(*, session: Optional[Session] = None) -> List[str]:
+    """Returns the netids of users whose stored recommendations are missing, empty, were computed
+    before their last update, or are older than RECOMMENDATION_TTL."""
+    assert session is not None
+
+    users = session.query(db.User.netid, db.User.lastupdated, db.Recommendation).outerjoin(
+        db.Recommendation, db.Recommendation.netid == db.User.netid).order_by(db.User.netid)
+
+    return [netid for netid, lastupdated, rec in users if not _is_fresh(rec, lastupdated)]
+
+
+def refresh_stale_recommendations() -> int:
+    """Recomputes the recommendations of every user with stale recommendations, one transaction per
+    user. Returns the number of users refreshed."""
+    refreshed = 0
+    for netid in get_stale_recommendations():
+        try:
+            refresh_recommendations(netid)
+        except usermod.UserNotFound:
+            continue  # user was deleted in the meantime
+        refreshed += 1
+
+    return refreshed
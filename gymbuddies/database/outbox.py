@@ -0,0 +1,146 @@
+"""Database API for the SMS outbox. Notifications are added to the outbox in the transaction of the
+change that they notify about, so that they are sent if and only if the change is committed, and
+request handlers never wait on the SMS provider. Messages are claimed and sent by a dispatcher (see
+sendsms.py), and retried with exponential backoff when sending fails."""
+
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import db
+from . import user as usermod
+
+MAX_ATTEMPTS: int = 5  # number of failed attempts after which a message is marked FAILED
+BACKOFF_BASE: float = 30  # seconds before the first retry; doubled after every failed attempt
+CLAIM_TIMEOUT: float = 300  # seconds before a message claimed by a dispatcher may be claimed again
+
+
+def to_number(contact: str) -> Optional[str]:
+    """Returns the E.164 phone number of a ten digit US phone number 'contact', or None if it is not
+    such a number."""
+    if len(contact) != 10 or not contact.isdigit():
+        return None
+    return "+1" + contact
+
+
+@db.session_decorator(commit=True)
+def recieve_notification_on(netid: str, *, session: Optional[Session] = None) -> None:
+    """turn on notifications for this user"""
+    assert session is not None
+    user = usermod.get_user(netid, session=session)
+    user.settings["notifications"] = True
+    usermod.update(netid, session=session)  # trigger update of lastupdated
+
+
+@db.session_decorator(commit=True)
+def recieve_notification_off(netid: str, *, session: Optional[Session] = None) -> None:
+    """turn off notifications for this user"""
+    assert session is not None
+    user = usermod.get_user(netid, session=session)
+    user.settings["notifications"] = False
+    usermod.update(netid, session=session)  # trigger update of lastupdated
+
+
+@db.session_decorator(commit=False)
+def get_notification_status(netid: str, *, session: Optional[Session] = None) -> None:
+    """get the notification status for this user. on or off"""
+    assert session is not None
+    user = usermod.get_user(netid, session=session)
+    return user.settings.get("notifications", False)
+
+
+@db.session_decorator(commit=True)
+def enqueue(netid: str, body: str, dedupekey: str, *, session: Optional[Session] = None) -> bool:
+    """Adds a message with text 'body' for user 'netid' to the outbox. Does nothing if the user has
+    not turned on notifications, has no valid phone number, or a message with 'dedupekey' has
+    already been added. Returns whether the message was added. A duplicate added by a concurrent
+    transaction is skipped by the database, so it never fails the caller's transaction."""
+    assert session is not None
+
+    user = usermod.get_fields(netid, "contact", "settings", session=session)
+    number = to_number(user.contact)
+    if not user.settings.get("notifications", False) or number is None:
+        return False
+
+    row = {
+        "dedupekey": dedupekey,
+        "netid": netid,
+        "number": number,
+        "body": body,
+        "status": db.OutboxStatus.PENDING,
+        "attempts": 0,
+        "nextattempt": time.time(),
+        "created": datetime.now(timezone.utc),
+    }
+    table = db.SmsOutbox.__table__
+    insert = db.upsert_insert(session)
+    if insert is not None:
+        stmt = insert(table).values(row).on_conflict_do_nothing(index_elements=[table.c.dedupekey])
+        return session.execute(stmt).rowcount > 0
+
+    try:  # no ON CONFLICT support; roll back only the insert if the message already exists
+        with session.begin_nested():
+            session.execute(table.insert().values(row))
+    except IntegrityError:
+        return False
+    return True
+
+
+@db.session_decorator(commit=True)
+def claim(limit: int, *, session: Optional[Session] = None) -> List[db.MappedSmsOutbox]:
+    """Claims up to 'limit' messages which are due to be sent, oldest first, and returns them. A
+    claimed message is not claimed again for CLAIM_TIMEOUT seconds, unless it is released by
+    'mark_sent' or 'mark_failed'. Messages claimed by a dispatcher which died are claimed again once
+    the timeout has passed. Rows are locked with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent
+    dispatchers never claim the same message."""
+    assert session is not None
+
+    now = time.time()
+    due = session.query(db.SmsOutbox).filter(
+        db.SmsOutbox.status.in_((db.OutboxStatus.PENDING, db.OutboxStatus.SENDING)),
+        db.SmsOutbox.nextattempt <= now).order_by(
+            db.SmsOutbox.messageid).limit(limit).with_for_update(skip_locked=True).all()
+
+    for message in due:
+        message.status = db.OutboxStatus.SENDING
+        message.nextattempt = now + CLAIM_TIMEOUT
+    return due
+
+
+@db.session_decorator(commit=True)
+def mark_sent(messageid: int, *, session: Optional[Session] = None) -> None:
+    """Marks the message with id 'messageid' as sent."""
+    assert session is not None
+
+    message = session.get(db.SmsOutbox, messageid)
+    if message is not None:
+        message.status = db.OutboxStatus.SENT
+        message.error = None
+
+
+@db.session_decorator(commit=True)
+def mark_failed(messageid: int, error: str, *, session: Optional[Session] = None) -> None:
+    """Records a failed attempt to send the message with id 'messageid'. The message is retried
+    after BACKOFF_BASE * 2**(attempts - 1) seconds, or marked FAILED after MAX_ATTEMPTS attempts."""
+    assert session is not None
+
+    message = session.get(db.SmsOutbox, messageid)
+    if message is None:
+        return
+    message.attempts += 1
+    message.error = error
+    if message.attempts >= MAX_ATTEMPTS:
+        message.status = db.OutboxStatus.FAILED
+    else:
+        message.status = db.OutboxStatus.PENDING
+        message.nextattempt = time.time() + BACKOFF_BASE * 2**(message.attempts - 1)
+
+
+@db.session_decorator(commit=False)
+def get_messages(netid: str, *, session: Optional[Session] = None) -> List[db.MappedSmsOutbox]:
+    """Returns the outbox messages for user 'netid', oldest first."""
+    assert session is not None
+
+    return session.query(db.SmsOutbox).filter(db.SmsOutbox.netid == netid).order_by(
+        db.SmsOutbox.messageid).all()
@@ -0,0 +1,113 @@
+"""Connection pool configuration and metrics for the database engine. Pool settings are read from
+the following environment variables, and are ignored for SQLite databases:
+    DATABASE_POOL_SIZE: number of connections kept open in the pool
+    DATABASE_MAX_OVERFLOW: number of connections that may be opened beyond the pool size
+    DATABASE_POOL_TIMEOUT: seconds to wait for a connection before raising an error
+    DATABASE_POOL_RECYCLE: seconds after which a connection is replaced; -1 to never replace
+    DATABASE_POOL_PRE_PING: if true, tests each connection for liveness on checkout
+    DATABASE_STATEMENT_TIMEOUT: milliseconds after which a statement is cancelled; 0 to disable
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", "-1"))
+POOL_PRE_PING = os.getenv("DATABASE_POOL_PRE_PING", "").lower() in ("1", "true", "yes")
+STATEMENT_TIMEOUT = int(os.getenv("DATABASE_STATEMENT_TIMEOUT", "0"))
+
+
+class PoolStats:
+    """Counters for connection checkouts from a MeteredQueuePool. Safe to update from multiple
+    threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0  # number of connections handed out
+        self.overflows = 0  # checkouts which opened a connection beyond the pool size
+        self.timeouts = 0  # checkouts which gave up waiting for a connection
+        self.wait_total = 0.0  # seconds spent waiting for connections
+        self.wait_max = 0.0  # longest wait for a single connection, in seconds
+
+    def record(self, wait: float, overflow: bool, timeout: bool) -> None:
+        """Records a single checkout attempt which took 'wait' seconds."""
+        with self._lock:
+            self.checkouts += not timeout
+            self.overflows += overflow
+            self.timeouts += timeout
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the current counters as a dictionary."""
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "overflows": self.overflows,
+                "timeouts": self.timeouts,
+                "wait_total": self.wait_total,
+                "wait_max": self.wait_max,
+                "wait_mean": self.wait_total / self.checkouts if self.checkouts else 0.0,
+            }
+
+
+class MeteredQueuePool(QueuePool):
+    """A QueuePool which records the time spent waiting for each connection, and whether the
+    connection had to be opened as overflow, in 'stats'."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        overflow = self._overflow
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record(time.perf_counter() - start, False, True)
+            raise
+        self.stats.record(time.perf_counter() - start, self._overflow > max(overflow, 0), False)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """Returns the keyword arguments for 'create_engine' configuring the connection pool of a
+    database at 'url'."""
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+
+    options: Dict[str, Any] = {
+        "poolclass": MeteredQueuePool,
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": POOL_PRE_PING,
+    }
+    if STATEMENT_TIMEOUT > 0:
+        options["connect_args"] = {"options": f"-c statement_timeout={STATEMENT_TIMEOUT}"}
+    return options
+
+
+def get_stats(pool: Any) -> Dict[str, Any]:
+    """Returns the current state of 'pool', including its checkout metrics if it is a
+    MeteredQueuePool."""
+    stats: Dict[str, Any] = {"status": pool.status()}
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+    if isinstance(pool, MeteredQueuePool):
+        stats.update(pool.stats.snapshot())
+    return stats
@@ -1,14 +1,13 @@
 """Database API"""
-from typing import List, Optional, Dict, Tuple, Any
+from typing import List, Optional, Tuple, Any, Set
 from datetime import datetime, timezone
 from sqlalchemy import Column
 from sqlalchemy.orm import Session
 from . import db
 from . import user as usermod
+from . import block as blockmod
 from . import schedule as schedulemod
-
-LIMIT = 5
-
+from . import conflicts as conflictsmod
 
 class RequestWhileClosed(Exception):
     """Exception raise in an API call if a user attempts to make a request while not being open to
@@ -120,75 +119,6 @@ class RequestStatusMismatch(Exception):
         super().__init__(f"Expected request status {expected}; instead got {actual}.")
 
 
-@db.session_decorator(commit=False)
-def get_inactive_outgoing(srcnetid: str, *, session: Optional[Session] = None) -> List[Any]:
-    """Returns a list of the active outgoing requests for a user with netid 'destnetid',
-    sorted in order with respect to the request's make timestamp, newest first. If 'destnetid' does
-    not exist in the database, returns an empty list."""
-    assert session is not None
-    return session.query(db.Request).filter(db.Request.srcnetid == srcnetid,
-                                            db.Request.status != db.RequestStatus.PENDING).order_by(
-                                                db.Request.maketimestamp.desc()).all()
-
-
-@db.session_decorator(commit=False)
-def get_active_outgoing(srcnetid: str, *, session: Optional[Session] = None) -> List[Any]:
-    """Returns a list of the active outgoing requests for a user with netid 'destnetid',
-    sorted in order with respect to the request's make timestamp, newest first. If 'destnetid' does
-    not exist in the database, returns an empty list."""
-    assert session is not None
-    return session.query(db.Request).filter(db.Request.srcnetid == srcnetid,
-                                            db.Request.status == db.RequestStatus.PENDING).order_by(
-                                                db.Request.maketimestamp.desc()).all()
-
-
-@db.session_decorator(commit=False)
-def get_inactive_incoming(destnetid: str, *, session: Optional[Session] = None) -> List[Any]:
-    """Returns a list of the active incoming requests for a user with netid 'srcnetid',
-    sorted in order with respect to the request's make timestamp, newest first. If 'srcnetid' does
-    not exist in the database, returns an empty list."""
-    assert session is not None
-    return session.query(db.Request).filter(db.Request.destnetid == destnetid,
-                                            db.Request.status != db.RequestStatus.PENDING).order_by(
-                                                db.Request.maketimestamp.desc()).all()
-
-
-@db.session_decorator(commit=True)
-def get_active_incoming(destnetid: str, *, session: Optional[Session] = None) -> List[Any]:
-    """Returns a list of the active incoming requests for a user with netid 'srcnetid',
-    sorted in order with respect to the request's make timestamp, newest first. If 'srcnetid' does
-    not exist in the database, returns an empty list."""
-    assert session is not None
-
-    requests = session.query(db.Request).filter(
-        db.Request.destnetid == destnetid, db.Request.status == db.RequestStatus.PENDING).order_by(
-            db.Request.maketimestamp.desc()).all()
-
-    unread = [r for r in requests if not r.read]
-    print(f"these requests are still unread: {unread = }")
-    for request in unread:
-        request.read = True
-        session.add(request)
-    if unread:
-        usermod.update(destnetid, session=session)
-
-    return requests
-
-
-@db.session_decorator(commit=True)
-def get_unread(netid: str, *, session: Optional[Session] = None) -> List[Tuple[str, int]]:
-    """Returns a list of tuples of the form (netid, status) corresponding to the unread incoming
-    requests and new matches of a user."""
-    assert session is not None
-
-    requests = session.query(db.Request.srcnetid, db.Request.destnetid, db.Request.status).filter(
-        (db.Request.read == False) | (db.Request.read == None),
-        ((db.Request.destnetid == netid) & (db.Request.status == db.RequestStatus.PENDING)) |
-        ((db.Request.srcnetid == netid) & (db.Request.status == db.RequestStatus.FINALIZED)))
-
-    return [(src if src != netid else dest, status) for src, dest, status in requests]
-
-
 @db.session_decorator(commit=False)
 def get_active_single(netid: str, *, session: Optional[Session] = None) -> List[db.MappedRequest]:
     """Returns the requestid of an active request from a user with netid 'srcnetid' to a
@@ -197,7 +127,7 @@ def get_active_single(netid: str, *, session: Optional[Session] = None) -> List[
 
     return session.query(db.Request).filter(
         (db.Request.srcnetid == netid) | (db.Request.destnetid == netid),
-        db.Request.status.in_((db.RequestStatus.PENDING, db.RequestStatus.FINALIZED))).all()
+        db.REQUEST_IS_ACTIVE).all()
 
 
 @db.session_decorator(commit=False)
@@ -212,7 +142,21 @@ def get_active_pair(netid1: str,
     return session.query(db.Request).filter(
         ((db.Request.srcnetid == netid1) & (db.Request.destnetid == netid2)) |
         ((db.Request.srcnetid == netid2) & (db.Request.destnetid == netid1)),
-        db.Request.status.in_((db.RequestStatus.PENDING, db.RequestStatus.FINALIZED))).scalar()
+        db.REQUEST_IS_ACTIVE).scalar()
+
+
+@db.session_decorator(commit=False)
+def get_active_partners(netid: str, *, session: Optional[Session] = None) -> Set[str]:
+    """Returns the netids of users with whom a user with netid 'netid' has a pending or finalized
+    request, in either direction. Unlike 'get_active_incoming' and 'get_matches', does not mark any
+    requests as read."""
+    assert session is not None
+
+    requests = session.query(db.Request.srcnetid, db.Request.destnetid).filter(
+        (db.Request.srcnetid == netid) | (db.Request.destnetid == netid),
+        db.REQUEST_IS_ACTIVE)
+
+    return {src if src != netid else dest for src, dest in requests}
 
 
 @db.session_decorator(commit=False)
@@ -239,36 +183,6 @@ def get_destnetid(requestid: int, *, session: Optional[Session] = None) -> str:
     return _get_column(session, requestid, db.Request.destnetid)
 
 
-@db.session_decorator(commit=True)
-def get_matches(netid: str, *, session: Optional[Session] = None) -> List[db.MappedRequest]:
-    """ get a list of matches associated with a user"""
-    assert session is not None
-
-    requests = session.query(db.Request).filter(
-        (db.Request.srcnetid == netid) | (db.Request.destnetid == netid),
-        db.Request.status == db.RequestStatus.FINALIZED).all()
-
-    unread = [r for r in requests if not r.read and r.srcnetid == netid]
-    print("get_matches unread:", unread)
-    for request in unread:
-        request.read = True
-        session.add(request)
-    if unread:
-        usermod.update(netid, session=session)
-
-    return requests
-
-
-@db.session_decorator(commit=False)
-def get_terminated(netid: str, *, session: Optional[Session] = None) -> List[db.MappedRequest]:
-    """ get a list of matches associated with a user"""
-    assert session is not None
-    return session.query(db.Request).filter(
-        (db.Request.srcnetid == netid) | (db.Request.destnetid == netid),
-        db.Request.status == db.RequestStatus.TERMINATED).order_by(
-            db.Request.deletetimestamp.desc()).limit(LIMIT).all()
-
-
 @db.session_decorator(commit=False)
 def get_request_status(requestid: int, *, session: Optional[Session] = None) -> db.RequestStatus:
     """Return request status of a requestid. If the request is not found, raises an exception."""
@@ -283,38 +197,6 @@ def get_request_schedule(requestid: int, *, session: Optional[Session] = None) -
     return _get_column(session, requestid, db.Request.schedule)
 
 
-# probably not necessary
-@db.session_decorator(commit=False)
-def incoming_requests(destnetid: str,
-                      *,
-                      session: Optional[Session] = None) -> Dict[int, db.RequestStatus]:
-    """get a list of incoming matches associatec with a user"""
-    assert session is not None
-
-    rows = session.query(db.Request).filter(db.Request.destnetid == destnetid).order_by(
-        db.Request.srcnetid).all()
-    incoming_request_statuses: Dict[int, db.RequestStatus] = {}
-    for row in rows:
-        incoming_request_statuses[row.requestid] = db.RequestStatus(row.status)
-
-    return incoming_request_statuses
-
-
-# probably not necessary
-@db.session_decorator(commit=False)
-def outgoing_requests(srcnetid: str,
-                      *,
-                      session: Optional[Session] = None) -> Dict[int, db.RequestStatus]:
-    """get a list of outgoing matches associated with a user"""
-    assert session is not None
-    rows: List[db.MappedRequest] = session.query(
-        db.Request).filter(db.Request.srcnetid == srcnetid).order_by(db.Request.destnetid).all()
-    outgoing_request_statuses: Dict[int, db.RequestStatus] = {}
-    for row in rows:
-        outgoing_request_statuses[row.requestid] = db.RequestStatus(row.status)
-    return outgoing_request_statuses
-
-
 def _get(session: Session, requestid: int, entities: Tuple[Column, ...] = (db.Request,)) -> Any:
     """Returns the 'entities' of a given 'requestid' using the sqlalchemy connection in 'session'.
     If there is no request with the given 'requestid' in the database, then raises the
@@ -344,24 +226,24 @@ def new(srcnetid: str,
     'destnetid', or if the specified 'prevrequest' is not active, then returns False."""
     assert session is not None
     assert len(schedule) == db.NUM_WEEK_BLOCKS
-    srcuser = usermod.get_user(srcnetid)
-    destuser = usermod.get_user(destnetid)
+    srcuser = usermod.get_user(srcnetid, session=session)
+    destuser = usermod.get_user(destnetid, session=session)
 
     if srcnetid == destnetid:
         raise RequestToSelf
 
-    if srcnetid in destuser.blocked:
-        raise RequestToBlockedUser(destnetid, srcnetid)
-    elif destnetid in srcuser.blocked:
-        raise RequestToBlockedUser(srcnetid, destnetid)
+    block = blockmod.get_block(srcnetid, destnetid, session=session)
+    if block is not None:
+        raise RequestToBlockedUser(block.blocker, block.blocked)
 
-    if all(not x for x in schedule):
+    requested = db.as_bitmap(schedule).plane()
+    if not requested:
         raise EmptyRequestSchedule
 
     prevrequestid: int = 0
     if prev is not None:
         prevrequestid = prev.requestid
-        if all(bool(x) == bool(y) for x, y in zip(schedule, prev.schedule)):
+        if requested == db.as_bitmap(prev.schedule).plane():
             raise NoChangeModification
         if not _deactivate(session, prev):
             raise PreviousRequestInactive
@@ -375,9 +257,9 @@ def new(srcnetid: str,
     if get_active_pair(srcnetid, destnetid, session=session):
         raise RequestAlreadyExists(srcnetid, destnetid)
 
-    if any(x and (s & db.ScheduleStatus.MATCHED or d != db.ScheduleStatus.AVAILABLE)
-           for x, s, d in zip(schedule, usermod.get_schedule(srcnetid, session=session),
-                              usermod.get_schedule(destnetid, session=session))):
+    srcschedule = db.as_bitmap(usermod.get_schedule(srcnetid, session=session))
+    destschedule = db.as_bitmap(usermod.get_schedule(destnetid, session=session))
+    if requested & (srcschedule.plane(db.ScheduleStatus.MATCHED) | ~destschedule.free()):
         raise ConflictingRequestSchedule
 
     request = db.Request(srcnetid=srcnetid,
@@ -396,29 +278,14 @@ def new(srcnetid: str,
     print("Created a request with this schedule: ", db.schedule_to_readable(schedule))
 
 
-@db.session_decorator(commit=False)
-def get_conflicts(requestid: int, *, session: Optional[Session] = None) -> List[Tuple[str, str]]:
-    """Returns requests with times conflicting with the request with the provided requestid."""
-    assert session is not None
-    request = _get(session, requestid)
-
-    conflicts: List[Tuple[str, str]] = []
-    for netid in (request.srcnetid, request.destnetid):
-        for active in get_active_single(netid, session=session):
-            if active.requestid == request.requestid:
-                continue
-            if any(x and y for x, y in zip(request.schedule, active.schedule)):
-                conflicts.append((active.srcnetid, active.destnetid))
-
-    return conflicts
-
-
 @db.session_decorator(commit=True)
 def finalize(requestid: int,
              *,
              session: Optional[Session] = None,
              ignore_overlap: bool = False) -> None:
-    """finalize the request by approving the accept request"""
+    """finalize the request by approving the accept request. Unless 'ignore_overlap' is True, raises
+    OverlapRequests if an active request of either user conflicts with it; otherwise, conflicting
+    requests are deactivated. Each user's schedule is written once."""
     assert session is not None
     request = _get(session, requestid)
 
@@ -426,29 +293,18 @@ def finalize(requestid: int,
         raise RequestStatusMismatch(db.RequestStatus(request.status), db.RequestStatus.PENDING)
 
     print(f"finalize: got this ignore_overlap: {ignore_overlap = }")
-    if not ignore_overlap:
-        print("checking for overlaps...")
-        for netid in (request.srcnetid, request.destnetid):
-            for active in get_active_single(netid, session=session):
-                if active.requestid == request.requestid:
-                    continue
-                if any(x and y for x, y in zip(request.schedule, active.schedule)):
-                    raise OverlapRequests(requestid)
+    conflicts = conflictsmod.find_conflicts(session, request)
+    if conflicts.requests and not ignore_overlap:
+        raise OverlapRequests(requestid)
 
     request.finalizedtimestamp = datetime.now(timezone.utc)
     request.status = db.RequestStatus.FINALIZED
     request.read = False
 
-    for netid in (request.srcnetid, request.destnetid):
-        schedulemod.add_schedule_status(netid,
-                                        request.schedule,
-                                        db.ScheduleStatus.MATCHED,
-                                        session=session)
-        for active in get_active_single(netid, session=session):
-            if active.requestid == request.requestid:
-                continue
-            if any(x and y for x, y in zip(request.schedule, active.schedule)):
-                _deactivate(session, active)
+    for active in conflicts.requests:
+        _deactivate(session, active, keep_schedules=tuple(conflicts.schedules))
+    for netid, schedule in conflicts.schedules.items():
+        schedulemod.update_schedule(netid, schedule, session=session)
 
 
 @db.session_decorator(commit=True)
@@ -479,13 +335,18 @@ def terminate(requestid: int, *, session: Optional[Session] = None) -> None:
     _terminate(session, _get(session, requestid))
 
 
-def _terminate(session: Session, request: db.MappedRequest) -> None:
-    """Terminates a request. If this request is not finalized, raises an error."""
+def _terminate(session: Session,
+               request: db.MappedRequest,
+               keep_schedules: Tuple[str, ...] = ()) -> None:
+    """Terminates a request. If this request is not finalized, raises an error. The schedules of
+    users in 'keep_schedules' are left for the caller to update."""
     if request.status != db.RequestStatus.FINALIZED:
         raise RequestStatusMismatch(db.RequestStatus(request.status), db.RequestStatus.FINALIZED)
 
     print(f"request {request.requestid} will now be terminated!")
     for netid in (request.srcnetid, request.destnetid):
+        if netid in keep_schedules:
+            continue
         schedulemod.remove_schedule_status(netid,
                                            request.schedule,
                                            db.ScheduleStatus.MATCHED,
@@ -495,18 +356,29 @@ def _terminate(session: Session, request: db.MappedRequest) -> None:
     request.deletetimestamp = datetime.now(timezone.utc)
 
 
-def _deactivate(session: Session, request: db.MappedRequest) -> bool:
+def _deactivate(session: Session,
+                request: db.MappedRequest,
+                keep_schedules: Tuple[str, ...] = ()) -> bool:
     """Deactivates a request if it is active. Returns True if a request was deactivated, and False
-    otherwise."""
+    otherwise. The schedules of users in 'keep_schedules' are left for the caller to update."""
     if request.status == db.RequestStatus.PENDING:
         _reject(session, request)
     elif request.status == db.RequestStatus.FINALIZED:
-        _terminate(session, request)
+        _terminate(session, request, keep_schedules)
     else:
         return False
     return True
 
 
+@db.session_decorator(commit=True)
+def deactivate_pair(netid1: str, netid2: str, *, session: Optional[Session] = None) -> bool:
+    """Deactivates the active request between users 'netid1' and 'netid2', in either direction, if
+    there is one. Returns True if a request was deactivated, and False otherwise."""
+    assert session is not None
+    request = get_active_pair(netid1, netid2, session=session)
+    return request is not None and _deactivate(session, request)
+
+
 @db.session_decorator(commit=True)
 def modify(requestid: int,
            schedule: List[db.ScheduleStatus] | List[int],
@@ -534,7 +406,7 @@ def modify_match(requestid: int,
 
     request = _get(session, requestid)
 
-    srcuser = usermod.get_user(request.srcnetid)
+    srcuser = usermod.get_user(request.srcnetid, session=session)
     if srcuser != netid:
         destuser = srcuser
         srcuser = netid
@@ -1,6 +1,5 @@
 """Database API"""
 from typing import List, Optional
-from sqlalchemy import Column
 from sqlalchemy.orm import Session
 from . import db
 from . import user as usermod
@@ -16,7 +15,7 @@ def get_schedule(netid: str, *, session: Optional[Session] = None) -> List[int]:
 
 @db.session_decorator(commit=True)
 def update_schedule(netid: str,
-                    schedule: List[int],
+                    schedule: List[int] | db.ScheduleBitmap,
                     *,
                     session: Optional[Session] = None) -> None:
     """Updates either Availability, Pending, or Matched to be set for a certain time block.
@@ -26,26 +25,53 @@ def update_schedule(netid: str,
     assert len(schedule) == db.NUM_WEEK_BLOCKS
 
     # make change to the User table if necessary
-    # acquire the user lock here so that the schedule table can be modified safely
-    print(f"update_schedule: trying to update user: {netid = }, {schedule = }")
+    # acquire the user lock here so that the intervals table can be modified safely
+    print(f"update_schedule: trying to update user: {netid = }")
+    user = usermod.get_user(netid, session=session)
+    old = db.ScheduleBitmap() if user.schedule is None else user.schedule.copy()
     usermod.update(netid, session=session, schedule_as_availability=False, schedule=schedule)
 
-    # make change to the Schedule Table
-    session.query(db.Schedule).filter(db.Schedule.netid == netid).delete()
-    for i, status in enumerate(schedule):
-        block = db.Schedule(
-            timeblock=i,
-            netid=netid,
-            matched=bool(db.ScheduleStatus.MATCHED & status),
-            pending=bool(db.ScheduleStatus.PENDING & status),
-            available=bool(db.ScheduleStatus.AVAILABLE & status),
-        )
+    # rebuild the intervals of the user only if a status of some block changed
+    new = db.as_bitmap(schedule)
+    if any(old.plane(flag) != new.plane(flag) for flag in db.SCHEDULE_FLAGS):
+        rebuild_intervals(netid, new, session=session)
+
+
+@db.session_decorator(commit=True)
+def rebuild_intervals(netid: str,
+                      schedule: db.ScheduleBitmap,
+                      *,
+                      session: Optional[Session] = None) -> None:
+    """Replaces the rows of the ScheduleInterval table for a user with the intervals of
+    'schedule'."""
+    assert session is not None
+
+    session.query(db.ScheduleInterval).filter(db.ScheduleInterval.netid == netid).delete(
+        synchronize_session=False)
+
+    schedule_list = schedule.to_list()
+    rows = [{
+        "netid": netid,
+        "status": int(flag),
+        "startblock": start,
+        "endblock": end,
+    } for flag in db.SCHEDULE_FLAGS if schedule.plane(flag)
+            for start, end in db.schedule_to_events(schedule_list, flag)]
+    if rows:
+        session.execute(db.ScheduleInterval.__table__.insert(), rows)
+
+
+def _marked_bits(marked: List[int | bool] | db.ScheduleBitmap) -> int:
+    """Converts a marked list (or a schedule, whose non-UNAVAILABLE blocks are marked) to a
+    bitmap."""
+    if isinstance(marked, db.ScheduleBitmap):
+        return marked.plane()
+    return db.marked_to_bits(marked)
 
-        session.add(block)
 
 @db.session_decorator(commit=True)
 def update_schedule_status(netid: str,
-                        marked: List[int | bool],
+                        marked: List[int | bool] | db.ScheduleBitmap,
                         status: db.ScheduleStatus,
                         *,
                         session: Optional[Session] = None) -> None:
@@ -53,19 +79,17 @@ def update_schedule_status(netid: str,
     indices of 'marked' correspond to a TimeBlock, and if an element is True, then the pending flag
     is marked for the corresponding TimeBlock. If False, then the element is unmarked."""
 
-    schedule: List[int] = usermod.get_schedule(netid, session=session)
-    for i, m in enumerate(marked):
-        if m:
-            schedule[i] |= status
-        else:
-            schedule[i] &= ~status
+    bits = _marked_bits(marked)
+    schedule = db.as_bitmap(usermod.get_schedule(netid, session=session)).copy()
+    schedule.add_status(bits, status)
+    schedule.remove_status(db.WEEK_MASK & ~bits, status)
 
     update_schedule(netid, schedule, session=session)
 
 
 @db.session_decorator(commit=True)
 def add_schedule_status(netid: str,
-                        marked: List[int | bool],
+                        marked: List[int | bool] | db.ScheduleBitmap,
                         status: db.ScheduleStatus,
                         *,
                         session: Optional[Session] = None) -> None:
@@ -73,17 +97,15 @@ def add_schedule_status(netid: str,
     indices of 'marked' correspond to a TimeBlock, and if an element is True, then the pending flag
     is marked for the corresponding TimeBlock. If False, then the element is ignored."""
 
-    schedule: List[int] = usermod.get_schedule(netid, session=session)
-    for i, m in enumerate(marked):
-        if m:
-            schedule[i] |= status
+    schedule = db.as_bitmap(usermod.get_schedule(netid, session=session)).copy()
+    schedule.add_status(_marked_bits(marked), status)
 
     update_schedule(netid, schedule, session=session)
 
 
 @db.session_decorator(commit=True)
 def remove_schedule_status(netid: str,
-                           marked: List[int | bool],
+                           marked: List[int | bool] | db.ScheduleBitmap,
                            status: db.ScheduleStatus,
                            *,
                            session: Optional[Session] = None) -> None:
@@ -91,21 +113,19 @@ def remove_schedule_status(netid: str,
     indices of 'marked' correspond to a TimeBlock, and if an element is True, then the pending flag
     is unmarked for the corresponding TimeBlock. if False, then the element is ignored."""
 
-    schedule: List[int] = usermod.get_schedule(netid, session=session)
-    for i, m in enumerate(marked):
-        if m:
-            schedule[i] &= ~status
+    schedule = db.as_bitmap(usermod.get_schedule(netid, session=session)).copy()
+    schedule.remove_status(_marked_bits(marked), status)
 
     update_schedule(netid, schedule, session=session)
 
 
-def _get_status_schedule(session: Session, netid: str, status_flag: Column,
-                         status: db.ScheduleStatus) -> List[int]:
+def _get_status_schedule(session: Session, netid: str, status: db.ScheduleStatus) -> List[int]:
     schedule: List[int] = [db.ScheduleStatus.UNAVAILABLE] * db.NUM_WEEK_BLOCKS
-    timeblocks = session.query(db.Schedule.timeblock).filter(
-        db.Schedule.netid == netid, status_flag == True).order_by(db.Schedule.timeblock).all()
-    for t in timeblocks:
-        schedule[t[0]] = status
+    intervals = session.query(db.ScheduleInterval.startblock, db.ScheduleInterval.endblock).filter(
+        db.ScheduleInterval.netid == netid,
+        db.ScheduleInterval.status == status).order_by(db.ScheduleInterval.startblock).all()
+    for start, end in intervals:
+        schedule[start:end] = [status] * (end - start)
 
     return schedule
 
@@ -114,21 +134,21 @@ def _get_status_schedule(session: Session, netid: str, status_flag: Column,
 def get_matched_schedule(netid: str, *, session: Optional[Session] = None) -> List[int]:
     """ Return schedule specifially showing time of matches"""
     assert session is not None
-    return _get_status_schedule(session, netid, db.Schedule.matched, db.ScheduleStatus.MATCHED)
+    return _get_status_schedule(session, netid, db.ScheduleStatus.MATCHED)
 
 
 @db.session_decorator(commit=False)
 def get_pending_schedule(netid: str, *, session: Optional[Session] = None) -> List[int]:
     """ Return schedule specifially showing time of pending matches"""
     assert session is not None
-    return _get_status_schedule(session, netid, db.Schedule.pending, db.ScheduleStatus.PENDING)
+    return _get_status_schedule(session, netid, db.ScheduleStatus.PENDING)
 
 
 @db.session_decorator(commit=False)
 def get_available_schedule(netid: str, *, session: Optional[Session] = None) -> List[int]:
     """Return schedule specifically showing time of availabilities"""
     assert session is not None
-    return _get_status_schedule(session, netid, db.Schedule.available, db.ScheduleStatus.AVAILABLE)
+    return _get_status_schedule(session, netid, db.ScheduleStatus.AVAILABLE)
 
 
 # TODO: get available users matching a given schedule
@@ -137,8 +157,10 @@ def get_available_users(timeblock: int, *, session: Optional[Session] = None) ->
     """Return list of users showing available users at a certain timeframe"""
     assert session is not None
 
-    rows = session.query(db.Schedule.netid).filter(db.Schedule.timeblock == timeblock).order_by(
-        db.Schedule.netid).all()
+    rows = session.query(db.ScheduleInterval.netid).filter(
+        db.ScheduleInterval.status == db.ScheduleStatus.AVAILABLE,
+        db.ScheduleInterval.startblock <= timeblock,
+        db.ScheduleInterval.endblock > timeblock).order_by(db.ScheduleInterval.netid).all()
     return [row[0] for row in rows]
 
 
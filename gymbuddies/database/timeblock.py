@@ -0,0 +1,128 @@
+"""Time blocks of the week, and conversions of schedules to runs of consecutive time blocks
+(events) for display."""
+
+from datetime import datetime
+from typing import List, Tuple
+
+from .bitmap import BLOCK_LENGTH, NUM_HOUR_BLOCKS, NUM_DAY_BLOCKS, NUM_WEEK_BLOCKS, ScheduleStatus
+
+DAY_NAMES = ("Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday")
+
+
+
+class TimeBlock(int):
+    """Integer derivative representing a particular time block in a schedule. Provides conversion
+    functions to human readable times and vice versa."""
+
+    def __new__(cls, index: int):
+        return super().__new__(cls, index)
+
+    @classmethod
+    def from_daytime(cls, day: int, time: int) -> "TimeBlock":
+        """Converts a (day, time) tuple to a TimeBlock. 'day' is an integer from 0-6, corresponding
+        to Sunday, ..., Saturday. 'time' is an integer from 0-NUM_DAY_BLOCKS, corresponding to
+        00:00-00:05, ..., 23:55-24:00."""
+        return cls(day * NUM_DAY_BLOCKS + time)
+
+    def to_readable(self, time_only: bool = False) -> str:
+        """Converts a TimeBlock to the human readable format 'Day, HH:MM XM'. If 'end' is True,
+        then returns the end time; otherwise, returns the start time of this block."""
+
+        day, time = self.day_time()
+        d = datetime.strptime(
+            f"{time // NUM_HOUR_BLOCKS}:{BLOCK_LENGTH * (time % NUM_HOUR_BLOCKS)}", "%H:%M")
+
+        return ("" if time_only else f"{DAY_NAMES[day]} ") + d.strftime('%-I:%M%p')
+
+    def time_str(self) -> str:
+        """Converts the time of day for a TimeBlock to a datetime."""
+        _, time = self.day_time()
+        return datetime.strptime(
+            f"{time // NUM_HOUR_BLOCKS}:{BLOCK_LENGTH * (time % NUM_HOUR_BLOCKS)}",
+            "%H:%M").strftime("%H:%M")
+
+    def day_time(self) -> Tuple[int, int]:
+        """Converts a TimeBlock to a (day, time) tuple. 'day' is an integer from 0-6, corresponding
+        to Sunday, ..., Saturday. 'time' is an integer from 0-NUM_DAY_BLOCKS, corresponding to
+        00:00-00:05, ..., 23:55-24:00."""
+        return divmod(self, NUM_DAY_BLOCKS)
+
+
+def schedule_to_events(schedule: List[int] | List[ScheduleStatus],
+                       flag: ScheduleStatus = ScheduleStatus.AVAILABLE) -> List[List[TimeBlock]]:
+    """Converts a schedule into a string representation as a comma separated list of events. Events
+    are in the format (start, end), where start and end are timeblocks, and start is inclusive while
+    end is exclusive. An event is a run of blocks with 'flag' set, and never crosses midnight."""
+    assert len(schedule) == NUM_WEEK_BLOCKS
+
+    blocks: List[List[TimeBlock]] = [[]]
+    for t, status in enumerate(schedule):
+        if (not (status & flag) or t % NUM_DAY_BLOCKS == 0) and blocks[-1]:
+            blocks[-1].append(TimeBlock(t))
+            blocks.append([])
+        if status & flag and not blocks[-1]:
+            blocks[-1].append(TimeBlock(t))
+
+    if blocks[-1]:
+        blocks[-1].append(TimeBlock(len(schedule)))
+    else:
+        blocks.pop()
+
+    return blocks
+
+
+def schedule_to_matchevents(schedule: List[int],
+                            match_names: List[str]) -> List[List[Tuple[TimeBlock, str]]]:
+    """Converts a schedule into a string representation as a comma separated list of events. Events
+    are in the format (start, end), where start and end are timeblocks, and start is inclusive while
+    end is exclusive."""
+    assert len(schedule) == NUM_WEEK_BLOCKS
+
+    blocks: List[List[Tuple[TimeBlock, str]]] = [[]]
+    for t, status in enumerate(schedule):
+        # print(matchNames[t])
+        if blocks[-1] and (status != ScheduleStatus.AVAILABLE or t % NUM_DAY_BLOCKS == 0 or
+                           match_names[t]):
+            blocks[-1].append((TimeBlock(t), blocks[-1][0][1]))
+            blocks.append([])
+        if status == ScheduleStatus.AVAILABLE and not blocks[-1]:
+            blocks[-1].append((TimeBlock(t), match_names[t]))
+
+    if blocks[-1]:
+        blocks[-1].append((TimeBlock(len(schedule)), match_names[-1]))
+    else:
+        blocks.pop()
+
+    return blocks
+
+
+def schedule_to_modifyevents(schedule: List[int],
+                             requests: List[int]) -> List[List[Tuple[TimeBlock, int]]]:
+    """Converts a schedule into a string representation as a comma separated list of events. Events
+    are in the format (start, end), where start and end are timeblocks, and start is inclusive while
+    end is exclusive."""
+    assert len(schedule) == NUM_WEEK_BLOCKS
+
+    blocks: List[List[Tuple[TimeBlock, int]]] = [[]]
+    for t, status in enumerate(schedule):
+        if blocks[-1] and (status != ScheduleStatus.AVAILABLE or t % NUM_DAY_BLOCKS == 0 or
+                           blocks[-1][0][1] != requests[t]):
+            blocks[-1].append((TimeBlock(t), blocks[-1][0][1]))
+            blocks.append([])
+        if status == ScheduleStatus.AVAILABLE and not blocks[-1]:
+            blocks[-1].append((TimeBlock(t), requests[t]))
+
+    if blocks[-1]:
+        blocks[-1].append((TimeBlock(len(schedule)), requests[-1]))
+    else:
+        blocks.pop()
+
+    return blocks
+
+
+def schedule_to_readable(schedule: List[ScheduleStatus] | List[int]) -> List[str]:
+    """Converts schedule into a list of readable strings."""
+    return [
+        f"{s.to_readable()}-{e.to_readable(time_only=True)}"
+        for s, e in schedule_to_events(schedule)
+    ]
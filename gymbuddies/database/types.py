@@ -0,0 +1,105 @@
+"""Column types for the database schema. Schedules are stored as fixed-length bitmaps, and
+timestamps as timezone-aware TIMESTAMP WITH TIME ZONE columns."""
+
+import pickle
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import DateTime, LargeBinary
+from sqlalchemy.ext.mutable import Mutable
+from sqlalchemy.types import TypeDecorator
+from .bitmap import SCHEDULE_BYTES, ScheduleBitmap, ScheduleStatus, as_bitmap
+
+
+class MutableScheduleBitmap(Mutable, ScheduleBitmap):
+    """A ScheduleBitmap which notifies its parent row of in-place changes. The row is only marked
+    as modified if a change actually alters the schedule."""
+
+    @classmethod
+    def coerce(cls, key: str, value: Any) -> Any:
+        """Converts plain ScheduleBitmaps and legacy schedule lists to MutableScheduleBitmaps."""
+        if value is None or isinstance(value, cls):
+            return value
+        if isinstance(value, (ScheduleBitmap, list, tuple)):
+            return cls.from_list(value)
+        return Mutable.coerce(key, value)
+
+    def add_status(self, bits: int, status: ScheduleStatus | int) -> None:
+        planes = self._planes.copy()
+        super().add_status(bits, status)
+        if self._planes != planes:
+            self.changed()
+
+    def remove_status(self, bits: int, status: ScheduleStatus | int) -> None:
+        planes = self._planes.copy()
+        super().remove_status(bits, status)
+        if self._planes != planes:
+            self.changed()
+
+    def __setitem__(self, t: int, status: int) -> None:
+        if self[t] != status:
+            super().__setitem__(t, status)
+            self.changed()
+
+
+class ScheduleType(TypeDecorator):
+    """Column type storing a schedule as a fixed-length binary column of SCHEDULE_BYTES bytes (one
+    bitmap plane per ScheduleStatus flag; see ScheduleBitmap.to_bytes). Accepts ScheduleBitmaps or
+    legacy schedule lists, and loads ScheduleBitmaps. Rows still holding a legacy pickled list are
+    converted on load; use the 'migrate-schedules' command to convert them in the database."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect: Any) -> bytes | None:
+        if value is None:
+            return None
+        return as_bitmap(value).to_bytes()
+
+    def process_literal_param(self, value: Any, dialect: Any) -> bytes | None:
+        return self.process_bind_param(value, dialect)
+
+    def process_result_value(self, value: Any, dialect: Any) -> ScheduleBitmap | None:
+        if value is None:
+            return None
+        if len(value) == SCHEDULE_BYTES:
+            return MutableScheduleBitmap.from_bytes(bytes(value))
+        return MutableScheduleBitmap.from_list(pickle.loads(value))
+
+    @property
+    def python_type(self) -> type:
+        return ScheduleBitmap
+
+
+class TimestampType(TypeDecorator):
+    """Column type storing a datetime as a TIMESTAMP WITH TIME ZONE, so that timestamps can be
+    compared, sorted and indexed by the database. Naive datetimes are assumed to be in UTC, and
+    timestamps are loaded as timezone-aware datetimes in UTC. Columns which held pickled datetimes
+    must be converted with the 'migrate-timestamps' command."""
+
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect: Any) -> datetime | None:
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        value = value.astimezone(timezone.utc)
+        if dialect.name == "sqlite":  # stored as text without an offset
+            value = value.replace(tzinfo=None)
+        return value
+
+    def process_literal_param(self, value: Any, dialect: Any) -> datetime | None:
+        return self.process_bind_param(value, dialect)
+
+    def process_result_value(self, value: Any, dialect: Any) -> datetime | None:
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+
+    @property
+    def python_type(self) -> type:
+        return datetime
@@ -1,45 +1,27 @@
 """Database API"""
 
+import collections
+import functools
+import random
 from datetime import datetime, timezone
-from typing import Optional, Any, List, Dict, Tuple
+from typing import Optional, Any, Iterable, List, Dict, Tuple
 from sqlalchemy import Column
 from sqlalchemy.orm import Session
-from sqlalchemy.sql.expression import func
 from . import db
+from . import availability
+from . import broker
+from . import cache
 from . import schedule as schedulemod
 from . import request as requestmod
 
 
-class UserAlreadyBlocked(Exception):
-    """Exception raised in API call if attempting to block a user with a netid who is already
-    blocked."""
+USER_CACHE_SIZE = 1024  # maximum number of user snapshots held by the user cache
+USER_CACHE_TTL = 60  # seconds before a cached user snapshot expires
+VERSION_CACHE_SIZE = 8192  # maximum number of lastupdated timestamps held by the version cache
+VERSION_CACHE_TTL = 5  # seconds before a cached lastupdated timestamp is read again
 
-    delnetid: str
-
-    def __init__(self, delnetid: str):
-        self.delnetid = delnetid
-        super().__init__(f"User with netid '{delnetid}' already blocked.")
-
-
-class UserNotBlocked(Exception):
-    """Exception raised in API call if attempting to create a user with a netid already in the
-    database."""
-
-    delnetid: str
-
-    def __init__(self, delnetid: str):
-        self.delnetid = delnetid
-        super().__init__(f"User with netid '{delnetid}' already blocked.")
-
-
-class UserBlockedIsSelf(Exception):
-    """Exception raise in API call if attempting to block oneself."""
-
-    netid: str
-
-    def __init__(self, netid: str):
-        self.netid = netid
-        super().__init__(f"User with netid '{netid}' cannot block themself.")
+user_cache: cache.LRUCache[str, db.MappedUser] = cache.LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+version_cache: cache.LRUCache[str, datetime] = cache.LRUCache(VERSION_CACHE_SIZE, VERSION_CACHE_TTL)
 
 
 class UserAlreadyExists(Exception):
@@ -139,7 +121,6 @@ def _default_profile() -> Dict[str, Any]:
         "okbinary":
             True,
         "settings": {},
-        "blocked": []
     }
 
 
@@ -149,7 +130,7 @@ def _update_user(session: Session,
                  schedule_as_availability: bool = True,
                  **kwargs) -> None:
     """Updates the attributes of 'user' according to 'kwargs'. """
-    assert "netid" not in kwargs and "lastupdated" not in kwargs
+    assert "netid" not in kwargs and "lastupdated" not in kwargs and "interestbits" not in kwargs
 
     print(f"_update_user: {schedule_as_availability = }; using these kwargs: ", kwargs)
     print("columns:", db.User.__table__.columns)
@@ -165,10 +146,20 @@ def _update_user(session: Session,
     for k, v in ((k, v) for k, v in kwargs.items() if k in db.User.__table__.columns):
         print("updating this: ", k, v)
         setattr(user, k, v)
+    if "interests" in kwargs:
+        user.interestbits = db.interests_to_bits(kwargs["interests"])
 
     def postaction():
         user.lastupdated = datetime.now(timezone.utc)
         print(f"postaction for user {user.netid}:", user.lastupdated)
+        session.info["postcommits"].append(postcommit)
+
+    def postcommit():
+        user_cache.invalidate(user.netid)
+        version_cache.invalidate(user.netid)
+        if "schedule" in kwargs:
+            availability.index.update(user.netid, user.schedule)
+        broker.broker.publish(user.netid)
 
     session.info["postactions"].append(postaction)
     # user.lastupdated = datetime.now(timezone.utc)
@@ -177,7 +168,6 @@ def _update_user(session: Session,
         print("user.lastupdated:", user.lastupdated.timestamp())
 
 
-# NOTE: does not remove users from blocked list!
 @db.session_decorator(commit=True)
 def delete(netid: str, *, session: Optional[Session] = None) -> None:
     """Attempts to remove a user from the database, removing all related entries and references.
@@ -188,7 +178,12 @@ def delete(netid: str, *, session: Optional[Session] = None) -> None:
     schedulemod.remove_schedule_status(netid, [True] * db.NUM_WEEK_BLOCKS,
                                        db.ScheduleStatus(~0),
                                        session=session)
+    session.query(db.Recommendation).filter(db.Recommendation.netid == netid).delete()
+    session.query(db.SmsOutbox).filter(db.SmsOutbox.netid == netid).delete()
+    session.query(db.Block).filter((db.Block.blocker == netid) |
+                                   (db.Block.blocked == netid)).delete(synchronize_session=False)
     session.delete(get_user(netid, session=session))
+    session.info["postcommits"].append(lambda: availability.index.remove(netid))
 
 
 @db.session_decorator(commit=False)
@@ -201,21 +196,107 @@ def get_users(*criterions, session: Optional[Session] = None) -> List[db.MappedU
 @db.session_decorator(commit=False)
 def get_rand_users(number: int,
                    netid: str,
+                   *criterions,
                    session: Optional[Session] = None) -> List[db.MappedUser]:
-    """Attempts to return a <number> random sample of users, from which <userid> is not a user"""
+    """Attempts to return a <number> random sample of users satisfying 'criterions', from which
+    <userid> is not a user. The sample is a window of consecutive users in netid order, starting at
+    a random offset and wrapping around to the first netid, so that only the sampled rows are
+    loaded and every user is equally likely to be included."""
+    assert session is not None
+    query = session.query(db.User).filter(db.User.netid != netid, *criterions)
+    total = query.count()
+    if total <= number:
+        return query.all()
+
+    ordered = query.order_by(db.User.netid)
+    rows = ordered.offset(random.randrange(total)).limit(number).all()
+    if len(rows) < number:
+        rows += ordered.limit(number - len(rows)).all()
+    random.shuffle(rows)
+    return rows
+
+
+def get_user(netid: str,
+             *,
+             session: Optional[Session] = None,
+             validate: bool = False) -> db.MappedUser:
+    """Attempts to return a user object from the Users table given the netid of a user. If the user
+    does not exist, raises an exception. If a 'session' is provided, returns the user's row in that
+    session. Otherwise, returns an immutable snapshot of the row from the user cache, loading it on
+    a miss. If 'validate' is True, a cached snapshot is only used if its lastupdated timestamp
+    matches the database's. Snapshots may be up to USER_CACHE_TTL seconds old when another process
+    has changed the user, so callers which act on the data (e.g. pages whose forms are submitted
+    back as updates) should pass 'validate' or a 'session'."""
+    if session is not None:
+        return _get(session, netid, (db.User,))
+
+    snapshot = user_cache.get(netid)
+    if snapshot is not None and (not validate or get_lastupdated(netid) == snapshot.lastupdated):
+        return snapshot
+    return _load_snapshot(netid)
+
+
+@db.session_decorator(commit=False)
+def get_many(netids: Iterable[str],
+             *,
+             columns: Optional[Iterable[str]] = None,
+             session: Optional[Session] = None) -> List[Any]:
+    """Returns the users with the given netids, in the same order, using a single query. If
+    'columns' is provided, only loads the named columns (and netid), and returns rows whose
+    attributes are those columns; otherwise, returns full user objects. If any netid is not in the
+    database, raises UserNotFound."""
+    assert session is not None
+
+    netids = list(netids)
+    if not netids:
+        return []
+
+    if columns is None:
+        entities: Tuple[Any, ...] = (db.User,)
+    else:
+        names = ["netid"] + [c for c in columns if c != "netid"]
+        entities = tuple(getattr(db.User, c) for c in names)
+
+    query = session.query(*entities).filter(db.User.netid.in_(set(netids)))
+    rows = {row.netid: row for row in query}
+    for netid in netids:
+        if netid not in rows:
+            raise UserNotFound(netid)
+    return [rows[netid] for netid in netids]
+
+
+@db.session_decorator(commit=False)
+def get_fields(netid: str, *names: str, session: Optional[Session] = None) -> Tuple[Any, ...]:
+    """Returns the columns 'names' of the user with netid 'netid' as a named tuple with those
+    fields, using a single query. If the user does not exist, raises UserNotFound."""
     assert session is not None
-    rows = session.query(db.User).filter(db.User.netid != netid).order_by(func.random()).all()
-    if len(rows) <= number:
-        return rows
-    return rows[0:number]
+    row = session.query(*(getattr(db.User, name) for name in names)).filter(
+        db.User.netid == netid).one_or_none()
+    if row is None:
+        raise UserNotFound(netid)
+    return _fields_type(names)(*row)
+
+
+@functools.lru_cache(maxsize=None)
+def _fields_type(names: Tuple[str, ...]) -> Any:
+    """Returns the named tuple type with fields 'names'."""
+    return collections.namedtuple("UserFields", names)
 
 
 @db.session_decorator(commit=False)
-def get_user(netid: str, *, session: Optional[Session] = None) -> db.MappedUser:
-    """Attempts to return a user object from the Users table given the netid of a user. If the user
-    does not exist, raises an exception."""
+def _load_snapshot(netid: str, *, session: Optional[Session] = None) -> db.MappedUser:
+    """Loads a snapshot of the user with netid 'netid' into the user cache, and returns it. If the
+    snapshot is loaded in a route's session, it is only stored once the route commits, since it may
+    contain the route's uncommitted changes."""
     assert session is not None
-    return _get(session, netid, (db.User,))
+    generation = user_cache.generation(netid)
+    user = _get(session, netid, (db.User,))
+    snapshot = cache.Snapshot(**{c: getattr(user, c) for c in db.User.__table__.columns.keys()})
+    if db.is_scoped(session):
+        session.info["postcommits"].append(lambda: user_cache.put(netid, snapshot, generation))
+    else:
+        user_cache.put(netid, snapshot, generation)
+    return snapshot
 
 
 @db.session_decorator(commit=False)
@@ -305,8 +386,7 @@ def get_interests_string(netid: str, *, session: Optional[Session] = None) -> st
     """Attempts to return the interests of a user with netid 'netid' as comma separated string.
     Raises an error if the user does not exist """
     assert session is not None
-    interests = _get_column(session, netid, db.User.interests)
-    return ", ".join((k for k, v in interests.items() if v))
+    return db.interests_to_readable(_get_column(session, netid, db.User.interestbits))
 
 
 @db.session_decorator(commit=False)
@@ -373,79 +453,17 @@ def get_lastupdated(netid: str, *, session: Optional[Session] = None) -> datetim
     return _get_column(session, netid, db.User.lastupdated)
 
 
-@db.session_decorator(commit=False)
-def get_blocked(netid: str, *, session: Optional[Session] = None) -> List[str]:
-    """returns list of all users who have been blocked by this user"""
-    assert session is not None
-    return _get_column(session, netid, db.User.blocked)
-
-
-@db.session_decorator(commit=False)
-def is_blocked(netid: str, delnetid: str, *, session: Optional[Session] = None) -> bool:
-    """returns whether this user and the other user are blocked"""
-    assert session is not None
-    return delnetid in _get_column(session, netid, db.User.blocked)
-
-
-@db.session_decorator(commit=True)
-def block_user(netid: str, delnetid: str, *, session: Optional[Session] = None) -> None:
-    """blocks this user. They can no longer appear on find a buddy and cannot send requests to you,
-    nor accept request"""
-    assert session is not None
-    user = get_user(netid, session=session)
-
-    if delnetid == netid:
-        raise UserBlockedIsSelf(netid)
-    if delnetid in user.blocked:
-        raise UserAlreadyBlocked(delnetid)
-
-    deluser = get_user(delnetid, session=session)
-    request = requestmod.get_active_pair(netid, delnetid)
-    if request is not None:
-        requestmod._deactivate(session, request)
-
-    user.blocked.append(delnetid)
-    _update_user(session, user)  # trigger update of lastupdated
-    _update_user(session, deluser)
-
-
-@db.session_decorator(commit=True)
-def unblock_user(netid: str, delnetid: str, *, session: Optional[Session] = None) -> None:
-    """unblocks this user. Now they should be able to appear on find a buddy, rend requests to you,
-    and accept requests"""
-    assert session is not None
-    user = get_user(netid, session=session)
-
-    if delnetid not in user.blocked:
-        raise UserNotBlocked(delnetid)
-
-    user.blocked.remove(delnetid)
-    _update_user(session, user)  # trigger update of lastupdated
-    _update_user(session, get_user(delnetid, session=session))
-
-
-@db.session_decorator(commit=True)
-def recieve_notification_on(netid: str, *, session: Optional[Session] = None) -> None:
-    """turn on notifications for this user"""
-    assert session is not None
-    user = get_user(netid, session=session)
-    user.settings["notifications"] = True
-
-
-@db.session_decorator(commit=True)
-def recieve_notification_off(netid: str, *, session: Optional[Session] = None) -> None:
-    """turn off notifications for this user"""
-    assert session is not None
-    user = get_user(netid, session=session)
-    user.settings["notifications"] = False
-
-
-@db.session_decorator(commit=False)
-def get_notification_status(netid: str, *, session: Optional[Session] = None) -> None:
-    """get the notification status for this user. on or off"""
-    assert session is not None
-    user = get_user(netid, session=session)
-    return user.settings.get("notifications", False)
+def get_version(netid: str) -> datetime:
+    """Returns the lastupdated of a user with netid 'netid' from the version cache, reading it from
+    the database on a miss. Updates committed by this process are seen immediately, and updates
+    committed by other processes within VERSION_CACHE_TTL seconds. Raises an error if the user does
+    not exist."""
+    lastupdated = version_cache.get(netid)
+    if lastupdated is None:
+        generation = version_cache.generation(netid)
+        lastupdated = get_lastupdated(netid)
+        version_cache.put(netid, lastupdated, generation)
+    return lastupdated
 
 
 @db.session_decorator(commit=False)
@@ -469,4 +487,4 @@ def user_profile_valid(netid: str, *, session: Optional[Session] = None) -> bool
         return False
     if len(user.bio) > 750:
         return False
-    return True
\ No newline at end of file
+    return True
@@ -172,13 +172,9 @@ def overlapRequests(ex: database.request.OverlapRequests):
     if netid is None:
         raise NoLoginError
 
-    conflicts = database.request.get_conflicts(ex.requestid)
-    names = []
-    for conflict in conflicts:
-        if conflict[0] == netid:
-            names.append(database.user.get_name(conflict[1]))
-        else:
-            names.append(database.user.get_name(conflict[0]))
+    conflicts = database.conflicts.get_conflicts(ex.requestid)
+    others = [conflict[1] if conflict[0] == netid else conflict[0] for conflict in conflicts]
+    names = [user.name for user in database.user.get_many(others, columns=("name",))]
 
     if names:
         if len(names) > 1:
@@ -0,0 +1,50 @@
+"""Change events blueprint. Streams a Server-Sent Event to the logged in user whenever their user
+row changes, so that pages can refresh their tables on demand instead of polling for changes.
+Each open stream holds a worker thread for up to STREAM_LIFETIME seconds, and events come from
+the in-process broker, so the stream is off unless the EVENT_STREAM environment variable is set to
+1. It should only be enabled for a single worker process with a threaded or asynchronous worker
+class (see the README)."""
+
+import os
+import time
+from typing import Iterator
+from flask import Blueprint, Response
+from flask import session
+from . import error
+from .database import broker
+
+EVENT_STREAM = os.getenv("EVENT_STREAM", "0").lower() in ("1", "true", "yes")
+KEEPALIVE = 15  # seconds between keepalive comments, which detect disconnected clients
+STREAM_LIFETIME = 300  # seconds before a stream is closed, to be reopened by the client
+RECONNECT = 2000  # milliseconds the client waits before reopening a closed stream
+
+bp = Blueprint("events", __name__, url_prefix="")
+
+
+@bp.route("/events", methods=["GET"])
+def events():
+    """Returns an event stream with a 'changed' event for every committed update to the logged in
+    user. Responds with 404 if the event stream is disabled, so that clients fall back to
+    polling."""
+    if not EVENT_STREAM:
+        return "", 404
+
+    netid: str = session.get("netid", "")
+    if not netid:
+        raise error.NoLoginError
+
+    response = Response(_stream(broker.broker.subscribe((netid,))), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # disable proxy buffering
+    return response
+
+
+def _stream(subscription: broker.Subscription) -> Iterator[str]:
+    """Yields the Server-Sent Events of 'subscription' until STREAM_LIFETIME has passed or the
+    client disconnects."""
+    with subscription:
+        yield f"retry: {RECONNECT}\n\n"
+        deadline = time.monotonic() + STREAM_LIFETIME
+        while (remaining := deadline - time.monotonic()) > 0:
+            netid = subscription.get(timeout=min(KEEPALIVE, remaining))
+            yield ": keepalive\n\n" if netid is None else f"event: changed\ndata: {netid}\n\n"
@@ -0,0 +1,30 @@
+"""Health check blueprint. Reports whether the database is reachable, along with the state of the
+connection pool, so that latency spikes can be attributed to pool exhaustion or to the database."""
+
+import time
+from flask import Blueprint
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from .database import db
+
+bp = Blueprint("health", __name__, url_prefix="")
+
+
+@bp.route("/health", methods=["GET"])
+def health():
+    """Returns the database status and connection pool statistics as JSON. Responds with 503 if the
+    database cannot be reached."""
+    start = time.perf_counter()
+    try:
+        with db.read_engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        database = "ok"
+    except SQLAlchemyError as ex:
+        database = type(ex).__name__
+
+    return {
+        "status": "ok" if database == "ok" else "error",
+        "database": database,
+        "latency": time.perf_counter() - start,
+        "pool": db.get_pool_stats(),
+    }, 200 if database == "ok" else 503
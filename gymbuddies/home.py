@@ -40,32 +40,32 @@ def dashboard():
     #     raise OperationalError(None, None, None)
 
     user = database.user.get_user(netid)  # can access this in jinja template with {{ user }}
-    interests = database.user.get_interests_string(netid)
+    interests = db.interests_to_readable(user.interestbits)
     gender = db.Gender(user.gender).to_readable()
     level = db.Level(user.level).to_readable()
 
     # context: Dict[str, Any] = {}
     # common.fill_schedule(context, user.schedule)
-    matches = database.request.get_matches(netid)  #should return a list of requests?
+    matches = database.inbox.get_matches(netid)  #should return a list of requests?
     matchSchedule = [0] * db.NUM_WEEK_BLOCKS
     requestName = ""
     matchNames = [""] * db.NUM_WEEK_BLOCKS
-    for match in matches:
+    match_users = database.user.get_many(
+        [m.destnetid if m.srcnetid == netid else m.srcnetid for m in matches], columns=("name",))
+    for match, match_user in zip(matches, match_users):
         # matchNames = match.schedule.copy()
         # requestName = database.user.get_name(match.destnetid)
-        if (match.srcnetid == netid):
-            requestName = database.user.get_name(match.destnetid)
-        else:
-            requestName = database.user.get_name(match.srcnetid)
+        requestName = match_user.name
+        schedule = match.schedule.to_list()
         for i in range(len(matchNames)):
             # print(matchNames[i].AVAILABLE)
-            if (match.schedule[i] == 4 and match.schedule[i - 1] != 4 and
-                    match.schedule[i + 1] == 4):
+            if (schedule[i] == 4 and schedule[i - 1] != 4 and
+                    schedule[i + 1] == 4):
                 # print("triggered")
                 matchNames[i] = requestName
         #print("row", len(match.schedule))
         #matchSchedules.append(match.schedule) # should be array of strings
-        matchSchedule = [a + b for a, b in zip(matchSchedule, match.schedule)]
+        matchSchedule = [a + b for a, b in zip(matchSchedule, schedule)]
 
     # matches = database.schedule.get_matched_schedule(netid)
     # matchSchedules = common.schedule_to_json(matches)
@@ -99,11 +99,11 @@ def profile():
         prof: Dict[str, Any] = common.form_to_profile(submit)
         prof.update(netid=netid)
         database.user.update(**prof)
-        # update the find a buddies page
-        session["matches"] = database.matchmaker.find_matches(netid)
+        # update the find a buddies page; stale matches are recomputed when it is next loaded
+        session["matches"] = []
         session["index"] = 0
 
-    user = database.user.get_user(netid)
+    user = database.user.get_user(netid, validate=True)
 
     context: Dict[str, Any] = {}
     common.fill_schedule(context, user.schedule)
@@ -126,11 +126,11 @@ def profilecard():
         prof: Dict[str, Any] = common.form_to_profile(submit)
         prof.update(netid=netid)
         database.user.update(**prof)
-        # update the find a buddies page
-        session["matches"] = database.matchmaker.find_matches(netid)
+        # update the find a buddies page; stale matches are recomputed when it is next loaded
+        session["matches"] = []
         session["index"] = 0
 
-    user = database.user.get_user(netid)
+    user = database.user.get_user(netid, validate=True)
 
     context: Dict[str, Any] = {}
     common.fill_schedule(context, user.schedule)
@@ -162,7 +162,7 @@ def newuser():
         database.user.update(**prof)
         return redirect(url_for("home.tutorial"))
 
-    user = database.user.get_user(netid)
+    user = database.user.get_user(netid, validate=True)
 
     context: Dict[str, Any] = {}
 
@@ -195,13 +195,13 @@ def settings():
 
     # if request.method == "POST" and request.form.get("update", "") == "true":
     #     if request.form.get("notifications") == "on":
-    #         database.user.recieve_notification_on(netid)
+    #         database.outbox.recieve_notification_on(netid)
     #     else:
-    #         database.user.recieve_notification_off(netid)
+    #         database.outbox.recieve_notification_off(netid)
 
     #     print(request.form.get("blockinghere", 0) != "")
 
-    # notification = database.user.get_notification_status(netid)
+    # notification = database.outbox.get_notification_status(netid)
     
     # return render_template("settings.html", netid=netid, user=user, notification=notification)
 
@@ -224,9 +224,9 @@ def blocksearch():
         elif blocknetid == netid:
             pass
         else:
-            database.user.block_user(netid, blocknetid)
+            database.block.block_user(netid, blocknetid)
             # perform refresh for the find a buddy page after having blocked a user
-            session["matches"] = database.matchmaker.find_matches(netid)
+            session["matches"] = []
             session["index"] = 0
         update_requests_matches(netid, blocknetid)
     
@@ -245,30 +245,32 @@ def settingsnotifs():
 
     if request.method == "POST" and request.form.get("update", "") == "true":
         if request.form.get("notifications") == "on":
-            database.user.recieve_notification_on(netid)
+            database.outbox.recieve_notification_on(netid)
         else:
-            database.user.recieve_notification_off(netid)
+            database.outbox.recieve_notification_off(netid)
 
-    notification = database.user.get_notification_status(netid)
+    notification = database.outbox.get_notification_status(netid)
     
     return render_template("settingsnotifs.html", netid=netid, user=user, notification=notification)
 
 def update_requests_matches(netid, blocknetid):
-    active_outgoing = database.request.get_active_outgoing(netid)
+    active_outgoing = database.inbox.get_active_outgoing(netid)
     for arequest in active_outgoing:
         if arequest.destnetid == blocknetid:
             database.request.reject(arequest.requestid)
-    active_incoming = database.request.get_active_incoming(netid)
+    active_incoming = database.inbox.get_active_incoming(netid)
     for arequest in active_incoming:
         if arequest.srcnetid == blocknetid:
             database.request.reject(arequest.requestid)
-    matches = database.request.get_matches(netid)
+    matches = database.inbox.get_matches(netid)
     for match in matches:
         if match.srcnetid == blocknetid or match.destnetid == blocknetid:
             database.request.terminate(match.requestid)
 
 
 @bp.route("/blockedtable", methods=["GET", "POST"])
+@common.etag_decorator()
+@db.scoped_session_decorator()
 def blockedtable():
     """Returns table of blocked people."""
     netid: str = session.get("netid", "")
@@ -277,23 +279,20 @@ def blockedtable():
 
     if request.method == "POST":
         delnetid = request.form.get("delnetid", "")
-        database.user.unblock_user(netid, delnetid)
+        database.block.unblock_user(netid, delnetid)
 
         # perform refresh for the find a buddy page after having unblocked a user
-        session["matches"] = database.matchmaker.find_matches(netid)
+        session["matches"] = []
         session["index"] = 0
 
-    elif common.needs_refresh(int(request.args.get("lastrefreshed", 0)), netid):
-        return ""
-
     print("blockedtable refreshed!")
 
     g.user = database.user.get_user(netid)  # can access this in jinja template with {{ g.user }}
-    # matches = database.request.get_matches(netid)
+    # matches = database.inbox.get_matches(netid)
 
     # GET BLOCKED!!!! REIMPLEMENT
-    blocked = database.user.get_blocked(netid)
-    users = [database.user.get_user(block) for block in blocked]
+    blocked = database.block.get_blocked(netid)
+    users = database.user.get_many(blocked, columns=("name",))
     length = len(blocked)
 
     return render_template("blockedtable.html", netid=netid, blockedusers=users, length=length)
@@ -314,30 +313,28 @@ def delete():
 
 
 @bp.route("/notificationstable", methods=["GET", "POST"])
+@common.etag_decorator()
+@db.scoped_session_decorator()
 def notificationstable():
     """Returns table of blocked people."""
     netid: str = session.get("netid", "")
     if not netid:
         raise error.NoLoginError
 
-    if common.needs_refresh(int(request.args.get("lastrefreshed", 0)), netid):
-        return ""
-
     print("notifications refreshed!")
 
-    return render_template("notificationstable.html", unread=database.request.get_unread(netid))
+    return render_template("notificationstable.html", unread=database.inbox.get_unread(netid))
 
 @bp.route("/notificationbadge", methods=["GET", "POST"])
+@common.etag_decorator()
+@db.scoped_session_decorator()
 def notificationbadge():
     """Returns table of blocked people."""
     netid: str = session.get("netid", "")
     if not netid:
         raise error.NoLoginError
 
-    if common.needs_refresh(int(request.args.get("lastrefreshed", 0)), netid):
-        return ""
-
-    return render_template("notificationbadge.html", unread=database.request.get_unread(netid))
+    return render_template("notificationbadge.html", unread=database.inbox.get_unread(netid))
 
 @bp.route("/aboutus", methods=["GET", "POST"])
 @error.guard_decorator()
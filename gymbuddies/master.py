@@ -245,11 +245,11 @@ def handle_request(context: Dict[str, Any], profile: Dict[str, Any]) -> None:
         context["query"] += f"Request {requestid} successfully terminated."
 
     elif submit == "Query":
-        in_requests = database.request.incoming_requests(srcnetid)
+        in_requests = database.inbox.incoming_requests(srcnetid)
         context["query"] += f"Incoming requests for user with netid '{srcnetid}':\n"
         context["query"] += database.debug.sprint_requests(in_requests) + "\n"
 
-        out_requests = database.request.outgoing_requests(srcnetid)
+        out_requests = database.inbox.outgoing_requests(srcnetid)
         context["query"] += f"Outgoing requests for user with netid '{srcnetid}':\n"
         context["query"] += database.debug.sprint_requests(out_requests) + "\n"
 
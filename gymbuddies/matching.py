@@ -19,6 +19,24 @@ from .database import db
 bp = Blueprint("matching", __name__, url_prefix="/matching")
 
 
+def _notify_partner(netid: str, req: db.MappedRequest, message: str, event: str) -> None:
+    """Adds an SMS notification with 'message' from user 'netid' to the other user of request 'req'
+    to the outbox. 'event' names the change to the request, so that it is notified at most once.
+    Should be called in the same unit of work as the change."""
+    partner = req.srcnetid if netid == req.destnetid else req.destnetid
+    name = database.user.get_fields(netid, "name").name
+    sendsms.notify(partner, message, netid, name, f"{event}:{req.requestid}:{partner}")
+
+
+@db.scoped_session_decorator()
+def _new_request(netid: str, destnetid: str, schedule: List[db.ScheduleStatus]) -> None:
+    """Makes a new request from user 'netid' to user 'destnetid', and notifies 'destnetid', in a
+    single unit of work."""
+    database.request.new(netid, destnetid, schedule)
+    _notify_partner(netid, database.request.get_active_pair(netid, destnetid),
+                    sendsms.NEW_REQUEST_MESSAGE, "new")
+
+
 @bp.route("/findabuddy", methods=("GET", "POST"))
 # @error.guard_decorator()
 def findabuddy():
@@ -34,16 +52,7 @@ def findabuddy():
         schedule = common.json_to_schedule(request.form["jsoncalendar"])
 
         session["index"] += 1
-        database.request.new(netid, destnetid, schedule)
-        # ADD SMS MESSAGING HERE
-        if sendsms.SEND_SMS:
-            if database.user.get_notification_status(destnetid):
-                username = database.user.get_name(netid)
-                number = database.user.get_contact(destnetid)
-                success = sendsms.sendsms("1" + number,
-                                          sendsms.NEW_REQUEST_MESSAGE.replace("$netid$", netid).replace("$username$", username))
-                print("sent to this number:", number)
-                print(success)
+        _new_request(netid, destnetid, schedule)
         # return redirect(url_for("matching.outgoing"))
         print("inside findabuddy POST")
         return ""
@@ -54,14 +63,15 @@ def findabuddy():
         sess_index = int(sess_index)
         session["index"] += 1
 
+    me = database.user.get_fields(netid, "open", "interestbits")
     open = "false"
-    if database.user.get_open(netid):
+    if me.open:
         open = "true"
     # get the users and index of current user that you have been matched with
     matches: List[str] = session.get("matches", None)
     index: int = session.get("index", None)
     if not matches or index >= len(matches):
-        session["matches"] = database.matchmaker.find_matches(netid)
+        session["matches"] = database.matchmaker.get_recommendations(netid)
         session["index"] = 0
         matches = session.get("matches", None)
         index = session.get("index", None)
@@ -79,10 +89,10 @@ def findabuddy():
 
     g.user = database.user.get_user(
         matches[index])  # can access this in jinja template with {{ g.user }}
-    # g.requests = database.request.get_active_incoming(netid)
+    # g.requests = database.inbox.get_active_incoming(netid)
     level = database.db.Level(g.user.level)
     level = level.to_readable()
-    interests = database.user.get_interests_string(netid)
+    interests = db.interests_to_readable(me.interestbits)
     # grab schedule
     context: Dict[str, Any] = {}
 
@@ -111,15 +121,16 @@ def buddies():
         sess_index = int(sess_index)
         session["index"] += 1
 
+    srcuser = database.user.get_user(netid)
     open = "false"
-    if database.user.get_open(netid):
+    if srcuser.open:
         open = "true"
 
     # get the users and index of current user that you have been matched with
     matches: List[str] = session.get("matches", None)
     index: int = session.get("index", None)
     if not matches or index >= len(matches):
-        session["matches"] = database.matchmaker.find_matches(netid)
+        session["matches"] = database.matchmaker.get_recommendations(netid)
         session["index"] = 0
         matches = session.get("matches", None)
         index = session.get("index", None)
@@ -134,19 +145,13 @@ def buddies():
 
     g.user = database.user.get_user(
         matches[index])  # can access this in jinja template with {{ g.user }}
-    # g.requests = database.request.get_active_incoming(netid)
+    # g.requests = database.inbox.get_active_incoming(netid)
     level = database.db.Level(g.user.level)
     level = level.to_readable()
-    interests = database.user.get_interests_string(netid)
+    interests = db.interests_to_readable(srcuser.interestbits)
 
-    destuserSchedule = g.user.schedule
-    srcuser = database.user.get_user(netid)
-    srcuserSchedule = srcuser.schedule
     # will hold combination of request and user schedule
-    combinedSchedule: List[int] = [db.ScheduleStatus.UNAVAILABLE] * db.NUM_WEEK_BLOCKS
-    for i in range(len(combinedSchedule)):
-        if srcuserSchedule[i] == destuserSchedule[i] == db.ScheduleStatus.AVAILABLE:
-            combinedSchedule[i] = db.ScheduleStatus.AVAILABLE
+    combinedSchedule = db.shared_schedule(srcuser.schedule, g.user.schedule).to_list()
 
     # grab schedule
     context: Dict[str, Any] = {}
@@ -176,6 +181,8 @@ def incoming():
 
 
 @bp.route("/incomingtable", methods=("GET", "POST"))
+@common.etag_decorator()
+@db.scoped_session_decorator()
 def incomingtable():
     """Table for incoming requests."""
 
@@ -193,40 +200,22 @@ def incomingtable():
             print(f"got this confirmed: {request.form.get('confirmed') = }; {request.form.get('confirmed') == 'true'}")
             database.request.finalize(requestid, ignore_overlap=request.form.get("confirmed") == "true")
             print("finalization finished at", datetime.now(timezone.utc))
-            # ADD SMS MESSAGING HERE
-            if sendsms.SEND_SMS:
-                srcnetid = database.request.get_srcnetid(requestid)
-                srcusername = database.user.get_name(srcnetid)
-                src_number = database.user.get_contact(srcnetid)
-                destnetid = database.request.get_destnetid(requestid)
-                destusername = database.user.get_name(destnetid)
-                dest_number = database.user.get_contact(destnetid)
-                if netid == destnetid and database.user.get_notification_status(srcnetid):
-                    result = sendsms.sendsms(
-                        "1" + src_number,
-                        sendsms.FINALIZE_REQUEST_MESSAGE.replace("$netid$", destnetid).replace("$username$", destusername))
-                    print(result)
-                elif netid == srcnetid and database.user.get_notification_status(destnetid):
-                    result = sendsms.sendsms(
-                        "1" + dest_number,
-                        sendsms.FINALIZE_REQUEST_MESSAGE.replace("$netid$", srcnetid).replace("$username$", destusername))
-                    print(result)
+            _notify_partner(netid, database.request.get_request(requestid),
+                            sendsms.FINALIZE_REQUEST_MESSAGE, "finalize")
         else:
             print(f"Action not found! {action = }")
 
-    elif common.needs_refresh(int(request.args.get("lastrefreshed", 0)), netid):
-        return ""
-
     # TODO: handle errors when database is not available
-    requests = database.request.get_active_incoming(netid)
+    requests = database.inbox.get_active_incoming(netid)
 
-    request_users: List[Any] = [database.user.get_user(req.srcnetid) for req in requests]
+    request_users: List[Any] = database.user.get_many(
+        [req.srcnetid for req in requests], columns=("name", "level", "interestbits"))
 
     levels = []
     interests = []
     for ruser in request_users:
         levels.append(db.Level(ruser.level).to_readable())
-        interests.append(db.interests_to_readable(ruser.interests))
+        interests.append(db.interests_to_readable(ruser.interestbits))
 
     return render_template("incomingtable.html",
                            netid=netid,
@@ -237,6 +226,7 @@ def incomingtable():
 
 
 @bp.route("/incomingmodal", methods=["GET", "POST"])
+@db.scoped_session_decorator()
 def incomingmodal():
     """Modal for incoming requests."""
     netid: str = session.get("netid", "")
@@ -251,53 +241,30 @@ def incomingmodal():
         schedule = common.json_to_schedule(request.form["jsoncalendar"])
 
         database.request.modify(requestid, schedule)
-        # ADD SMS MESSAGING HERE
-        if sendsms.SEND_SMS:
-            srcnetid = database.request.get_srcnetid(requestid)
-            srcusername = database.user.get_name(srcnetid)
-            src_number = database.user.get_contact(srcnetid)
-            destnetid = database.request.get_destnetid(requestid)
-            destusername = database.user.get_name(destnetid)
-            dest_number = database.user.get_contact(destnetid)
-            if netid == destnetid and database.user.get_notification_status(srcnetid):
-                result = sendsms.sendsms(
-                    "1" + src_number,
-                    sendsms.MODIFY_REQUEST_MESSAGE.replace("$netid$", destnetid).replace("$username$", destusername))
-                print(result)
-            elif netid == srcnetid and database.user.get_notification_status(destnetid):
-                result = sendsms.sendsms(
-                    "1" + dest_number,
-                    sendsms.MODIFY_REQUEST_MESSAGE.replace("$netid$", srcnetid).replace("$username$", srcusername))
-                print(result)
+        req = database.request.get_request(requestid)
+        _notify_partner(netid, database.request.get_active_pair(req.srcnetid, req.destnetid),
+                        sendsms.MODIFY_REQUEST_MESSAGE, "modify")
         # return redirect(url_for("matching.outgoing"))
         print("inside incomingmodal POST")
         return ""
 
     # TODO: handle errors when database is not available
-    # requests = database.request.get_active_incoming(netid)
+    # requests = database.inbox.get_active_incoming(netid)
     requestid = request.args.get("requestid", "0")
 
     req = database.request.get_request(int(requestid))
 
-    srcuser = database.user.get_user(req.srcnetid)
-    destuser = database.user.get_user(netid)
+    srcuser = database.user.get_user(req.srcnetid, validate=True)
+    destuser = database.user.get_user(netid, validate=True)
 
     # jsoncalendar = common.schedule_to_json(req.schedule)
     # requested schedule
-    requested = [0] * db.NUM_WEEK_BLOCKS
-    reqSchedule = req.schedule
-    destuserSchedule = destuser.schedule
-    srcuserSchedule = srcuser.schedule
+    requested = [int(s == db.ScheduleStatus.AVAILABLE) for s in req.schedule]
     # will hold combination of request and user schedule
-    combinedSchedule = [0] * db.NUM_WEEK_BLOCKS
-    for i in range(len(combinedSchedule)):
-        if srcuserSchedule[i] == destuserSchedule[i] == db.ScheduleStatus.AVAILABLE:
-            combinedSchedule[i] = db.ScheduleStatus.AVAILABLE
-        if reqSchedule[i] == db.ScheduleStatus.AVAILABLE:
-            requested[i] = 1
+    combinedSchedule = db.shared_schedule(srcuser.schedule, destuser.schedule).to_list()
 
     level = db.Level(srcuser.level).to_readable()
-    interests = db.interests_to_readable(srcuser.interests)
+    interests = db.interests_to_readable(srcuser.interestbits)
 
     print(f"returning card with info for request {requestid = }")
     jsoncalendar = common.schedule_to_jsonmodify(combinedSchedule, requested)
@@ -325,6 +292,8 @@ def outgoing():
 
 
 @bp.route("/outgoingtable", methods=["POST", "GET"])
+@common.etag_decorator()
+@db.scoped_session_decorator()
 def outgoingtable():
     """Page for viewing outgoing requests."""
     netid: str = session.get("netid", "")
@@ -340,13 +309,11 @@ def outgoingtable():
             database.request.reject(requestid)  # TODO: change to 'cancel'?
         else:
             print(f"Action not found! {action = }")
-    elif common.needs_refresh(int(request.args.get("lastrefreshed", 0)), netid):
-        return ""
 
     g.user = database.user.get_user(netid)  # can access this in jinja template with {{ g.user }}
-    requests = database.request.get_active_outgoing(netid)
+    requests = database.inbox.get_active_outgoing(netid)
 
-    users = [database.user.get_user(m.destnetid) for m in requests]
+    users = database.user.get_many([m.destnetid for m in requests], columns=("name",))
     length = len(requests)
 
     return render_template("outgoingtable.html",
@@ -369,6 +336,8 @@ def matched():
 
 
 @bp.route("/matchedtable", methods=("GET", "POST"))
+@common.etag_decorator()
+@db.scoped_session_decorator()
 def matchedtable():
     """Page for finding matched."""
     netid: str = session.get("netid", "")
@@ -381,33 +350,18 @@ def matchedtable():
 
         if action == "terminate":
             database.request.terminate(requestid)
-            # ADD SMS MESSAGING HERE
-            if sendsms.SEND_SMS:
-                destnetid = database.request.get_destnetid(requestid)
-                username = database.user.get_name(netid)
-                if destnetid != netid and database.user.get_notification_status(destnetid):
-                    number = database.user.get_contact(destnetid)
-                    success = sendsms.sendsms("1" + number, sendsms.MATCH_TERMINATE_MESSAGE.replace("$netid$", netid).replace("$username$", username))
-                    print(success)
-                else:
-                    srcnetid = database.request.get_srcnetid(requestid)
-                    if database.user.get_notification_status(srcnetid):
-                        number = database.user.get_contact(srcnetid)
-                        success = sendsms.sendsms("1" + number, sendsms.MATCH_TERMINATE_MESSAGE.replace("$netid$", netid).replace("$username$", username))
-
+            _notify_partner(netid, database.request.get_request(requestid),
+                            sendsms.MATCH_TERMINATE_MESSAGE, "terminate")
         else:
             print(f"Action not found! {action = }")
 
-    elif common.needs_refresh(int(request.args.get("lastrefreshed", 0)), netid):
-        return ""
-
     print("matchedtable refreshed!")
 
     g.user = database.user.get_user(netid)  # can access this in jinja template with {{ g.user }}
-    matches = database.request.get_matches(netid)
+    matches = database.inbox.get_matches(netid)
 
     users = [m.srcnetid if netid != m.srcnetid else m.destnetid for m in matches]
-    users = [database.user.get_user(u) for u in users]
+    users = database.user.get_many(users, columns=("name", "contact"))
     length = len(matches)
 
     return render_template("matchedtable.html",
@@ -437,35 +391,26 @@ def matchedmodal():
         return ""
 
     # TODO: handle errors when database is not available
-    # requests = database.request.get_active_incoming(netid)
+    # requests = database.inbox.get_active_incoming(netid)
     requestid = request.args.get("requestid", "0")
 
     req = database.request.get_request(int(requestid))
 
-    srcuser = database.user.get_user(req.srcnetid)
+    srcuser = database.user.get_user(req.srcnetid, validate=True)
     if srcuser.netid != netid:
         destuser = srcuser
-        srcuser = database.user.get_user(req.destnetid)
+        srcuser = database.user.get_user(req.destnetid, validate=True)
     else:
-        destuser = database.user.get_user(req.destnetid)
+        destuser = database.user.get_user(req.destnetid, validate=True)
 
     # jsoncalendar = common.schedule_to_json(req.schedule)
     # requested schedule
-    requested = [0] * db.NUM_WEEK_BLOCKS
-    reqSchedule = req.schedule
-    destuserSchedule = destuser.schedule
-    srcuserSchedule = srcuser.schedule
+    requested = [int(s == db.ScheduleStatus.AVAILABLE) for s in req.schedule]
     # will hold combination of request and user schedule
-    combinedSchedule = [0] * db.NUM_WEEK_BLOCKS
-    for i in range(len(combinedSchedule)):
-        if (srcuserSchedule[i] == db.ScheduleStatus.AVAILABLE and
-                destuserSchedule[i] == db.ScheduleStatus.AVAILABLE):
-            combinedSchedule[i] = db.ScheduleStatus.AVAILABLE
-        if reqSchedule[i] == db.ScheduleStatus.AVAILABLE:
-            requested[i] = 1
+    combinedSchedule = db.shared_schedule(srcuser.schedule, destuser.schedule).to_list()
 
     level = db.Level(srcuser.level).to_readable()
-    interests = db.interests_to_readable(srcuser.interests)
+    interests = db.interests_to_readable(srcuser.interestbits)
 
     print(f"returning card with info for match {requestid = }")
     jsoncalendar = common.schedule_to_jsonmodify(combinedSchedule, requested)
@@ -496,22 +441,21 @@ def unmatchmodal():
                            requestid = requestid)
 
 @bp.route("/historytable", methods=("GET", "POST"))
+@common.etag_decorator()
+@db.scoped_session_decorator()
 def historytable():
     """HTML for matches history table"""
     netid: str = session.get("netid", "")
     if not netid:
         raise NoLoginError
 
-    if common.needs_refresh(int(request.args.get("lastrefreshed", 0)), netid):
-        return ""
-
     print("historytable refreshed!")
 
     g.user = database.user.get_user(netid)  # can access this in jinja template with {{ g.user }}
-    matches = database.request.get_terminated(netid)
+    matches = database.inbox.get_terminated(netid)
     print("matches", matches)
     users = [m.srcnetid if netid != m.srcnetid else m.destnetid for m in matches]
-    users = [database.user.get_user(u) for u in users]
+    users = database.user.get_many(users, columns=("name", "contact"))
     length = len(matches)
 
     return render_template("historytable.html",
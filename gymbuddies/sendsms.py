@@ -1,9 +1,25 @@
-"""sends sms message. Makes sure that the number is valid"""
+"""Sends SMS notifications. Request handlers add messages to the SMS outbox with 'notify', in the
+same transaction as the change that they notify about. A dispatcher, normally run as the
+'dispatch-sms' command (or in the background of the app if the SMS_DISPATCHER environment variable
+is set to 1), claims messages from the outbox and sends them through a transport on a thread
+pool."""
 
 import os
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Protocol, Tuple
+
+import click
 from twilio.rest import Client
+from .database import outbox
 
 SEND_SMS = True
+DISPATCH_IN_APP = os.getenv("SMS_DISPATCHER", "0").lower() in ("1", "true", "yes")
+DISPATCH_WORKERS = 4  # number of messages sent concurrently
+DISPATCH_BATCH = 20  # maximum number of messages claimed at once
+DISPATCH_INTERVAL = 2.0  # seconds between polls of the outbox when it is empty
 
 NEW_REQUEST_MESSAGE = "Hello from Gymbuddies. You have received a new match request from $username$ ($netid$)!"
 
@@ -13,24 +29,154 @@ MODIFY_REQUEST_MESSAGE = "Hello from Gymbuddies. You have received an updated ma
 
 MATCH_TERMINATE_MESSAGE = "Hello from Gymbuddies. Your match with $username$ ($netid$) has been cancelled"
 
-def sendsms(number: str, message: str) -> bool:
-    """sends sms message. Makes sure that the number is valid"""
-    numberstr = "+" + number
-    print("got here 0")
-    if len(numberstr) != 12:
-        return False
-    print("got here 1")
-    if numberstr[1] != "1":
+
+def notify(destnetid: str, message: str, netid: str, username: str, dedupekey: str) -> bool:
+    """Adds 'message', filled in with the 'netid' and 'username' of the user who caused the
+    notification, to the SMS outbox for user 'destnetid'. Returns whether a message was added. Does
+    nothing if SEND_SMS is False."""
+    if not SEND_SMS:
         return False
-    print("got here 2")
-    try:
-        account_sid = os.environ['TWILIO_ACCOUNT_SID']
-        auth_token = os.environ['TWILIO_AUTH_TOKEN']
-        from_number = os.environ['TWILIO_SMS_NUMBER']
-        client = Client(account_sid, auth_token)
-        message = client.messages.create(body=message, from_=from_number, to=number)
-        print("got here 3")
+    body = message.replace("$netid$", netid).replace("$username$", username)
+    return outbox.enqueue(destnetid, body, dedupekey)
+
+
+class Transport(Protocol):
+    """Sends a single SMS message, raising an exception if it could not be sent."""
+
+    def send(self, number: str, body: str) -> None:
+        """Sends the message 'body' to the phone number 'number'."""
+        ...
+
+
+class TwilioTransport:
+    """Sends messages through Twilio, using the credentials in the TWILIO_ACCOUNT_SID,
+    TWILIO_AUTH_TOKEN and TWILIO_SMS_NUMBER environment variables. One client is created on first
+    use and shared by every thread."""
+
+    ENVIRONMENT = ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_SMS_NUMBER")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._from_number = ""
+
+    @classmethod
+    def configured(cls) -> bool:
+        """Returns whether the Twilio credentials are set in the environment."""
+        return all(os.getenv(name) for name in cls.ENVIRONMENT)
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = Client(os.environ["TWILIO_ACCOUNT_SID"],
+                                      os.environ["TWILIO_AUTH_TOKEN"])
+                self._from_number = os.environ["TWILIO_SMS_NUMBER"]
+            return self._client
+
+    def send(self, number: str, body: str) -> None:
+        """Sends the message 'body' to the phone number 'number' through Twilio."""
+        self._get_client().messages.create(body=body, from_=self._from_number, to=number)
+
+
+class FakeTransport:
+    """Records messages instead of sending them. Fails the first 'failures' sends, for testing
+    retries."""
+
+    def __init__(self, failures: int = 0):
+        self._lock = threading.Lock()
+        self.failures = failures
+        self.sent: List[Tuple[str, str]] = []
+
+    def send(self, number: str, body: str) -> None:
+        """Records the message 'body' to the phone number 'number', unless it should fail."""
+        with self._lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise RuntimeError("fake transport failure")
+            self.sent.append((number, body))
+
+
+class Dispatcher:
+    """Sends the messages in the SMS outbox through 'transport', with up to 'workers' messages in
+    flight at once."""
+
+    def __init__(self, transport: Transport, workers: int = DISPATCH_WORKERS):
+        self.transport = transport
+        self.workers = workers
+        self._stop = threading.Event()
+
+    def _send(self, messageid: int, number: str, body: str) -> bool:
+        """Sends a single message and records the result in the outbox."""
+        try:
+            self.transport.send(number, body)
+        except Exception as ex:
+            print(f"sendsms: failed to send message {messageid}: {ex}", file=sys.stderr)
+            outbox.mark_failed(messageid, repr(ex))
+            return False
+        outbox.mark_sent(messageid)
         return True
-    except Exception as ex:
-        print(ex)
-        return False
+
+    def dispatch(self, batch: int = DISPATCH_BATCH) -> int:
+        """Claims up to 'batch' due messages and sends them. Returns the number of messages sent."""
+        messages = outbox.claim(batch)
+        if not messages:
+            return 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(lambda m: self._send(m.messageid, m.number, m.body), messages)
+            return sum(results)
+
+    def run(self, interval: float = DISPATCH_INTERVAL) -> None:
+        """Dispatches messages until 'stop' is called, waiting 'interval' seconds whenever the
+        outbox has no due messages."""
+        while not self._stop.is_set():
+            try:
+                if self.dispatch():
+                    continue
+            except Exception as ex:
+                traceback.print_exception(ex, file=sys.stderr)
+            self._stop.wait(interval)
+
+    def stop(self) -> None:
+        """Stops 'run' after its current batch."""
+        self._stop.set()
+
+
+_DISPATCHER: Optional[Dispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def start_dispatcher(transport: Optional[Transport] = None) -> Optional[Dispatcher]:
+    """Starts the background dispatcher of this process, if it is not already running, and returns
+    it. Uses a TwilioTransport unless 'transport' is given. Does not start a dispatcher, and returns
+    None, if no transport is given and the Twilio credentials are not set, so that messages are
+    left in the outbox instead of failing."""
+    global _DISPATCHER
+    if transport is None and not TwilioTransport.configured():
+        print("sendsms: Twilio credentials not set; not starting the dispatcher", file=sys.stderr)
+        return None
+    with _dispatcher_lock:
+        if _DISPATCHER is None:
+            _DISPATCHER = Dispatcher(transport or TwilioTransport())
+            threading.Thread(target=_DISPATCHER.run, name="sms-dispatcher", daemon=True).start()
+        return _DISPATCHER
+
+
+@click.command("dispatch-sms")
+@click.option("--interval",
+              default=0.0,
+              help="Seconds to wait when the outbox is empty. Sends due messages once if 0.")
+def dispatch_sms_cmd(interval: float):
+    """Sends the due messages in the SMS outbox. With --interval, runs continuously as a background
+    worker."""
+    if not TwilioTransport.configured():
+        raise click.ClickException("Set " + ", ".join(TwilioTransport.ENVIRONMENT) +
+                                   " to send SMS messages.")
+    dispatcher = Dispatcher(TwilioTransport())
+    if interval > 0:
+        dispatcher.run(interval)
+        return
+
+    sent = 0
+    while (count := dispatcher.dispatch()):
+        sent += count
+    click.echo(f"Sent {sent} messages.")
@@ -2,7 +2,15 @@ let refreshid;
 let ajaxtimeout = 10000;
 let refreshinterval = 2000;
 
-let lastrefreshed = 0;
+// change events pushed by the server. Polling every refreshinterval is only
+// used if the browser or the server does not support them.
+let eventsurl = "/events";
+let eventsource = null;
+let eventsopened = false;
+let pendingrefresh = false;
+
+// ETag of the fragment last written to the page, by url
+let etags = {};
 let refreshing = false;
 let request = null;
 let getrequest = null;
@@ -21,26 +29,26 @@ function showError(jqXHR) {
     if (jqXHR.responseJSON.message !== undefined) message = jqXHR.responseJSON.message;
   }
   if (backdrop === "static") {
-    window.clearInterval(refreshid);
+    stop_refresh();
     console.log("clearing interval!");
   }
   $("#errorPopup").modal({"backdrop": backdrop});
   $("#errorPopupSpan").html(message);
   $("#errorPopup").modal("show");
-  lastrefreshed = 0;
+  etags = {};
 }
 
 function showBuddyError() {
   let backdrop = "static";
   let message = "Oops! Please toggle Match Availability in Profile to Open in order to enter Find a Buddy.";
   if (backdrop === "static") {
-    window.clearInterval(refreshid);
+    stop_refresh();
     console.log("clearing interval!");
   }
   $("#buddyErrorPopup").modal({"backdrop": backdrop});
   $("#buddyErrorPopupSpan").html(message);
   $("#buddyErrorPopup").modal("show");
-  lastrefreshed = 0;
+  etags = {};
 }
 
 function fillCard(response) {
@@ -95,10 +103,8 @@ function getunmatchCard(requestid, url) {
 
 // used as the 'success' property of an ajax request argument. Requires an
 // 'id' property to be provided to indicate where to write the response.
-function refresh(response, id, updatelastrefreshed) {
+function refresh(response, id) {
   if (response) {
-    if (updatelastrefreshed) lastrefreshed = Date.now();
-    console.log("refresh is", updatelastrefreshed);
     $(id).html(response);
     console.log("making an update now for", id, "at time", new Date(Date.now()));
   }
@@ -128,7 +134,7 @@ function act(url, id, requestid, action) {
     data: { "requestid": requestid, "action": action },
     url: url,
     success: function(response) { 
-      refresh(response, id, false); },
+      refresh(response, id); },
     complete: function() { postrequest = null; $("body").removeClass("wait"); },
     error: error,
     timeout: ajaxtimeout,
@@ -156,14 +162,18 @@ function act2(url, requestid) {
   });
 }
 
+// refreshes every fragment in 'url_ids', sending the ETag of the fragment on
+// the page so that unchanged fragments are answered with an empty 304.
 function refreshMultiple(url_ids) {
   const responses = [];
+  const newetags = [];
   let successes = 0;
   let completed = 0;
 
   console.log("url_id", url_ids)
   if (refreshing) {
     console.log("refresh detected!");
+    pendingrefresh = true;
     return;
   }
   refreshing = true;
@@ -174,17 +184,27 @@ function refreshMultiple(url_ids) {
     console.log("why is this happening???", $.ajax);
     getrequest = $.ajax({
       type: "GET",
-      data: { "lastrefreshed": lastrefreshed },
       url: url,
-      success: function(response) {
+      headers: etags[url] ? { "If-None-Match": etags[url] } : {},
+      success: function(response, textStatus, xhr) {
         responses[i] = response;
+        newetags[i] = xhr.getResponseHeader("ETag");
         if (++successes == url_ids.length) {
-          for (let j = 0; j < responses.length; j++)
-            refresh(responses[j], url_ids[j][1], j == responses.length - 1)
+          for (let j = 0; j < responses.length; j++) {
+            if (!responses[j]) continue;
+            refresh(responses[j], url_ids[j][1]);
+            etags[url_ids[j][0]] = newetags[j];
+          }
         }
       },
       complete: function() {
-        if (++completed == url_ids.length) refreshing = false;
+        if (++completed == url_ids.length) {
+          refreshing = false;
+          if (pendingrefresh) {
+            pendingrefresh = false;
+            refreshMultiple(url_ids);
+          }
+        }
       },
       error: error,
       timeout: ajaxtimeout,
@@ -193,13 +213,45 @@ function refreshMultiple(url_ids) {
 
 }
 
+function start_polling(url_ids) {
+  if (refreshid) return;
+  console.log("change events unavailable; polling instead");
+  refreshid = window.setInterval(refreshMultiple, refreshinterval, url_ids)
+}
+
+function stop_refresh() {
+  window.clearInterval(refreshid);
+  if (eventsource != null) {
+    eventsource.close();
+    eventsource = null;
+  }
+}
+
 function setup_refresh(url_ids) {
-  if (refreshid) {
+  if (refreshid || eventsource) {
     console.log("do not call me multiple times!");
     return;
   }
   refreshMultiple(url_ids);
-  refreshid = window.setInterval(refreshMultiple, refreshinterval, url_ids)
+  if (!window.EventSource) {
+    start_polling(url_ids);
+    return;
+  }
+
+  eventsource = new EventSource(eventsurl);
+  eventsource.addEventListener("changed", function() { refreshMultiple(url_ids); });
+  eventsource.onopen = function() {
+    // changes may have been missed while reconnecting
+    if (eventsopened) refreshMultiple(url_ids);
+    eventsopened = true;
+  };
+  eventsource.onerror = function() {
+    // the browser reconnects by itself unless the server refused the stream
+    if (eventsource.readyState == EventSource.CLOSED) {
+      eventsource = null;
+      start_polling(url_ids);
+    }
+  };
 }
 
 
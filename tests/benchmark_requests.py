@@ -0,0 +1,149 @@
+"""Benchmarks the request lifecycle queries with and without the indexes of the requests table.
+Generates a requests table in a scratch database, then prints the query plan and mean run time of
+each query issued by the request API, first with only the primary key and then with every index
+declared on db.Request. Should be run from the repository root, e.g.
+
+    python -m tests.benchmark_requests --requests 200000 --url postgresql://localhost/scratch
+
+WARNING: the requests table of the database at --url is dropped and recreated."""
+
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, List, Tuple
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+# pylint: disable=wrong-import-position
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from gymbuddies.database import db
+from gymbuddies.database import inbox
+from gymbuddies.database import request as requestmod
+
+REPETITIONS = 20  # number of times each query is timed
+
+# fraction of generated requests with each status; most requests are historical
+STATUS_WEIGHTS = {
+    db.RequestStatus.REJECTED: 0.45,
+    db.RequestStatus.TERMINATED: 0.45,
+    db.RequestStatus.PENDING: 0.05,
+    db.RequestStatus.FINALIZED: 0.05,
+}
+
+
+def generate(engine: Engine, num_requests: int, num_users: int) -> List[str]:
+    """Recreates the requests table of 'engine' without secondary indexes, and fills it with
+    'num_requests' random requests between 'num_users' users. Returns the netids of the users."""
+    table = db.Request.__table__
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+    for index in table.indexes:
+        index.drop(engine)
+
+    netids = [f"user{i:05}" for i in range(num_users)]
+    start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    statuses, weights = zip(*STATUS_WEIGHTS.items())
+    rows = []
+    for i in range(num_requests):
+        src, dest = random.sample(netids, 2)
+        status = random.choices(statuses, weights)[0]
+        made = start + timedelta(minutes=i)
+        active = status in (db.RequestStatus.PENDING, db.RequestStatus.FINALIZED)
+        finalized = status >= db.RequestStatus.FINALIZED
+        rows.append({
+            "srcnetid": src,
+            "destnetid": dest,
+            "maketimestamp": made,
+            "finalizedtimestamp": made + timedelta(hours=1) if finalized else None,
+            "deletetimestamp": None if active else made + timedelta(days=1),
+            "status": status,
+            "prevrequestid": 0,
+            "read": status != db.RequestStatus.PENDING or random.random() < 0.5,
+        })
+
+    with engine.begin() as conn:
+        for i in range(0, len(rows), 10000):
+            conn.execute(insert(table), rows[i:i + 10000])
+    return netids
+
+
+def queries(netid: str, other: str) -> List[Tuple[str, Callable[[Session], Any]]]:
+    """Returns the request API calls to benchmark for user 'netid', as (name, call) pairs."""
+    return [
+        ("get_active_outgoing", lambda s: inbox.get_active_outgoing(netid, session=s)),
+        ("get_inactive_incoming", lambda s: inbox.get_inactive_incoming(netid, session=s)),
+        ("get_terminated", lambda s: inbox.get_terminated(netid, session=s)),
+        ("get_matches", lambda s: inbox.get_matches(netid, session=s)),
+        ("get_unread", lambda s: inbox.get_unread(netid, session=s)),
+        ("get_active_single", lambda s: requestmod.get_active_single(netid, session=s)),
+        ("get_active_pair", lambda s: requestmod.get_active_pair(netid, other, session=s)),
+        ("get_active_partners", lambda s: requestmod.get_active_partners(netid, session=s)),
+    ]
+
+
+def explain(engine: Engine, statement: str, parameters: Any) -> List[str]:
+    """Returns the lines of the query plan of 'statement' with 'parameters'."""
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(prefix + statement, parameters).all()
+    return [str(row[-1]) for row in rows]
+
+
+def benchmark(engine: Engine, netid: str, other: str) -> None:
+    """Prints the query plans and mean run times of the request API calls for user 'netid'."""
+    statements: List[Tuple[str, Any]] = []
+
+    def record(_conn, _cursor, statement, parameters, *_):
+        statements.append((statement, parameters))
+
+    for name, call in queries(netid, other):
+        event.listen(engine, "before_cursor_execute", record)
+        with Session(engine) as session:
+            call(session)
+            session.rollback()
+        event.remove(engine, "before_cursor_execute", record)
+
+        start = time.perf_counter()
+        for _ in range(REPETITIONS):
+            with Session(engine) as session:
+                call(session)
+                session.rollback()
+        elapsed = (time.perf_counter() - start) / REPETITIONS
+
+        print(f"{name}: {elapsed * 1000:.2f} ms")
+        for statement, parameters in statements:
+            for line in explain(engine, statement, parameters):
+                print("    " + line)
+        statements.clear()
+
+
+def main():
+    """Generates the requests table and benchmarks it before and after creating its indexes."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--url", default="sqlite://", help="scratch database url")
+    parser.add_argument("--requests", type=int, default=100000, help="number of requests")
+    parser.add_argument("--users", type=int, default=2000, help="number of users")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    netids = generate(engine, args.requests, args.users)
+    netid, other = netids[0], netids[1]
+
+    print(f"=== before: primary key only ({args.requests} requests) ===")
+    benchmark(engine, netid, other)
+
+    for index in db.Request.__table__.indexes:
+        index.create(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+
+    print(f"=== after: {len(db.Request.__table__.indexes)} indexes ===")
+    benchmark(engine, netid, other)
+
+
+if __name__ == "__main__":
+    main()
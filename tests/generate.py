@@ -44,7 +44,6 @@ def users():
             "okfemale": True,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "ejcho": {
             "netid": "ejcho",
@@ -65,7 +64,6 @@ def users():
             "okfemale": True,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "jasono": {
             "netid": "jasono",
@@ -86,7 +84,6 @@ def users():
             "okfemale": True,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "eyc2": {
             "netid": "eyc2",
@@ -107,7 +104,6 @@ def users():
             "okfemale": True,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "jsnow": {
             "netid": "jsnow",
@@ -128,7 +124,6 @@ def users():
             "okfemale": False,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "dtargaryen": {
             "netid": "dtargaryen",
@@ -149,7 +144,6 @@ def users():
             "okfemale": True,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "tlannister": {
             "netid": "tlannister",
@@ -170,7 +164,6 @@ def users():
             "okfemale": True,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "tgreyjoy": {
             "netid": "tgreyjoy",
@@ -191,7 +184,6 @@ def users():
             "okfemale": False,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "astark": {
             "netid": "astark",
@@ -212,7 +204,6 @@ def users():
             "okfemale": False,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "mtyrell": {
             "netid": "mtyrell",
@@ -233,7 +224,6 @@ def users():
             "okfemale": True,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "jbaratheon": {
             "netid": "jbaratheon",
@@ -254,7 +244,6 @@ def users():
             "okfemale": False,
             "okbinary": False,
             "settings": {},
-            "blocked": [],
         },
         "rstark": {
             "netid": "rstark",
@@ -275,7 +264,6 @@ def users():
             "okfemale": True,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "pbaelish": {
             "netid": "pbaelish",
@@ -296,7 +284,6 @@ def users():
             "okfemale": True,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "sstark": {
             "netid": "sstark",
@@ -317,7 +304,6 @@ def users():
             "okfemale": True,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "clannister": {
             "netid": "clannister",
@@ -338,7 +324,6 @@ def users():
             "okfemale": True,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "ltyrell": {
             "netid": "ltyrell",
@@ -359,7 +344,6 @@ def users():
             "okfemale": False,
             "okbinary": True,
             "settings": {},
-            "blocked": [],
         },
         "sbaratheon": {
             "netid": "sbaratheon",
@@ -380,13 +364,13 @@ def users():
             "okfemale": False,
             "okbinary": False,
             "settings": {},
-            "blocked": [],
         },
     }
     for datum in data.values():
         a = sorted(datum.keys())
         b = sorted(db.User.__table__.columns.keys())
         b.remove("lastupdated")
+        b.remove("interestbits")
         assert a == b, f"Missing columns: {a} vs {b}"
 
     for user in data.values():
@@ -1,6 +1,12 @@
 """Tests database initialization."""
+import pickle
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+import flask
+import numpy as np
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
 
 from gymbuddies.database import db
 from gymbuddies import database
@@ -31,5 +37,193 @@ def main():
     session.commit()
 
 
+class TestScheduleBitmap(unittest.TestCase):
+    """Tests the packed ScheduleBitmap representation of schedules."""
+
+    def test_conversion(self):
+        """Tests conversion to and from legacy schedule lists and bytes."""
+        schedule = [random.randint(0, db.ALL_SCHEDULE_FLAGS) for _ in range(db.NUM_WEEK_BLOCKS)]
+        bitmap = db.ScheduleBitmap.from_list(schedule)
+
+        self.assertEqual(bitmap.to_list(), schedule)
+        self.assertEqual(list(bitmap), schedule)
+        self.assertEqual(bitmap, schedule)
+        self.assertEqual(db.ScheduleBitmap.from_bytes(bitmap.to_bytes()), bitmap)
+        self.assertEqual(len(bitmap.to_bytes()), db.SCHEDULE_BYTES)
+        self.assertEqual(pickle.loads(pickle.dumps(bitmap)), bitmap)
+        self.assertTrue(all(bitmap[t] == s for t, s in enumerate(schedule)))
+
+    def test_operations(self):
+        """Tests set operations, counts, and overlap checks."""
+        a = [db.ScheduleStatus.UNAVAILABLE] * db.NUM_WEEK_BLOCKS
+        b = [db.ScheduleStatus.UNAVAILABLE] * db.NUM_WEEK_BLOCKS
+        a[10] = a[11] = db.ScheduleStatus.AVAILABLE
+        b[11] = db.ScheduleStatus.AVAILABLE | db.ScheduleStatus.MATCHED
+        b[12] = db.ScheduleStatus.PENDING
+
+        x, y = db.ScheduleBitmap.from_list(a), db.ScheduleBitmap.from_list(b)
+        self.assertTrue(x.overlaps(y))
+        self.assertFalse(x.overlaps(y, db.ScheduleStatus.MATCHED))
+        self.assertEqual((x & y).plane(), 1 << 11)
+        self.assertEqual((x | y).popcount(), 3)
+        self.assertEqual(y.popcount(db.ScheduleStatus.AVAILABLE), 1)
+        self.assertEqual(x.free(), (1 << 10) | (1 << 11))
+        self.assertEqual(y.free(), 0)
+
+        x.add_status(1 << 10, db.ScheduleStatus.MATCHED)
+        self.assertEqual(x[10], db.ScheduleStatus.AVAILABLE | db.ScheduleStatus.MATCHED)
+        x.remove_status(db.WEEK_MASK, db.ScheduleStatus.AVAILABLE)
+        self.assertEqual(x.plane(), 1 << 10)
+        x[-1] = db.ScheduleStatus.PENDING
+        self.assertEqual(x[db.NUM_WEEK_BLOCKS - 1], db.ScheduleStatus.PENDING)
+
+    def test_overlap_hours(self):
+        """Tests full-hour overlap counting against a blockwise comparison."""
+        available = db.ScheduleStatus.AVAILABLE
+        for _ in range(20):
+            x = [available if random.random() < .98 else random.choice(list(db.ScheduleStatus))
+                 for _ in range(db.NUM_WEEK_BLOCKS)]
+            y = [available if random.random() < .98 else 0 for _ in range(db.NUM_WEEK_BLOCKS)]
+            hours = sum(
+                all(x[t] == y[t] == available for t in range(h, h + db.NUM_HOUR_BLOCKS))
+                for h in range(0, db.NUM_WEEK_BLOCKS, db.NUM_HOUR_BLOCKS))
+
+            self.assertEqual(db.overlap_hours(x, y), hours)
+            self.assertEqual(db.overlap_hours_batch(x, [y, x]),
+                             [hours, db.overlap_hours(x, x)])
+            self.assertEqual(db.overlap_schedule(x, y).popcount(), hours * db.NUM_HOUR_BLOCKS)
+            self.assertEqual(db.shared_schedule(x, y).to_list(),
+                             [available if x[t] == y[t] == available else 0
+                              for t in range(db.NUM_WEEK_BLOCKS)])
+
+
+class TestTimestampType(unittest.TestCase):
+    """Tests the timestamp column type."""
+
+    def test_round_trip(self):
+        """Tests that timestamps are stored in UTC and loaded as timezone-aware datetimes."""
+        column = db.TimestampType()
+        dialect = db.engine.dialect
+        aware = datetime(2022, 11, 1, 12, 30, 15, 250, tzinfo=timezone(timedelta(hours=-5)))
+        naive = datetime(2022, 11, 1, 17, 30, 15, 250)
+
+        for value in (aware, naive):
+            loaded = column.process_result_value(column.process_bind_param(value, dialect), dialect)
+            self.assertEqual(loaded, aware)
+            self.assertEqual(loaded.tzinfo, timezone.utc)
+        self.assertIsNone(column.process_bind_param(None, dialect))
+
+
+class TestInterests(unittest.TestCase):
+    """Tests the interests bitmask encoding."""
+
+    def test_similarity(self):
+        """Tests conversions between interests dictionaries and bitmasks, and their similarity."""
+        interests = db.get_interests_dict(upper=True, gaining=True)
+        bits = db.interests_to_bits(interests | {"Unknown": True})
+        self.assertEqual(bits, db.INTEREST_BITS["Upper Body"] | db.INTEREST_BITS["Gaining Mass"])
+        self.assertEqual(db.bits_to_interests(bits), interests)
+        self.assertEqual(db.interests_to_readable(bits), db.interests_to_readable(interests))
+
+        other = db.interests_to_bits(db.get_interests_dict(upper=True, lower=True))
+        self.assertAlmostEqual(db.interest_similarity(bits, other), 1 / 3)
+        self.assertAlmostEqual(db.interest_similarity(bits, bits), 1)
+        self.assertAlmostEqual(db.interest_similarity(0, 0), 0)
+        self.assertEqual(
+            list(database.matchmaker.interest_similarity_batch(bits, np.array([other, bits, 0],
+                                                                              dtype=np.uint64))),
+            [db.interest_similarity(bits, b) for b in (other, bits, 0)])
+
+
+class TestSessionDecorators(unittest.TestCase):
+    """Tests the session decorators."""
+
+    def test_read_engine(self):
+        """Tests that only committing functions use the serializable engine."""
+
+        def bind(*, session=None):
+            return session.get_bind()
+
+        self.assertIs(db.session_decorator(commit=False)(bind)(), db.read_engine)
+        self.assertIs(db.session_decorator(commit=True)(bind)(), db.engine)
+
+    def test_unit_of_work(self):
+        """Tests that a scoped route commits once, or not at all if it raises."""
+        netid = "scoped" + str(random.randrange(10**9))
+        commits = []
+
+        def count(*_):
+            commits.append(None)
+
+        @db.scoped_session_decorator()
+        def route(fail: bool):
+            database.user.create(netid)
+            database.user.update(netid, name="scoped")
+            if fail:
+                raise RuntimeError
+            return database.user.get_name(netid)
+
+        event.listen(db.engine, "commit", count)
+        try:
+            with flask.Flask(__name__).app_context():
+                with self.assertRaises(RuntimeError):
+                    route(True)
+                self.assertFalse(database.user.exists(netid))
+                self.assertEqual(route(False), "scoped")
+        finally:
+            event.remove(db.engine, "commit", count)
+
+        self.assertEqual(len(commits), 1)
+        self.assertTrue(database.user.exists(netid))
+        database.user.delete(netid)
+
+
+class TestPool(unittest.TestCase):
+    """Tests connection pool metrics."""
+
+    def test_metered_pool(self):
+        """Tests that checkouts, overflows and timeouts are counted."""
+        engine = create_engine("sqlite://",
+                               poolclass=database.pool.MeteredQueuePool,
+                               pool_size=1,
+                               max_overflow=1,
+                               pool_timeout=.01)
+        first, second = engine.connect(), engine.connect()
+        with self.assertRaises(exc.TimeoutError):
+            engine.connect()
+        first.close()
+        second.close()
+
+        stats = database.pool.get_stats(engine.pool)
+        self.assertEqual((stats["checkouts"], stats["overflows"], stats["timeouts"]), (2, 1, 1))
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertGreaterEqual(stats["wait_max"], .01)
+
+
+class TestBroker(unittest.TestCase):
+    """Tests the user change event broker."""
+
+    def test_publish(self):
+        """Tests that committed user updates reach subscribers of that user only."""
+        netid, other = "testbroker", "testbroker2"
+        for n in (netid, other):
+            if database.user.exists(n):
+                database.user.delete(n)
+            database.user.create(n)
+
+        broker = database.broker.broker
+        with broker.subscribe((netid,)) as subscription:
+            database.user.update(other, bio="other")
+            self.assertIsNone(subscription.get(timeout=.01))
+            database.user.update(netid, bio="mine")
+            self.assertEqual(subscription.get(timeout=1), netid)
+            for _ in range(database.broker.SUBSCRIBER_BACKLOG + 1):
+                broker.publish(netid)
+        self.assertEqual(broker.subscribers(), 0)
+
+        for n in (netid, other):
+            database.user.delete(n)
+
+
 if __name__ == "__main__":
     main()
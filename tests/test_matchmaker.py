@@ -0,0 +1,181 @@
+"""Tests matchmaking functions."""
+import string
+import types
+import unittest
+from unittest import mock
+from sqlalchemy import event
+from gymbuddies import database
+from gymbuddies.database import db, matchmaker
+from . import generate
+
+
+def unsampled():
+    """Returns a patch of the matchmaker's sample sizes above the number of users in the database,
+    so that find_matches considers and returns every candidate."""
+    population = len(database.user.get_users())
+    return mock.patch.multiple(matchmaker, RANDOM_NUMBER=population, RETURN_NUMBER=population)
+
+
+def candidate(netid, **kwargs):
+    """Returns a stand-in for a user row with a default profile, overridden by 'kwargs'."""
+    profile = {
+        "netid": netid,
+        "level": db.Level.BEGINNER,
+        "levelpreference": db.LevelPreference.ALL,
+        "gender": db.Gender.NONBINARY,
+        "open": True,
+        "okmale": True,
+        "okfemale": True,
+        "okbinary": True,
+        "interests": {},
+        "schedule": generate.schedule_from_dayhours((0, 6)),
+    }
+    profile |= kwargs
+    return types.SimpleNamespace(**profile, interestbits=db.interests_to_bits(profile["interests"]))
+
+
+class TestMatchmaker(unittest.TestCase):
+    """Tests the matchmaking algorithm."""
+
+    def test_scores(self):
+        """Tests the hard filters and weights of the batch scoring engine."""
+        main = candidate("main",
+                         gender=db.Gender.MALE,
+                         okfemale=False,
+                         interests={"Upper Body": True},
+                         schedule=generate.schedule_from_dayhours((0, 6), (1, 7)))
+        users = [
+            candidate("both", interests={"Upper Body": True},
+                      schedule=generate.schedule_from_dayhours((0, 6), (1, 7))),
+            candidate("one"),
+            candidate("closed", open=False),
+            candidate("female", gender=db.Gender.FEMALE),
+            candidate("nomale", okmale=False),
+            candidate("nohours", schedule=generate.schedule_from_dayhours((2, 6))),
+        ]
+        candidates = matchmaker.CandidateArrays(users)
+        scores = matchmaker.score_candidates(main, candidates)
+
+        hour = db.NUM_HOUR_BLOCKS / db.NUM_WEEK_BLOCKS
+        self.assertAlmostEqual(scores[0], 2 * matchmaker.LEVEL_WEIGHT +
+                               matchmaker.INTERESTS_WEIGHT + 2 * hour)
+        self.assertAlmostEqual(scores[1], 2 * matchmaker.LEVEL_WEIGHT + hour)
+        self.assertTrue(all(s == float("-inf") for s in scores[2:]))
+
+        scores = matchmaker.score_candidates(main, candidates, level_weight=0, schedule_weight=0)
+        self.assertAlmostEqual(scores[0], matchmaker.INTERESTS_WEIGHT)
+        self.assertAlmostEqual(scores[1], 0)
+
+    def test_availability_index(self):
+        """Tests overlap queries on the availability index across updates."""
+        index = database.availability.AvailabilityIndex()
+        index.load([("a", generate.schedule_from_dayhours((0, 6))),
+                    ("b", generate.schedule_from_dayhours((0, 6), (1, 7))),
+                    ("c", generate.schedule_from_dayhours((2, 8)))])
+        mine = database.availability.free_hours(generate.schedule_from_dayhours((0, 6), (1, 7)))
+        self.assertEqual(index.overlapping(mine), {"a", "b"})
+
+        index.update("a", generate.schedule_from_dayhours((2, 8)))
+        index.update("d", generate.schedule_from_dayhours((1, 7)))
+        self.assertEqual(index.overlapping(mine), {"b", "d"})
+        index.remove("b")
+        self.assertEqual(index.overlapping(mine), {"d"})
+
+        # changes made during a reload are kept, even if the reload read the users table earlier
+        self.assertTrue(index.start_reload())
+        self.assertFalse(index.start_reload())
+        index.update("e", generate.schedule_from_dayhours((0, 6)))
+        index.remove("d")
+        index.load([("c", generate.schedule_from_dayhours((0, 6))),
+                    ("d", generate.schedule_from_dayhours((1, 7)))])
+        self.assertEqual(index.overlapping(mine), {"c", "e"})
+        self.assertTrue(index.start_reload())
+
+        # a partially available hour is not a free hour
+        partial = generate.schedule_from_dayhours((0, 6))
+        start = db.TimeBlock.from_daytime(0, 6 * db.NUM_HOUR_BLOCKS)
+        partial[start] = db.ScheduleStatus.UNAVAILABLE
+        self.assertEqual(database.availability.free_hours(partial), 0)
+
+    def test_queries(self):
+        """Tests that find_matches uses a constant number of queries, independent of the number of
+        candidates, and filters out users with active requests."""
+        netids = [generate.unistr(source=string.ascii_lowercase) for _ in range(6)]
+        for netid in netids:
+            if database.user.exists(netid):
+                database.user.delete(netid)
+            database.user.create(netid,
+                                 open=True,
+                                 okmale=True,
+                                 okfemale=True,
+                                 okbinary=True,
+                                 schedule=generate.schedule_from_dayhours((0, 6)))
+        database.request.new(netids[0], netids[1], generate.schedule_from_dayhours((0, 6)))
+
+        database.matchmaker.find_matches(netids[0])  # load the availability index
+        statements = []
+
+        def count(*_):
+            statements.append(None)
+
+        with unsampled():
+            event.listen(db.engine, "before_cursor_execute", count)
+            try:
+                matches = database.matchmaker.find_matches(netids[0])
+            finally:
+                event.remove(db.engine, "before_cursor_execute", count)
+
+        # main user, exclusions, candidate count, candidate window, and its wrap-around
+        self.assertLessEqual(len(statements), 5)
+        self.assertNotIn(netids[0], matches)
+        self.assertNotIn(netids[1], matches)
+        self.assertTrue(set(netids[2:]) <= set(matches))
+
+        for netid in netids:
+            database.request.delete_all(netid)
+            database.user.delete(netid)
+
+    def test_recommendations(self):
+        """Tests that stored recommendations are reused until the user is updated or they expire,
+        and that matches which no longer pass the hard filters are not served."""
+        netids = [generate.unistr(source=string.ascii_lowercase) for _ in range(4)]
+        for netid in netids:
+            if database.user.exists(netid):
+                database.user.delete(netid)
+            database.user.create(netid, schedule=generate.schedule_from_dayhours((0, 6)))
+
+        with unsampled(), mock.patch.object(matchmaker, "schedule_refresh") as schedule_refresh:
+            # missing recommendations are computed in the background, not by the caller
+            self.assertEqual(database.matchmaker.get_recommendations(netids[0]), [])
+            schedule_refresh.assert_called_once_with(netids[0])
+            schedule_refresh.reset_mock()
+
+            matches = database.matchmaker.refresh_recommendations(netids[0])
+            self.assertTrue(set(netids[1:]) <= set(matches))
+            self.assertEqual(database.matchmaker.get_recommendations(netids[0]), matches)
+            self.assertNotIn(netids[0], database.matchmaker.get_stale_recommendations())
+
+            database.user.update(netids[3], open=False)
+            self.assertNotIn(netids[0], database.matchmaker.get_stale_recommendations())
+            self.assertNotIn(netids[3], database.matchmaker.get_recommendations(netids[0]))
+
+            database.block.block_user(netids[0], netids[1])
+            self.assertIn(netids[0], database.matchmaker.get_stale_recommendations())
+            self.assertGreaterEqual(database.matchmaker.refresh_stale_recommendations(), 1)
+            self.assertNotIn(netids[0], database.matchmaker.get_stale_recommendations())
+            self.assertNotIn(netids[1], database.matchmaker.get_recommendations(netids[0]))
+            self.assertEqual(database.block.get_blockers(netids[1]), [netids[0]])
+            self.assertNotIn(netids[0], database.matchmaker.get_recommendations(netids[1]))
+            schedule_refresh.assert_not_called()
+
+            with mock.patch.object(matchmaker, "RECOMMENDATION_TTL", 0):
+                self.assertIn(netids[0], database.matchmaker.get_stale_recommendations())
+                self.assertNotIn(netids[1], database.matchmaker.get_recommendations(netids[0]))
+                schedule_refresh.assert_called_with(netids[0])
+
+        for netid in netids:
+            database.user.delete(netid)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Tests the SMS outbox API functions and dispatcher."""
+import string
+import unittest
+from gymbuddies import database, sendsms
+from gymbuddies.database import db
+from . import generate
+
+
+class TestOutbox(unittest.TestCase):
+    """Tests API functions for the SMS outbox"""
+
+    def setUp(self):
+        self.netid = generate.unistr(source=string.ascii_lowercase)
+        if database.user.exists(self.netid):
+            database.user.delete(self.netid)
+        database.user.create(self.netid, contact="6095551234")
+        database.outbox.recieve_notification_on(self.netid)
+
+    def tearDown(self):
+        database.user.delete(self.netid)
+
+    def test_enqueue(self):
+        """Tests that messages are only added for users with notifications on, at most once."""
+        self.assertTrue(database.outbox.enqueue(self.netid, "hello", f"test:{self.netid}"))
+        self.assertFalse(database.outbox.enqueue(self.netid, "hello", f"test:{self.netid}"))
+        database.outbox.recieve_notification_off(self.netid)
+        self.assertFalse(database.outbox.enqueue(self.netid, "hello", f"test2:{self.netid}"))
+
+        messages = database.outbox.get_messages(self.netid)
+        self.assertEqual([(m.number, m.body) for m in messages], [("+16095551234", "hello")])
+        self.assertEqual(messages[0].status, db.OutboxStatus.PENDING)
+
+    def test_dispatch(self):
+        """Tests that failed messages are retried after a backoff, and that sent messages are not
+        sent again."""
+        database.outbox.enqueue(self.netid, "hello", f"test:{self.netid}")
+        transport = sendsms.FakeTransport(failures=1)
+        dispatcher = sendsms.Dispatcher(transport)
+
+        self.assertEqual(dispatcher.dispatch(), 0)
+        message = database.outbox.get_messages(self.netid)[0]
+        self.assertEqual((message.status, message.attempts), (db.OutboxStatus.PENDING, 1))
+        self.assertEqual(dispatcher.dispatch(), 0)  # not due until the backoff has passed
+
+        backoff, database.outbox.BACKOFF_BASE = database.outbox.BACKOFF_BASE, 0
+        try:
+            database.outbox.mark_failed(message.messageid, "error")
+            self.assertEqual(dispatcher.dispatch(), 1)
+            self.assertEqual(dispatcher.dispatch(), 0)
+            self.assertEqual(transport.sent, [("+16095551234", "hello")])
+
+            database.outbox.enqueue(self.netid, "again", f"test2:{self.netid}")
+            transport.failures = database.outbox.MAX_ATTEMPTS
+            for _ in range(database.outbox.MAX_ATTEMPTS + 1):
+                dispatcher.dispatch()
+        finally:
+            database.outbox.BACKOFF_BASE = backoff
+        message = database.outbox.get_messages(self.netid)[1]
+        self.assertEqual(message.status, db.OutboxStatus.FAILED)
+        self.assertEqual(len(transport.sent), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
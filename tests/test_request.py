@@ -0,0 +1,55 @@
+"""Tests requests table API functions."""
+import string
+import unittest
+from gymbuddies import database
+from gymbuddies.database import db
+from . import generate
+
+
+class TestRequest(unittest.TestCase):
+    """Tests API functions for the requests database"""
+
+    def setUp(self):
+        self.netids = [generate.unistr(source=string.ascii_lowercase) for _ in range(3)]
+        for netid in self.netids:
+            if database.user.exists(netid):
+                database.user.delete(netid)
+            database.user.create(netid, schedule=generate.schedule_from_dayhours((0, 6), (1, 7)))
+
+    def tearDown(self):
+        for netid in self.netids:
+            database.user.delete(netid)
+
+    def matched(self, netid):
+        """Returns the MATCHED plane of the schedule of user 'netid'."""
+        return db.as_bitmap(database.user.get_schedule(netid)).plane(db.ScheduleStatus.MATCHED)
+
+    def test_finalize(self):
+        """Tests that finalizing a request deactivates the requests that conflict with it, and
+        marks its blocks as MATCHED for both users."""
+        a, b, c = self.netids
+        first = generate.schedule_from_dayhours((0, 6))
+        both = generate.schedule_from_dayhours((0, 6), (1, 7))
+        first_bits = db.as_bitmap(first).plane()
+
+        database.request.new(a, b, first)
+        database.request.new(c, a, first)
+        requestid = database.request.get_active_pair(a, b).requestid
+        self.assertEqual(database.conflicts.get_conflicts(requestid), [(c, a)])
+        with self.assertRaises(database.request.OverlapRequests):
+            database.request.finalize(requestid)
+
+        database.request.finalize(requestid, ignore_overlap=True)
+        self.assertIsNone(database.request.get_active_pair(a, c))
+        self.assertEqual((self.matched(a), self.matched(b), self.matched(c)),
+                         (first_bits, first_bits, 0))
+
+        database.request.new(c, a, generate.schedule_from_dayhours((1, 7)))
+        requestid = database.request.get_active_pair(a, c).requestid
+        self.assertEqual(database.conflicts.get_conflicts(requestid), [])
+        database.request.finalize(requestid)
+        self.assertEqual(self.matched(a), db.as_bitmap(both).plane())
+
+
+if __name__ == "__main__":
+    unittest.main()
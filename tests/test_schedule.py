@@ -1,4 +1,5 @@
 """Tests users table API functions."""
+import string
 import unittest
 from gymbuddies import database
 from gymbuddies.database import db
@@ -53,6 +54,29 @@ class TestSchedule(unittest.TestCase):
             if col == "netid":
                 continue
             b = getattr(database.user, "get_" + col)(netid)
+
+    def test_incremental(self):
+        """Tests that the schedule intervals follow the user schedule across partial updates."""
+        netid = generate.unistr(source=string.ascii_lowercase)
+        if database.user.exists(netid):
+            database.user.delete(netid)
+        database.user.create(netid)
+
+        schedule = generate.schedule_from_dayhours((0, 6), (1, 7))
+        database.schedule.update_schedule(netid, schedule)
+        self.assertEqual(database.schedule.get_available_schedule(netid), schedule)
+
+        schedule = generate.schedule_from_dayhours((0, 6), (2, 8))
+        database.schedule.add_schedule_status(netid, generate.schedule_from_dayhours((0, 6)),
+                                              db.ScheduleStatus.MATCHED)
+        database.user.update(netid, schedule=schedule)
+        matched = generate.schedule_from_dayhours((0, 6))
+        self.assertEqual(database.schedule.get_available_schedule(netid), schedule)
+        self.assertEqual(database.schedule.get_matched_schedule(netid),
+                         [db.ScheduleStatus.MATCHED if m else 0 for m in matched])
+
+        database.user.delete(netid)
+
     # TODO: schedule consistency
     # TODO: error checking
 
@@ -54,6 +54,57 @@ class TestUser(unittest.TestCase):
         database.user.delete(netid)
         self.assertIsNone(database.user.delete(netid))
 
+    def test_cache(self):
+        """Tests that user snapshots are cached, immutable, and invalidated by updates."""
+        netid = generate.unistr(source=string.ascii_lowercase)
+        if database.user.exists(netid):
+            database.user.delete(netid)
+        database.user.create(netid, name="before")
+
+        user = database.user.get_user(netid)
+        self.assertIs(database.user.get_user(netid), user)
+        self.assertIs(database.user.get_user(netid, validate=True), user)
+        with self.assertRaises(AttributeError):
+            user.name = "after"
+        with self.assertRaises(TypeError):
+            user.settings["notifications"] = True  # type: ignore
+        user.schedule[0] = db.ScheduleStatus.MATCHED
+        self.assertEqual(database.user.get_user(netid).schedule[0], db.ScheduleStatus.UNAVAILABLE)
+
+        version = database.user.get_version(netid)
+        self.assertEqual(version, database.user.get_lastupdated(netid))
+        database.user.update(netid, name="after")
+        self.assertEqual(database.user.get_user(netid).name, "after")
+        self.assertGreater(database.user.get_version(netid), version)
+        database.outbox.recieve_notification_on(netid)
+        self.assertTrue(database.user.get_user(netid).settings["notifications"])
+
+        database.user.delete(netid)
+        with self.assertRaises(database.user.UserNotFound):
+            database.user.get_user(netid)
+
+    def test_get_many(self):
+        """Tests batch lookups of users and of selected columns."""
+        netids = [generate.unistr(source=string.ascii_lowercase) for _ in range(3)]
+        for netid in netids:
+            if database.user.exists(netid):
+                database.user.delete(netid)
+            database.user.create(netid, name=netid.upper())
+
+        order = [netids[2], netids[0], netids[2]]
+        users = database.user.get_many(order)
+        self.assertEqual([u.netid for u in users], order)
+        rows = database.user.get_many(order, columns=("name",))
+        self.assertEqual([(r.netid, r.name) for r in rows], [(n, n.upper()) for n in order])
+        self.assertEqual(database.user.get_many([]), [])
+        fields = database.user.get_fields(netids[0], "name", "netid")
+        self.assertEqual((fields.name, fields.netid), (netids[0].upper(), netids[0]))
+
+        database.user.delete(netids[1])
+        with self.assertRaises(database.user.UserNotFound):
+            database.user.get_many(netids)
+        for netid in (netids[0], netids[2]):
+            database.user.delete(netid)
 
 
 if __name__ == "__main__":